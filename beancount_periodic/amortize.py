@@ -1,64 +1,213 @@
+from typing import Iterator, Optional
+
 from beancount.core import data, account, account_types
 from beancount.parser import options
 
+from . import stats
+from .common.cache import open_schedule_cache
 from .common.config import PluginConfig
-from .common.utils import build_steps
+from .common.identity import get_id_prefix
+from .common.identity import get_source_key
+from .common.identity import get_source_keys
+from .common.index import CandidateIndex
+from .common.manifest import Schedule
+from .common.manifest import create_schedule_entries
+from .common.materialize import is_materialized
+from .common.parallel import expand_parallel
+from .common.parallel import get_worker_context
+from .common.parallel import use_parallel
 from .common.utils import create_meta
+from .common.utils import iter_steps
+from .common.utils import merge_entries
+from .common.utils import merge_steps
 from .common.utils import select_periodic_posting_groups
+from .stats import NULL_STATS
 
 __plugins__ = ('amortize',)
 
 
 def amortize(entries: data.Entries, unused_options_map, config_string=""):
     plugin_config = PluginConfig.from_string(config_string)
+    account_types_option = options.get_account_types(unused_options_map)
+    with stats.profile('amortize', plugin_config) as plugin_stats:
+        return amortize_entries(entries, account_types_option, plugin_config, plugin_stats,
+                                unused_options_map.get('filename'))
+
+
+def get_amortization_account(account_types_option, posting_account: data.Account) -> Optional[str]:
+    """
+    The account holding the amortized amount of the posting account
+    :param account_types_option:
+    :param posting_account:
+    :return: the account under Equity, or None if the posting account is neither an expenses nor an income one
+    """
+    if account_types.is_account_type(account_types_option.expenses, posting_account):
+        return str.join(account.sep, [account_types_option.equity, 'Amortization', account.sans_root(posting_account)])
+    elif account_types.is_account_type(account_types_option.income, posting_account):
+        return str.join(account.sep, [account_types_option.equity, 'Received', account.sans_root(posting_account)])
+    return None
+
+
+def amortize_entries(entries: data.Entries, account_types_option, plugin_config: PluginConfig,
+                     plugin_stats=NULL_STATS, scope=None, materialized=None, index=None):
+    """
+    :param materialized: fingerprints of the materialized sources, read from the entries if None
+    :param index: the CandidateIndex of the entries, built by scanning them if None; updated with the changes
+    """
     new_entries = []
     errors = []
-    account_types_option = options.get_account_types(unused_options_map)
-    for entry in entries:
-        if isinstance(entry, data.Transaction):
-            selected_postings_groups = select_periodic_posting_groups(entry, 'amortize', errors)
-            postings_to_insert_original_entry = []
-            for selected_postings in selected_postings_groups:
-                new_postings_config = []
-                for i, config, config_str in selected_postings:
-                    posting: data.Posting = entry.postings[i]
-                    if account_types.is_account_type(account_types_option.expenses, posting.account):
-                        new_account = str.join(account.sep,
-                                               [account_types_option.equity, 'Amortization',
-                                                account.sans_root(posting.account)])
-                    elif account_types.is_account_type(account_types_option.income, posting.account):
-                        new_account = str.join(account.sep,
-                                               [account_types_option.equity, 'Received',
-                                                account.sans_root(posting.account)])
-                    else:
-                        continue
-                    total = config.total - config.salvage_value
-
-                    new_posting_meta = create_meta(posting.meta, deletions=['amortize', 'narration'])
-
-                    if total == posting.units.number:
-                        entry.postings[i] = posting._replace(account=new_account)
-                    else:
-                        entry.postings[i] = posting._replace(
-                            units=data.Amount(posting.units.number - total, posting.units.currency))
-                        postings_to_insert_original_entry.append((
-                            i + 1,
-                            posting._replace(account=new_account,
-                                             units=data.Amount(total, posting.units.currency),
-                                             meta=new_posting_meta)
-                        ))
-                    new_postings_config.append((config, posting, new_account))
-
-                new_entries.extend(
-                    build_steps('amortize', entry, new_postings_config, positive=True,
-                                narration_suffix='Amortized(%d/%d)', generate_until=plugin_config.generate_until))
-
-            postings_to_insert_original_entry.reverse()
-            for i, element in postings_to_insert_original_entry:
-                entry.postings.insert(i, element)
-
-    if new_entries:
-        entries.extend(new_entries)
-        entries.sort(key=data.entry_sortkey)
+    plugin_stats.count('entries_scanned', len(entries))
+    if index is None:
+        with plugin_stats.phase('scan'):
+            index = CandidateIndex.scan(entries)
+    if materialized is None:
+        materialized = index.materialized
+    candidates = index.get('amortize')
+    plugin_stats.count('candidates', len(candidates))
+    # the keys hash the candidates before their postings are moved
+    source_keys = get_source_keys(candidates) if plugin_config.step_ids else [None] * len(candidates)
+
+    if not plugin_config.cache and not plugin_config.incremental and use_parallel(plugin_config, len(candidates)):
+        with plugin_stats.phase('parallel'):
+            results = expand_parallel(_amortize_chunk, list(zip(candidates, source_keys)),
+                                      (account_types_option, plugin_config, materialized), plugin_config.workers)
+            for entry, (postings, entry_new_entries, entry_errors) in zip(candidates, results):
+                entry.postings[:] = postings
+                new_entries.extend(entry_new_entries)
+                errors.extend(entry_errors)
+    else:
+        # posting account -> amortization account, or None if it cannot be amortized
+        amortization_accounts = {}
+        sources = []
+        for entry, source_key in zip(candidates, source_keys):
+            if materialized and is_materialized(entry, materialized):
+                amortize_entry(entry, account_types_option, plugin_config, amortization_accounts, errors,
+                               plugin_stats, materialized=True)
+            else:
+                sources.append((entry, (account_types_option, source_key)))
+        with open_schedule_cache(plugin_config, scope) as schedule_cache:
+            for entry_new_entries, entry_errors in schedule_cache.expand_all(
+                    'amortize', sources, plugin_config,
+                    lambda entry, context, entry_errors: amortize_entry(
+                        entry, account_types_option, plugin_config, amortization_accounts, entry_errors,
+                        plugin_stats, source_key=context[1]),
+                    source_modified=True):
+                new_entries.extend(entry_new_entries)
+                errors.extend(entry_errors)
+    index.update((), new_entries)
+
+    plugin_stats.count('entries_emitted', len(new_entries))
+    with plugin_stats.phase('merge'):
+        entries = merge_entries(entries, new_entries)
 
     return entries, errors
+
+
+def _amortize_chunk(chunk):
+    """
+    amortize_entry of the (entry, source key) pairs of a chunk, in a worker process
+    :return: (amortized postings, step entries, errors) per entry
+    """
+    account_types_option, plugin_config, materialized = get_worker_context()
+    amortization_accounts = {}
+    results = []
+    for entry, source_key in chunk:
+        entry_errors = []
+        entry_new_entries = amortize_entry(entry, account_types_option, plugin_config, amortization_accounts,
+                                           entry_errors, materialized=is_materialized(entry, materialized),
+                                           source_key=source_key)
+        results.append((entry.postings, entry_new_entries, entry_errors))
+    return results
+
+
+def amortize_entry(entry: data.Transaction, account_types_option, plugin_config: PluginConfig,
+                   amortization_accounts, errors, plugin_stats=NULL_STATS, materialized=False, source_key=None):
+    """
+    Move the amortized postings of the entry to the amortization accounts, and build the step entries
+    :return: the step entries, see iter_amortize, followed by the schedule directives if the manifest is on
+    """
+    schedules = [] if plugin_config.manifest and not materialized else None
+    new_entries = list(iter_amortize(entry, account_types_option, plugin_config, errors, amortization_accounts,
+                                     plugin_stats, materialized, schedules, source_key))
+    if schedules:
+        new_entries.extend(create_schedule_entries('amortize', entry, schedules, plugin_config.generate_until))
+    return new_entries
+
+
+def iter_amortize(entry: data.Transaction, account_types_option, plugin_config: PluginConfig = None, errors=None,
+                  amortization_accounts=None, plugin_stats=NULL_STATS, materialized=False, schedules=None,
+                  source_key=None) \
+        -> Iterator[data.Transaction]:
+    """
+    Move the amortized postings of the entry to the amortization accounts, then generate the step entries in date
+    order. The postings are moved when the iteration starts.
+    :param entry: modified in place
+    :param account_types_option: options.get_account_types(options_map)
+    :param plugin_config: generate_until and collapse_before apply
+    :param errors: the config errors are appended, if given
+    :param amortization_accounts: per run memo of get_amortization_account
+    :param plugin_stats:
+    :param materialized: the step entries are already in the ledger, only move the postings
+    :param schedules: the Schedule of every amortized posting is appended when the iteration starts, if given
+    :param source_key: the key of the entry among the identical sources, see get_source_keys
+    """
+    plugin_config = plugin_config or PluginConfig()
+    if errors is None:
+        errors = []
+    if amortization_accounts is None:
+        amortization_accounts = {}
+    select_groups = plugin_stats.timed('select_posting_groups', select_periodic_posting_groups)
+
+    selected_postings_groups = select_groups(entry, 'amortize', errors)
+    id_prefixes = None
+    if plugin_config.step_ids and not materialized:
+        # the key hashes the source entry before its postings are moved
+        source_key = source_key or get_source_key(entry)
+        id_prefixes = [get_id_prefix(source_key, 'amortize', group_i)
+                       for group_i in range(len(selected_postings_groups))]
+    postings_to_insert_original_entry = []
+    groups_postings_config = []
+    for group_i, selected_postings in enumerate(selected_postings_groups):
+        new_postings_config = []
+        for i, config, config_str in selected_postings:
+            posting: data.Posting = entry.postings[i]
+            if posting.account in amortization_accounts:
+                new_account = amortization_accounts[posting.account]
+            else:
+                new_account = get_amortization_account(account_types_option, posting.account)
+                amortization_accounts[posting.account] = new_account
+            if new_account is None:
+                continue
+            total = config.total - config.salvage_value
+
+            new_posting_meta = create_meta(posting.meta, deletions=['amortize', 'narration'])
+
+            if total == posting.units.number:
+                entry.postings[i] = posting._replace(account=new_account)
+            else:
+                entry.postings[i] = posting._replace(
+                    units=data.Amount(posting.units.number - total, posting.units.currency))
+                postings_to_insert_original_entry.append((
+                    i + 1,
+                    posting._replace(account=new_account,
+                                     units=data.Amount(total, posting.units.currency),
+                                     meta=new_posting_meta)
+                ))
+            new_postings_config.append((config, posting, new_account))
+            if schedules is not None:
+                schedules.append(Schedule(config_str, config, posting, new_account))
+        if new_postings_config:
+            groups_postings_config.append((new_postings_config, id_prefixes[group_i] if id_prefixes else None))
+
+    postings_to_insert_original_entry.reverse()
+    for i, element in postings_to_insert_original_entry:
+        entry.postings.insert(i, element)
+
+    if materialized:
+        return
+    yield from merge_steps([
+        plugin_stats.timed_iter('build_steps', iter_steps(
+            'amortize', entry, new_postings_config, positive=True,
+            narration_suffix='Amortized(%d/%d)', generate_until=plugin_config.generate_until,
+            stats=plugin_stats, collapse_before=plugin_config.collapse_before, id_prefix=id_prefix))
+        for new_postings_config, id_prefix in groups_postings_config])
@@ -0,0 +1,259 @@
+"""
+bean-periodic: write the entries generated by the periodic plugins to an include file.
+
+    bean-periodic ledger.beancount -o periodic.beancount --until 2024-12-31
+    bean-periodic ledger.beancount -o periodic.beancount --until 2024-12-31 --check
+
+The ledger is parsed and booked without running its plugins, then every source entry (a transaction with recur,
+split, amortize or depreciate meta) goes through the chosen plugins. The sources whose last step is on or before
+--until are materialized: their generated entries are printed to the output file, with a periodic-materialized
+marker (see common.materialize), and the plugins of the ledger skip them once the file is included. The sources
+still running after --until, and those carrying the meta of a plugin not run, are left to the plugins.
+The plugin options are read from the plugin directives of the ledger, except generate_until and collapse_before:
+the include file holds every step.
+"""
+import argparse
+import dataclasses
+import datetime
+import glob
+import os
+import sys
+
+from beancount import loader
+from beancount.core import data
+from beancount.parser import booking, options, parser, printer
+
+from .amortize import amortize_entries
+from .common.config import PluginConfig
+from .common.materialize import create_materialized_marker
+from .common.materialize import get_materialized_fingerprints
+from .common.materialize import source_fingerprint
+from .common.utils import create_meta
+from .common.utils import has_meta_key
+from .depreciate import depreciate_entries
+from .depreciate import get_depreciate_account_index
+from .recur import recur_entries
+from .split import split_entries
+
+PLUGIN_NAMES = ('recur', 'split', 'amortize', 'depreciate')
+PLUGIN_MODULE_PREFIX = 'beancount_periodic.'
+HEADER = ';; Generated by bean-periodic, do not edit.\n'
+
+
+def get_ledger_plugins(options_map):
+    """
+    :return: [(plugin name, config string)] of the periodic plugins of the ledger, the periodic plugin expanded
+    """
+    plugins = []
+    for module_name, config_string in options_map['plugin']:
+        if not module_name.startswith(PLUGIN_MODULE_PREFIX):
+            continue
+        name = module_name[len(PLUGIN_MODULE_PREFIX):]
+        if name == 'periodic':
+            plugins.extend((plugin_name, config_string) for plugin_name in PLUGIN_NAMES)
+        elif name in PLUGIN_NAMES:
+            plugins.append((name, config_string))
+    return plugins
+
+
+def get_plugin_configs(options_map, plugin_names=None):
+    """
+    :param options_map:
+    :param plugin_names: the plugins to run, 'periodic' stands for the four; None for the plugins of the ledger
+    :return: [(plugin name, PluginConfig)] in the order of the plugin names
+    """
+    ledger_plugins = get_ledger_plugins(options_map)
+    config_strings = dict(ledger_plugins)
+    if plugin_names is None:
+        names = [name for name, config_string in ledger_plugins] or list(PLUGIN_NAMES)
+    else:
+        names = []
+        for name in plugin_names:
+            names.extend(PLUGIN_NAMES if name == 'periodic' else (name,))
+    plugin_configs = []
+    for name in names:
+        if name not in PLUGIN_NAMES:
+            raise ValueError('unknown plugin %r, expected one of %s or periodic' % (name, ', '.join(PLUGIN_NAMES)))
+        plugin_config = PluginConfig.from_string(config_strings.get(name, ''))
+        plugin_configs.append((name, dataclasses.replace(plugin_config, generate_until=None, collapse_before=None,
+                                                         profile=None, cache=None, incremental=False, workers=1)))
+    return plugin_configs
+
+
+def parse_ledger(filename, skipped_filename=None):
+    """
+    Parse the ledger and the files it includes, like the beancount loader does but without booking nor plugins
+    :param filename: absolute path of the ledger
+    :param skipped_filename: absolute path of an include file left out, whether it exists or not
+    :return: (entries, errors, options_map), the entries unsorted, the options of the ledger file
+    """
+    entries, errors = [], []
+    options_map = None
+    filenames = [os.path.normpath(filename)]
+    parsed_filenames = set()
+    while filenames:
+        filename = filenames.pop(0)
+        if filename in parsed_filenames or filename == skipped_filename:
+            continue
+        if not os.path.exists(filename):
+            errors.append(loader.LoadError(data.new_metadata('<load>', 0), 'File "%s" does not exist' % filename))
+            continue
+        parsed_filenames.add(filename)
+        file_entries, file_errors, file_options_map = parser.parse_file(filename)
+        entries.extend(file_entries)
+        errors.extend(file_errors)
+        if options_map is None:
+            options_map = file_options_map
+        for include in file_options_map['include']:
+            pattern = os.path.normpath(os.path.join(os.path.dirname(filename), include))
+            matched_filenames = sorted(glob.glob(pattern, recursive=True))
+            if not matched_filenames and pattern != skipped_filename:
+                errors.append(loader.LoadError(data.new_metadata('<load>', 0),
+                                               'File glob "%s" does not match any files' % include))
+            filenames.extend(os.path.normpath(matched_filename) for matched_filename in matched_filenames)
+    if options_map is None:
+        options_map = options.OPTIONS_DEFAULTS.copy()
+    options_map['include'] = sorted(parsed_filenames)
+    return entries, errors, options_map
+
+
+def load_sources(filename, output):
+    """
+    Parse and book the ledger, without running its plugins nor reading the output file
+    :return: (entries, errors, options_map)
+    """
+    entries, errors, options_map = parse_ledger(os.path.abspath(filename), os.path.abspath(output))
+    entries.sort(key=data.entry_sortkey)
+    entries, booking_errors = booking.book(entries, options_map)
+    errors.extend(booking_errors)
+    return entries, errors, options_map
+
+
+def expand_source(entry: data.Transaction, plugin_configs, account_types_option, depreciate_accounts):
+    """
+    Run the plugins on the source entry alone
+    :return: (generated entries, errors)
+    """
+    source = entry._replace(postings=list(entry.postings))
+    entries = [source]
+    errors = []
+    for name, plugin_config in plugin_configs:
+        if name == 'recur':
+            entries, plugin_errors = recur_entries(entries, plugin_config, materialized=set())
+        elif name == 'split':
+            entries, plugin_errors = split_entries(entries, plugin_config, materialized=set())
+        elif name == 'amortize':
+            entries, plugin_errors = amortize_entries(entries, account_types_option, plugin_config,
+                                                      materialized=set())
+        else:
+            entries, plugin_errors = depreciate_entries(entries, account_types_option, depreciate_accounts,
+                                                        plugin_config, materialized=set())
+        errors.extend(plugin_errors)
+    return [new_entry for new_entry in entries if new_entry is not source], errors
+
+
+def strip_periodic_meta(entry: data.Transaction) -> data.Transaction:
+    """
+    Remove the periodic meta the generated entries inherit from their source, it is already applied
+    """
+    postings = [posting._replace(meta=create_meta(posting.meta, PLUGIN_NAMES)) if posting.meta else posting
+                for posting in entry.postings]
+    return entry._replace(meta=create_meta(entry.meta or {}, PLUGIN_NAMES), postings=postings)
+
+
+def materialize(entries: data.Entries, options_map, plugin_configs, until: datetime.date, output):
+    """
+    :param entries: booked entries, not processed by the plugins
+    :param options_map:
+    :param plugin_configs: see get_plugin_configs
+    :param until: the sources whose steps all start on or before this date are materialized
+    :param output: the include file name, for the meta of the markers
+    :return: (entries of the include file, errors)
+    """
+    account_types_option = options.get_account_types(options_map)
+    depreciate_accounts = get_depreciate_account_index(entries)
+    meta_keys = tuple(name for name, plugin_config in plugin_configs)
+    # a source also handled by a plugin not run here is left to the plugins
+    other_meta_keys = tuple(name for name in PLUGIN_NAMES if name not in meta_keys)
+    # sources materialized by another include file
+    materialized = get_materialized_fingerprints(entries)
+    output_entries = []
+    errors = []
+    for entry in entries:
+        if not isinstance(entry, data.Transaction) or not has_meta_key(entry, meta_keys):
+            continue
+        if other_meta_keys and has_meta_key(entry, other_meta_keys):
+            continue
+        fingerprint = source_fingerprint(entry)
+        if fingerprint in materialized:
+            continue
+        generated, entry_errors = expand_source(entry, plugin_configs, account_types_option, depreciate_accounts)
+        errors.extend(entry_errors)
+        if entry_errors or not any(isinstance(new_entry, data.Transaction) for new_entry in generated) \
+                or any(new_entry.date > until for new_entry in generated):
+            continue
+        output_entries.append(create_materialized_marker(entry, fingerprint, output))
+        # the schedule directives of the manifest are written as they are
+        output_entries.extend(strip_periodic_meta(new_entry) if isinstance(new_entry, data.Transaction) else new_entry
+                              for new_entry in generated)
+    output_entries.sort(key=data.entry_sortkey)
+    return output_entries, errors
+
+
+def format_entries(entries: data.Entries) -> str:
+    return HEADER + ''.join('\n' + printer.format_entry(entry) for entry in entries)
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%r is not an ISO 8601 date, e.g. 2024-12-31' % value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='bean-periodic',
+        description='Write the entries generated by the periodic plugins to a file to include in the ledger.')
+    parser.add_argument('filename', help='the ledger file')
+    parser.add_argument('-o', '--output',
+                        help='the file of the generated entries, default: the ledger name with .periodic.beancount')
+    parser.add_argument('--until', type=_parse_date, default=datetime.date.today(),
+                        help='materialize the schedules ended on or before this date, default: today')
+    parser.add_argument('--plugins',
+                        help='comma separated plugins to run: recur, split, amortize, depreciate or periodic, '
+                             'default: the periodic plugins of the ledger')
+    parser.add_argument('--check', action='store_true',
+                        help='do not write, exit with 1 if the output file is not up to date')
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.filename)[0] + '.periodic.beancount'
+    entries, errors, options_map = load_sources(args.filename, output)
+    plugin_names = [name.strip() for name in args.plugins.split(',') if name.strip()] if args.plugins else None
+    try:
+        plugin_configs = get_plugin_configs(options_map, plugin_names)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    output_entries, plugin_errors = materialize(entries, options_map, plugin_configs, args.until,
+                                                os.path.abspath(output))
+    errors.extend(plugin_errors)
+    printer.print_errors(errors, file=sys.stderr)
+    content = format_entries(output_entries)
+
+    if args.check:
+        current = None
+        if os.path.exists(output):
+            with open(output, 'r', encoding='utf-8') as f:
+                current = f.read()
+        if current != content:
+            sys.stderr.write('%s is out of date\n' % output)
+            return 1
+        return 0
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
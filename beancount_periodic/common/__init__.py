@@ -1,5 +1,5 @@
 import collections
-from typing import List
+from typing import Sequence
 from datetime import date
 from decimal import Decimal
 from typing import NamedTuple
@@ -8,10 +8,19 @@ PeriodicConfig = NamedTuple('PeriodicConfig', [
     ('total', Decimal),
     ('start', date),
     ('duration', int),
-    ('steps', List),
+    ('steps', Sequence),
     ('equal_amount', bool),
     ('salvage_value', Decimal),
     ('formula', str)
 ])
 
-PeriodicConfigError = collections.namedtuple('ReserveConfigError', 'source message entry')
+try:
+    from beancount.parser.grammar import ValueType
+except ImportError:
+    # the values of the custom directives, the grammar module is not a public API of beancount; the printer only
+    # reads the value and dtype attributes
+    ValueType = collections.namedtuple('ValueType', 'value dtype')
+
+PeriodicConfigError = collections.namedtuple('PeriodicConfigError', 'source message entry')
+# the historical name of the namedtuple, for pickle to find the class of the errors stored under it
+ReserveConfigError = PeriodicConfigError
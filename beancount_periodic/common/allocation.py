@@ -0,0 +1,163 @@
+"""
+Fixed-point integer allocation of a straight-line schedule.
+
+The Decimal loop of schedule.iter_step_amounts rounds every step amount to place_num decimals, carries the rounding
+remainder to the next steps and gives what is left to the last step. Here the total is converted once to an exact
+fraction, every step amount is an integer number of 10^-place_num units and the remainder is an exact integer
+numerator, so a step is a divmod and a few integer operations. Decimals are built only for the yielded amounts.
+
+The Decimal loop computes the step amounts with 28 significant digits, while this one is exact. Both round the same
+way unless a value is within the Decimal error of a rounding tie. For a step amount, the Decimal one is computed to
+decide; for the carried remainder, which depends on all the previous steps, allocate_scaled gives up (yields None)
+and the caller goes on with the Decimal loop.
+"""
+import datetime
+import decimal
+import math
+from decimal import Decimal
+from typing import Iterator, Optional, Tuple
+
+from . import PeriodicConfig
+from .number import remove_exponent_zero
+from .steps import Steps
+
+NEGATIVE_ZERO = Decimal('-0')
+
+
+def scaled_to_decimal(num: int, place_num: int) -> Decimal:
+    """
+    Same as remove_exponent_zero(Decimal(num).scaleb(-place_num))
+    """
+    while place_num > 0 and num % 10 == 0:
+        num //= 10
+        place_num -= 1
+    return Decimal(num).scaleb(-place_num) if place_num else Decimal(num)
+
+
+def significant_digits(numerator: int, denominator: int) -> Optional[int]:
+    """
+    The significant digits of the fraction written as a decimal
+    :return: None if the decimal expansion is infinite
+    """
+    gcd = math.gcd(numerator, denominator)
+    numerator, denominator = abs(numerator) // gcd, denominator // gcd
+    rest = denominator
+    places = 0
+    for factor in (2, 5):
+        factor_places = 0
+        while rest % factor == 0:
+            rest //= factor
+            factor_places += 1
+        places = max(places, factor_places)
+    if rest != 1:
+        return None
+    return len(str(numerator * 10 ** places // denominator).rstrip('0'))
+
+
+def can_allocate_scaled(config: PeriodicConfig, total: Decimal, place_num: int) -> bool:
+    """
+    Whether allocate_scaled applies: a straight-line schedule of Steps (every step but the last has ratio 1), in the
+    default Decimal context, with amounts far from the 28 digits precision
+    """
+    context = decimal.getcontext()
+    return (isinstance(config.steps, Steps)
+            and context.prec >= 28 and context.rounding == decimal.ROUND_HALF_EVEN
+            and total.is_finite() and (not total or total.adjusted() + place_num < context.prec - 6)
+            and config.duration > 0
+            and (not config.equal_amount or config.steps.ratio_sum > 0))
+
+
+def allocate_scaled(config: PeriodicConfig, total: Decimal, place_num: int) \
+        -> Iterator[Optional[Tuple[int, datetime.date, int, Decimal]]]:
+    """
+    :param config: see can_allocate_scaled
+    :param total: total - salvage value
+    :param place_num: decimals of the step amounts
+    :return: iterator of (step index, step date, step days, amount) as schedule.iter_step_amounts, or None when the
+    Decimal loop must take over from that step
+    """
+    steps = config.steps
+    steps_len = len(steps)
+    scale = 10 ** place_num
+    total_num, total_den = total.as_integer_ratio()
+
+    # every step amount is step_num / den units, the step_num of the real days mode is days * step_num
+    if config.equal_amount:
+        ratio_num, ratio_den = steps.ratio_sum.as_integer_ratio()
+        den = total_den * ratio_num
+        step_num = total_num * scale * ratio_den
+        # when the step amount is a short enough finite decimal, the Decimal loop is exact too, with the same ties
+        digits = significant_digits(step_num, den)
+        exact = digits is not None and digits < decimal.getcontext().prec
+    else:
+        den = total_den * config.duration
+        step_num = total_num * scale
+        exact = False
+
+    # distance to a tie, as |2 * remainder - den|, below which the 28 digits of the Decimal loop may round otherwise
+    # (steps_len + 2) ** 2 bounds the error carried by the remainder, |total| * scale * den the step amounts
+    tie_margin = 2 * (steps_len + 2) ** 2 * (abs(total_num) * scale * (den // total_den) + den)
+    precision = 10 ** (decimal.getcontext().prec - 3)
+
+    start_date = config.start
+    allocated = 0
+    carried = 0  # the carried rounding remainder, in 1 / den units
+    # a schedule has few distinct step amounts and step lengths
+    amounts = {}
+    deltas = {}
+    for step_i, (step_days, step_ratio) in enumerate(steps):
+        if step_i == steps_len - 1:  # the last step
+            amount = remove_exponent_zero(total)
+            if step_i > 0:
+                amount = remove_exponent_zero(amount - scaled_to_decimal(allocated, place_num))
+            yield step_i, start_date, step_days, amount
+            return
+
+        num = step_num if config.equal_amount else step_days * step_num
+        quotient, remainder = divmod(num, den)
+        if not exact and abs(2 * remainder - den) * precision <= tie_margin:
+            # the step amount of the Decimal loop does not depend on the previous steps, it tells the rounding
+            round_up = _decimal_rounds_up(config, step_days, total, quotient, place_num)
+        else:
+            round_up = 2 * remainder > den or (2 * remainder == den and quotient & 1)
+        if round_up:
+            quotient += 1
+            remainder -= den
+
+        carried_quotient, carried_remainder = divmod(carried, den)
+        if not exact and abs(2 * carried_remainder - den) * precision <= tie_margin:
+            yield None
+            return
+        if 2 * carried_remainder > den or (2 * carried_remainder == den and carried_quotient & 1):
+            carried_quotient += 1
+        if carried_quotient:
+            negative_zero = False
+            quotient += carried_quotient
+            carried -= carried_quotient * den
+        else:
+            negative_zero = quotient == 0 and num < 0
+
+        carried += remainder
+        allocated += quotient
+        if negative_zero:
+            amount = NEGATIVE_ZERO
+        else:
+            amount = amounts.get(quotient)
+            if amount is None:
+                amount = amounts[quotient] = scaled_to_decimal(quotient, place_num)
+        yield step_i, start_date, step_days, amount
+        delta = deltas.get(step_days)
+        if delta is None:
+            delta = deltas[step_days] = datetime.timedelta(days=step_days)
+        start_date += delta
+
+
+def _decimal_rounds_up(config: PeriodicConfig, step_days, total: Decimal, quotient: int, place_num: int) -> bool:
+    """
+    Whether the Decimal loop rounds the step amount, between quotient and quotient + 1 units, to quotient + 1
+    """
+    if config.equal_amount:
+        amount = total / config.steps.ratio_sum
+    else:
+        amount = Decimal(step_days) / config.duration * total
+    return round(amount, place_num) > scaled_to_decimal(quotient, place_num)
@@ -0,0 +1,77 @@
+import datetime
+import random
+import unittest
+from decimal import Decimal
+
+from . import PeriodicConfig
+from .allocation import *
+from .number import smart_place_num
+from .schedule import _iter_step_amounts_decimal
+from .schedule import iter_step_amounts
+from .steps import get_steps_calendar, get_steps_fixed
+
+
+def random_config(rand: random.Random):
+    start = datetime.date(2000, 1, 1) + datetime.timedelta(days=rand.randrange(10000))
+    duration = rand.choice([rand.randrange(1, 60), rand.randrange(1, 800), rand.randrange(1, 4000)])
+    if rand.random() < 0.5:
+        steps = get_steps_fixed(duration, rand.choice([1, 1, 7, 10, 30]))
+    else:
+        steps = get_steps_calendar(start, duration, rand.choice([1, 3, 12]))
+    places = rand.randrange(0, 5)
+    total = Decimal(rand.randrange(-10 ** 9, 10 ** 9) // 10 ** rand.randrange(0, 8)).scaleb(-places)
+    if rand.random() < 0.2:
+        total = Decimal(rand.randrange(1, 200))
+    salvage_value = Decimal('0') if rand.random() < 0.7 else total / rand.choice([2, 4, 10])
+    return PeriodicConfig(total=total, start=start, duration=duration, steps=steps,
+                          equal_amount=rand.random() < 0.5, salvage_value=salvage_value, formula='line')
+
+
+def decimal_step_amounts(config):
+    total = config.total - config.salvage_value
+    place_num = smart_place_num(total, len(config.steps) if config.equal_amount else config.duration)
+    return list(_iter_step_amounts_decimal(config, total, place_num))
+
+
+class AllocationTest(unittest.TestCase):
+    def test_scaled_to_decimal(self):
+        self.assertEqual(str(scaled_to_decimal(123400, 2)), '1234')
+        self.assertEqual(str(scaled_to_decimal(123450, 2)), '1234.5')
+        self.assertEqual(str(scaled_to_decimal(-5, 3)), '-0.005')
+        self.assertEqual(str(scaled_to_decimal(0, 6)), '0')
+
+    def test_significant_digits(self):
+        self.assertIsNone(significant_digits(1, 3))
+        self.assertEqual(significant_digits(1, 8), 3)
+        self.assertEqual(significant_digits(-12345, 100), 5)
+
+    def test_same_as_decimal(self):
+        rand = random.Random(1)
+        scaled_num = 0
+        for _ in range(1000):
+            config = random_config(rand)
+            expected = decimal_step_amounts(config)
+            actual = list(iter_step_amounts(config))
+            # the repr, as -0 and 0, or 1E+3 and 1000 are printed differently
+            self.assertEqual([repr(step) for step in actual], [repr(step) for step in expected], config)
+            total = config.total - config.salvage_value
+            place_num = smart_place_num(total, len(config.steps) if config.equal_amount else config.duration)
+            if can_allocate_scaled(config, total, place_num) and None not in allocate_scaled(config, total,
+                                                                                             place_num):
+                scaled_num += 1
+        self.assertGreater(scaled_num, 800)
+
+    def test_ties(self):
+        # 0.125 per step, rounded half even, the remainder carried
+        config = PeriodicConfig(total=Decimal('1'), start=datetime.date(2024, 1, 1), duration=8,
+                                steps=get_steps_fixed(8, 1), equal_amount=True, salvage_value=Decimal('0'),
+                                formula='line')
+        self.assertEqual([step[3] for step in iter_step_amounts(config)], [step[3] for step in
+                                                                            decimal_step_amounts(config)])
+        config = config._replace(total=Decimal('-1'), duration=1000, steps=get_steps_fixed(1000, 1))
+        self.assertEqual([repr(step) for step in iter_step_amounts(config)],
+                         [repr(step) for step in decimal_step_amounts(config)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,376 @@
+"""
+Caches of generated schedules.
+
+The persistent cache is turned on by the `cache` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'cache':'.periodic-cache.sqlite'}"
+
+The in-process cache, for long-running hosts such as Fava, by the `incremental` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'incremental':True}"
+
+Every source entry is keyed by a hash of its date, flags, texts, meta and postings, the plugin name and version, the
+cache format version, the plugin options affecting the output and the plugin specific context (account types,
+depreciate_account...).
+The value is the pickled result of expanding the entry, so an edited entry simply gets a new key.
+The in-process cache keys the entries by their content without the file name and line numbers, an unchanged entry
+gets the very entries of the last run, an entry moved by an edit above it gets copies stamped with its new location.
+"""
+import gc
+import hashlib
+import pickle
+import sqlite3
+import time
+
+from beancount.core import data
+
+from .. import __version__
+from .config import PluginConfig
+from .manifest import restore_account_values
+
+DEFAULT_MAX_SIZE = PluginConfig.cache_max_size
+# part of every cache key, bump it with every change of the generated entries, the package version is not bumped
+# that often
+CACHE_FORMAT_VERSION = 7
+# keys per query, below the 999 parameters of old SQLite versions
+SQL_BATCH_SIZE = 500
+
+
+LOCATION_META_KEYS = ('filename', 'lineno')
+
+
+def _meta_key(meta, location=True):
+    if not meta:
+        return ()
+    return tuple(sorted((key, repr(value)) for key, value in meta.items()
+                        if location or key not in LOCATION_META_KEYS))
+
+
+def entry_fingerprint(plugin_name, entry: data.Transaction, plugin_config, context=()) -> str:
+    """
+    Stable hash of everything the expansion of the entry depends on
+    :param plugin_name:
+    :param entry:
+    :param plugin_config:
+    :param context: plugin specific inputs, must have a stable repr
+    :return: hex digest
+    """
+    content = (
+        plugin_name,
+        __version__,
+        CACHE_FORMAT_VERSION,
+        plugin_config.schedule_key(),
+        entry.date,
+        entry.flag,
+        entry.payee,
+        entry.narration,
+        tuple(sorted(entry.tags or ())),
+        tuple(sorted(entry.links or ())),
+        _meta_key(entry.meta),
+        tuple((posting.account, posting.units, posting.cost, posting.price, posting.flag,
+               _meta_key(posting.meta))
+              for posting in entry.postings),
+        context,
+    )
+    return hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+
+
+class ScheduleCache:
+    enabled = True
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._used_keys = set()
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS schedules ('
+                                 'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                                 'used REAL NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_all(self, keys):
+        """
+        Read the cached values of the keys in a few queries
+        :return: the values, None for the keys not in the cache
+        """
+        blobs = {}
+        for i in range(0, len(keys), SQL_BATCH_SIZE):
+            batch = keys[i:i + SQL_BATCH_SIZE]
+            blobs.update(self._connection.execute(
+                'SELECT key, value FROM schedules WHERE key IN (%s)' % ','.join('?' * len(batch)), batch))
+        values = []
+        # the unpickled entries all live on, collecting them only rescans them over and over
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for key in keys:
+                blob = blobs.get(key)
+                if blob is None:
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self.hits += 1
+                    self._used_keys.add(key)
+                    values.append(pickle.loads(blob))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return values
+
+    def put_all(self, items):
+        """
+        :param items: [(key, value)]
+        """
+        now = time.time()
+        rows = []
+        for key, value in items:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, len(blob), now))
+        self._connection.executemany('INSERT OR REPLACE INTO schedules (key, value, size, used) VALUES (?, ?, ?, ?)',
+                                     rows)
+
+    def expand_all(self, plugin_name, sources, plugin_config, expand_entry, source_modified=False):
+        """
+        Return the cached expansions of the entries, expand the others and cache the results
+        :param plugin_name:
+        :param sources: [(entry, context)], context: see entry_fingerprint
+        :param plugin_config:
+        :param expand_entry: function(entry, context, errors) -> generated entries
+        :param source_modified: whether expand_entry modifies the postings of the entry in place
+        :return: [(generated entries, errors)] per source
+        """
+        keys = [entry_fingerprint(plugin_name, entry, plugin_config, context) for entry, context in sources]
+        results = []
+        expanded = []
+        for (entry, context), key, cached in zip(sources, keys, self.get_all(keys)):
+            if cached is not None:
+                postings, new_entries, entry_errors = cached
+                if source_modified:
+                    entry.postings[:] = postings
+                restore_account_values(new_entries)
+            else:
+                entry_errors = []
+                new_entries = expand_entry(entry, context, entry_errors)
+                expanded.append((key, (list(entry.postings) if source_modified else None, new_entries, entry_errors)))
+            results.append((new_entries, entry_errors))
+        self.put_all(expanded)
+        return results
+
+    def evict(self):
+        """
+        Delete the least recently used schedules until the cache fits in max_size
+        """
+        total = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM schedules').fetchone()[0]
+        if total <= self.max_size:
+            return
+        keys_to_delete = []
+        for key, size in self._connection.execute('SELECT key, size FROM schedules ORDER BY used'):
+            if total <= self.max_size:
+                break
+            keys_to_delete.append((key,))
+            total -= size
+        self._connection.executemany('DELETE FROM schedules WHERE key = ?', keys_to_delete)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM schedules')
+        self._connection.commit()
+
+    def close(self):
+        now = time.time()
+        self._connection.executemany('UPDATE schedules SET used = ? WHERE key = ?',
+                                     [(now, key) for key in self._used_keys])
+        self.evict()
+        self._connection.commit()
+        self._connection.close()
+
+
+class NullScheduleCache:
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def expand_all(self, plugin_name, sources, plugin_config, expand_entry, source_modified=False):
+        results = []
+        for entry, context in sources:
+            entry_errors = []
+            results.append((expand_entry(entry, context, entry_errors), entry_errors))
+        return results
+
+
+NULL_SCHEDULE_CACHE = NullScheduleCache()
+
+
+def content_key(entry: data.Transaction, context=()):
+    """
+    Hashable key of everything the expansion of the entry depends on but its location and the plugin options, cheaper
+    than entry_fingerprint
+    :param entry:
+    :param context: plugin specific inputs, must be hashable
+    """
+    return (
+        entry.date,
+        entry.flag,
+        entry.payee,
+        entry.narration,
+        entry.tags,
+        entry.links,
+        _meta_key(entry.meta, location=False),
+        # the reprs tell the precision of the numbers apart
+        tuple((posting.account, repr(posting.units), repr(posting.cost), repr(posting.price), posting.flag,
+               _meta_key(posting.meta, location=False))
+              for posting in entry.postings),
+        context,
+    )
+
+
+def get_locations(entry: data.Transaction):
+    """
+    The (file name, line number) of the entry and of its postings
+    """
+    return [(meta.get('filename'), meta.get('lineno')) if meta else None
+            for meta in [entry.meta] + [posting.meta for posting in entry.postings]]
+
+
+def _restamp_meta(meta, moved_locations):
+    if not meta:
+        return meta
+    location = moved_locations.get((meta.get('filename'), meta.get('lineno')))
+    if location is None:
+        return meta
+    return dict(meta, filename=location[0], lineno=location[1])
+
+
+def _restamp_postings(postings, moved_locations):
+    return [posting._replace(meta=_restamp_meta(posting.meta, moved_locations)) for posting in postings]
+
+
+def restamp(entry, moved_locations):
+    """
+    A copy of a cached entry, the meta at a location of the source entry of the last run get the new location
+    :param entry: a generated entry or an error
+    :param moved_locations: {location of the last run: location of this run}, see get_locations
+    """
+    if isinstance(entry, data.Transaction):
+        return entry._replace(meta=_restamp_meta(entry.meta, moved_locations),
+                              postings=_restamp_postings(entry.postings, moved_locations))
+    if hasattr(entry, 'meta'):
+        return entry._replace(meta=_restamp_meta(entry.meta, moved_locations))
+    # the errors carry the meta of the source
+    return entry._replace(source=_restamp_meta(entry.source, moved_locations))
+
+
+# (plugin name, ledger file name) ->
+# (schedule key, {content key: (source locations, postings, generated entries, errors)}) of the last run
+_INCREMENTAL_STATE = {}
+
+
+class IncrementalScheduleCache:
+    """
+    Keeps the expansions of the last run in memory. Only the entries which were added or changed since the last run
+    are expanded, the expansions of the removed or changed entries are dropped when the run ends.
+    The entries are keyed by content. The hits of an unchanged entry are the entries generated by the last run, the
+    later plugins must not modify them in place, which beancount plugins do not do. The hits of a moved entry are
+    copies stamped with its current location.
+    Misses fall through to the persistent cache if it is configured.
+    """
+    enabled = True
+
+    def __init__(self, scope, fallback=NULL_SCHEDULE_CACHE):
+        self.scope = scope
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._seen = {}
+
+    def __enter__(self):
+        self.fallback.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            for plugin_name, seen in self._seen.items():
+                _INCREMENTAL_STATE[(plugin_name, self.scope)] = seen
+        self.fallback.__exit__(exc_type, exc_val, exc_tb)
+
+    def expand_all(self, plugin_name, sources, plugin_config, expand_entry, source_modified=False):
+        schedule_key = plugin_config.schedule_key()
+        state = _INCREMENTAL_STATE.get((plugin_name, self.scope))
+        cached_expansions = state[1] if state is not None and state[0] == schedule_key else {}
+        seen = {}
+        results = [None] * len(sources)
+        misses = []
+        for i, (entry, context) in enumerate(sources):
+            key = content_key(entry, context)
+            try:
+                cached = cached_expansions.get(key)
+            except TypeError:
+                # an unhashable meta value or context, never cached
+                key = cached = None
+            locations = get_locations(entry)
+            if cached is None:
+                misses.append((i, key, locations))
+                continue
+            cached_locations, postings, new_entries, entry_errors = cached
+            if cached_locations != locations:
+                moved_locations = {cached_location: location
+                                   for cached_location, location in zip(cached_locations, locations)
+                                   if cached_location is not None}
+                if source_modified:
+                    postings = _restamp_postings(postings, moved_locations)
+                new_entries = [restamp(new_entry, moved_locations) for new_entry in new_entries]
+                entry_errors = [restamp(error, moved_locations) for error in entry_errors]
+                cached = (locations, postings, new_entries, entry_errors)
+            if source_modified:
+                entry.postings[:] = postings
+            results[i] = (new_entries, entry_errors)
+            seen[key] = cached
+
+        self.hits += len(sources) - len(misses)
+        self.misses += len(misses)
+        expansions = self.fallback.expand_all(plugin_name, [sources[i] for i, key, locations in misses],
+                                              plugin_config, expand_entry, source_modified)
+        for (i, key, locations), (new_entries, entry_errors) in zip(misses, expansions):
+            results[i] = (new_entries, entry_errors)
+            if key is not None:
+                seen[key] = (locations, list(sources[i][0].postings) if source_modified else None, new_entries,
+                             entry_errors)
+        self._seen[plugin_name] = (schedule_key, seen)
+        return results
+
+
+def clear_incremental_state():
+    _INCREMENTAL_STATE.clear()
+
+
+def open_schedule_cache(plugin_config, scope=None):
+    """
+    :param plugin_config:
+    :param scope: the ledger file name, for the in-process cache
+    :return: the caches turned on by plugin_config, or NULL_SCHEDULE_CACHE if none is
+    """
+    schedule_cache = NULL_SCHEDULE_CACHE
+    if plugin_config.cache:
+        schedule_cache = ScheduleCache(plugin_config.cache, plugin_config.cache_max_size)
+    if plugin_config.incremental:
+        schedule_cache = IncrementalScheduleCache(scope, schedule_cache)
+    return schedule_cache
+
+
+def clear_schedule_cache(path):
+    """
+    Invalidate the whole cache file
+    """
+    schedule_cache = ScheduleCache(path)
+    schedule_cache.clear()
+    schedule_cache.close()
@@ -1,39 +1,16 @@
 import datetime
-import re
-import sys
 import ast
-from typing import Tuple, Optional
+from functools import lru_cache
+from typing import Tuple, Optional, Dict, Union
 from dataclasses import dataclass
 
 from . import *
+from .config_parser import ConfigAst, ConfigSyntaxError, DurationAst, StepAst
+from .config_parser import parse_config_ast, parse_duration_ast, parse_step_ast
+from .steps import add_months, get_steps_calendar, get_steps_fixed
 
-from dateutil.relativedelta import relativedelta
-
-try:
-    from beancount.utils.date_utils import parse_date_liberally
-except (ImportError, ModuleNotFoundError):
-    from beangulp.date_utils import parse_date as parse_date_liberally
-
-RE_TOTAL = '\\s*(?P<total>\\d+(?:\\.\\d+)?)\\s*-'
-PART_DURATION_NAMED = "(?:Day|Week|Month|Quarter|Year)"
-PART_DURATION_NAMED_SHORTEN = "[DWMQY]"
-DURATION_NUM = f'(?P<num>\\d+)?\\s*(?:(?P<unit_named>{PART_DURATION_NAMED}s?)|(?P<unit_named_shorten>' \
-               f'{PART_DURATION_NAMED_SHORTEN}))?'
-RE_DATE_START = "@\\s*(?P<date_start>\\d{4}-\\d{2}-\\d{2})"
-RE_DATE_END = "~\\s*(?P<date_end>\\d{4}-\\d{2}-\\d{2})"
-RE_DURATION = f'(?:{DURATION_NUM}\\s*(?:{RE_DATE_START}\\s*)?(?:{RE_DATE_END})?)'
-RE_STEP_A = f'(?P<step_num>\\d+)\\s*(?:(?P<step_unit_named>{PART_DURATION_NAMED}s?[!]?)|(?P<step_unit_named_shorten>' \
-            f'{PART_DURATION_NAMED_SHORTEN}[!]?))?'
-RE_STEP_B = f'(?P<step_named>(?:Dai|Week|Month|Quarter|Year)ly[!]?)'
-RE_STEP = f'{RE_STEP_A}|{RE_STEP_B}'
-RE_VALUE = "[\\+\\=]\\s*(?P<value>\\d+(?:\\.\\d+)?%?)"
-RE_FORMULA = "\\s*\\*(?P<formula>linear|straight|line|load|work-load|accelerated-sum|sum|accelerated-declining" \
-             "|declining)"
-RE = fr'^\s*(?:{RE_TOTAL}\s*)?(?:{RE_DURATION}\s*)?(?:/\s*(?:{RE_STEP})\s*)?(?:{RE_FORMULA}\s*)?(?:{RE_VALUE}\s*)?$'
-# sys.stderr.write('%s\n' % RE)
-CONFIG_STR_PATTERN = re.compile(RE)
-CONFIG_STR_PATTERN_DURATION = re.compile(fr'{RE_DURATION}')
-CONFIG_STR_PATTERN_STEP = re.compile(fr'{RE_STEP}')
+# Bound of every parse/steps cache; ledgers usually repeat a few dozen distinct config strings
+CONFIG_CACHE_SIZE = 1024
 
 
 def get_duration(start_date, num, unit_named, unit_named_shorten):
@@ -53,14 +30,13 @@ def get_duration(start_date, num, unit_named, unit_named_shorten):
         elif key_letter == 'W':
             return 7 * num
         elif key_letter == 'M':
-            delta = (start_date + relativedelta(months=num)) - start_date
+            delta = add_months(start_date, num) - start_date
             return delta.days
         elif key_letter == 'Q':
-            delta = (start_date + relativedelta(months=num * 3)) - start_date
+            delta = add_months(start_date, num * 3) - start_date
             return delta.days
-            pass
         elif key_letter == 'Y':
-            delta = (start_date + relativedelta(years=num)) - start_date
+            delta = add_months(start_date, num * 12) - start_date
             return delta.days
     else:
         return num
@@ -84,11 +60,11 @@ def get_steps(start_date, duration, num, unit_named, unit_named_shorten):
         elif key_letter == 'W':
             return get_steps_simple(duration, 7 * num)
         elif key_letter == 'M':
-            return __get_steps(start_date, duration, lambda i: relativedelta(months=i))
+            return get_steps_calendar(start_date, duration, 1)
         elif key_letter == 'Q':
-            return __get_steps(start_date, duration, lambda i: relativedelta(months=i * 3))
+            return get_steps_calendar(start_date, duration, 3)
         elif key_letter == 'Y':
-            return __get_steps(start_date, duration, lambda i: relativedelta(years=i))
+            return get_steps_calendar(start_date, duration, 12)
     else:
         return get_steps_simple(duration, num)
 
@@ -100,43 +76,96 @@ def get_steps_simple(duration, step):
     :param step:
     :return:
     """
-    steps = []
-    remainder = duration
-    while True:
-        if step <= remainder:
-            steps.append((step, 1))
-            remainder -= step
-        else:
-            if remainder > 0:
-                steps.append((remainder, Decimal(remainder) / step))
-            break
-    return steps
-
-
-def __get_steps(start_date, duration, delta_callback):
-    steps = []
-    start = start_date
-    remainder = duration
-    for i in range(duration):
-        tail_date = start_date + delta_callback(i + 1)
-        delta = tail_date - start
-        if delta.days <= remainder:
-            steps.append((delta.days, 1))
-            start = tail_date
-            remainder -= delta.days
-        else:
-            if remainder > 0:
-                steps.append((remainder, Decimal(remainder) / delta.days))
-            break
-    return steps
+    return get_steps_fixed(duration, step)
+
+
+@lru_cache(maxsize=CONFIG_CACHE_SIZE)
+def parse_config_str(config: str) -> Tuple[Optional[ConfigAst], Optional[ConfigSyntaxError]]:
+    """
+    Parse the config string into its syntax tree, memoized by config string
+    :param config:
+    :return: (ConfigAst, None), or (None, the syntax error)
+    """
+    try:
+        return parse_config_ast(config), None
+    except ConfigSyntaxError as e:
+        return None, e
+
+
+@lru_cache(maxsize=CONFIG_CACHE_SIZE)
+def parse_duration_str(duration_str: str) -> Optional[DurationAst]:
+    """
+    Parse a duration string such as the default duration, memoized
+    :param duration_str:
+    :return: DurationAst, or None if the string is not a duration
+    """
+    try:
+        return parse_duration_ast(duration_str)
+    except ConfigSyntaxError:
+        return None
+
+
+@lru_cache(maxsize=CONFIG_CACHE_SIZE)
+def parse_step_str(step_str: str) -> Optional[StepAst]:
+    """
+    Parse a step string such as the default step, memoized
+    :param step_str:
+    :return: StepAst, or None if the string is not a step
+    """
+    try:
+        return parse_step_ast(step_str)
+    except ConfigSyntaxError:
+        return None
+
+
+# the defaults of the plugins, parsed once
+DEFAULT_DURATION = parse_duration_ast('M')
+DEFAULT_STEP = parse_step_ast('D')
+
+
+@lru_cache(maxsize=CONFIG_CACHE_SIZE)
+def get_steps_cached(start_date, duration, num, unit_named, unit_named_shorten):
+    """
+    Same as get_steps, memoized by start date, duration and step unit.
+    The returned list is shared between callers and must not be modified.
+    """
+    return get_steps(start_date, duration, num, unit_named, unit_named_shorten)
+
+
+CONFIG_CACHES = {
+    'config': parse_config_str,
+    'duration': parse_duration_str,
+    'step': parse_step_str,
+    'steps': get_steps_cached,
+}
+
+
+def cache_info() -> Dict[str, Dict[str, int]]:
+    """
+    Hit/miss counters of the config parsing caches
+    :return: {cache name: {'hits': ..., 'misses': ..., 'size': ..., 'maxsize': ...}}
+    """
+    ret = {}
+    for name, func in CONFIG_CACHES.items():
+        info = func.cache_info()
+        ret[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+    return ret
+
+
+def cache_clear():
+    """
+    Empty the config parsing caches and reset their counters
+    """
+    for func in CONFIG_CACHES.values():
+        func.cache_clear()
 
 
 def parse(
         config,
         default_total,
         default_start_date: datetime.date,
-        default_duration_str: str,
-        default_step_str: str,
+        default_duration_str: Union[str, DurationAst],
+        default_step_str: Union[str, StepAst],
         default_value: Decimal,
         default_formula_str,
 ) -> Tuple[PeriodicConfig, PeriodicConfigError]:
@@ -145,117 +174,75 @@ def parse(
     :param config:
     :param default_total:
     :param default_start_date:
-    :param default_duration_str:
-    :param default_step_str:
+    :param default_duration_str: a duration string, or an already parsed one such as DEFAULT_DURATION
+    :param default_step_str: a step string, or an already parsed one such as DEFAULT_STEP
     :param default_value:
     :param default_formula_str:
     :return:
     """
-    if isinstance(config, str):
-        match = CONFIG_STR_PATTERN.search(config)
-        if match:
-            total = match.group('total')
-            num = match.group('num')
-            unit_named = match.group('unit_named')
-            unit_named_shorten = match.group('unit_named_shorten')
-            date_start = match.group('date_start')
-            date_end = match.group('date_end')
-            step_num = match.group('step_num')
-            step_unit_named = match.group('step_unit_named')
-            step_unit_named_shorten = match.group('step_unit_named_shorten')
-            step_named = match.group('step_named')
-            value = match.group('value')
-            formula = match.group('formula')
-            __print_config_match_result(date_end, date_start, formula, num, step_named, step_num, step_unit_named,
-                                        step_unit_named_shorten, total, unit_named, unit_named_shorten, value)
-
-            total = Decimal(total if total else default_total)
-            if value:
-                if value.endswith('%'):
-                    salvage_value = Decimal(value[:-1]) / 100 * total
-                else:
-                    salvage_value = Decimal(value)
-            else:
-                salvage_value = default_value
-            start_date = parse_date_liberally(date_start, {}) if date_start else default_start_date
-
-            if num or unit_named or unit_named_shorten:
-                num = int(num) if num else 1
-                duration = get_duration(start_date, num, unit_named, unit_named_shorten)
-            elif date_end:
-                duration = (parse_date_liberally(date_end, {}) - start_date).days
-            else:
-                duration_math = CONFIG_STR_PATTERN_DURATION.match(default_duration_str)
-                if duration_math:
-                    num = duration_math.group('num')
-                    unit_named = duration_math.group('unit_named')
-                    unit_named_shorten = duration_math.group('unit_named_shorten')
-                    num = int(num) if num else 1
-                    duration = get_duration(start_date, num, unit_named, unit_named_shorten)
-                else:
-                    return None, PeriodicConfigError(None, 'fail to parse default duration: %s' % default_duration_str,
-                                                     None)
-
-            if step_num or step_named or step_unit_named or step_unit_named_shorten:
-                if step_named:
-                    steps = get_steps(start_date, duration, 1, step_named, None)
-                else:
-                    step_num = int(step_num) if step_num else 1
-                    steps = get_steps(start_date, duration, step_num, step_unit_named, step_unit_named_shorten)
-            else:
-                step_match = CONFIG_STR_PATTERN_STEP.match(default_step_str)
-                if step_match:
-                    step_num = step_match.group('step_num')
-                    step_unit_named = step_match.group('step_unit_named')
-                    step_unit_named_shorten = step_match.group('step_unit_named_shorten')
-                    step_named = step_match.group('step_named')
-                    if step_named:
-                        steps = get_steps(start_date, duration, 1, step_named, None)
-                    else:
-                        step_num = int(step_num) if step_num else 1
-                        steps = get_steps(start_date, duration, step_num, step_unit_named, step_unit_named_shorten)
-                else:
-                    return None, PeriodicConfigError(None, 'fail to parse default steps: %s' % default_step_str, None)
-
-            use_real_days_for_step_amount = next(
-                (unit for unit in [step_named, step_unit_named, step_unit_named_shorten] if unit is not None),
-                '').endswith('!')
-
-            config_obj = PeriodicConfig(
-                total=total,
-                start=start_date,
-                duration=duration,
-                steps=steps,
-                equal_amount=not use_real_days_for_step_amount,
-                salvage_value=salvage_value,
-                formula=formula if formula else default_formula_str
-            )
-            return config_obj, None
+    if not isinstance(config, str):
+        return None, None
+    config_ast, syntax_error = parse_config_str(config)
+    if config_ast is None:
+        return None, PeriodicConfigError(None, 'fail to parse: %s (%s)' % (config, syntax_error), None)
+
+    total = config_ast.total if config_ast.total is not None else Decimal(default_total)
+    if config_ast.value is not None:
+        if config_ast.value.percent:
+            salvage_value = config_ast.value.number / 100 * total
         else:
-            return None, PeriodicConfigError(None, 'fail to parse: %s' % config, None)
-    return None, None
-
-
-def __print_config_match_result(date_end, date_start, formula, num, step_named, step_num, step_unit_named,
-                                step_unit_named_shorten, total, unit_named, unit_named_shorten, value):
-    # sys.stderr.write('total: %s\n' % total)
-    # sys.stderr.write('num: %s\n' % num)
-    # sys.stderr.write('unit_named: %s\n' % unit_named)
-    # sys.stderr.write('unit_named_shorten: %s\n' % unit_named_shorten)
-    # sys.stderr.write('date_start: %s\n' % date_start)
-    # sys.stderr.write('date_end: %s\n' % date_end)
-    # sys.stderr.write('step_num: %s\n' % step_num)
-    # sys.stderr.write('step_unit_named: %s\n' % step_unit_named)
-    # sys.stderr.write('step_unit_named_shorten: %s\n' % step_unit_named_shorten)
-    # sys.stderr.write('step_named: %s\n' % step_named)
-    # sys.stderr.write('value: %s\n' % value)
-    # sys.stderr.write('formula: %s\n' % ear)
-    pass
+            salvage_value = config_ast.value.number
+    else:
+        salvage_value = default_value
+    start_date = config_ast.start or default_start_date
+
+    if config_ast.duration is not None:
+        duration = get_duration(start_date, config_ast.duration.num, config_ast.duration.unit, None)
+    elif config_ast.end is not None:
+        duration = (config_ast.end - start_date).days
+    else:
+        default_duration = parse_duration_str(default_duration_str) if isinstance(default_duration_str, str) \
+            else default_duration_str
+        if default_duration is None:
+            return None, PeriodicConfigError(None, 'fail to parse default duration: %s' % default_duration_str, None)
+        duration = get_duration(start_date, default_duration.num, default_duration.unit, None)
+
+    step = config_ast.step
+    if step is None:
+        step = parse_step_str(default_step_str) if isinstance(default_step_str, str) else default_step_str
+        if step is None:
+            return None, PeriodicConfigError(None, 'fail to parse default steps: %s' % default_step_str, None)
+    steps = get_steps_cached(start_date, duration, step.num, step.unit, None)
+
+    config_obj = PeriodicConfig(
+        total=total,
+        start=start_date,
+        duration=duration,
+        steps=steps,
+        equal_amount=not step.real_days,
+        salvage_value=salvage_value,
+        formula=config_ast.formula or default_formula_str
+    )
+    return config_obj, None
 
 
 @dataclass
 class PluginConfig:
     generate_until: Optional[datetime.date] = None
+    collapse_before: Optional[datetime.date] = None
+    profile: Optional[str] = None
+    cache: Optional[str] = None
+    cache_max_size: int = 256 * 1024 * 1024
+    incremental: bool = False
+    workers: int = 1
+    manifest: bool = False
+    step_ids: bool = False
+
+    def schedule_key(self) -> tuple:
+        """
+        The options which change the generated entries, for the schedule cache key
+        """
+        return self.generate_until, self.collapse_before, self.manifest, self.step_ids
 
     @staticmethod
     def from_string(config_str: str) -> 'PluginConfig':
@@ -275,4 +262,48 @@ class PluginConfig:
             raise RuntimeError('Bad "generate_until" value - it must be a valid date, formatted in ISO 8601 (e.g. '
                                '"2024-12-31") or the literal "today".')
 
+        try:
+            collapse_before_str = config_dict.get('collapse_before', None)
+            if collapse_before_str == 'today':
+                ret.collapse_before = datetime.date.today()
+            elif collapse_before_str:
+                ret.collapse_before = datetime.date.fromisoformat(collapse_before_str)
+        except (ValueError, TypeError):
+            raise RuntimeError('Bad "collapse_before" value - it must be a valid date, formatted in ISO 8601 (e.g. '
+                               '"2024-01-01") or the literal "today".')
+
+        profile = config_dict.get('profile', None)
+        if profile is not None and not isinstance(profile, str):
+            raise RuntimeError('Bad "profile" value - it must be "stderr" or an output file path.')
+        ret.profile = profile
+
+        cache = config_dict.get('cache', None)
+        if cache is not None and not isinstance(cache, str):
+            raise RuntimeError('Bad "cache" value - it must be a file path.')
+        ret.cache = cache
+        cache_max_size = config_dict.get('cache_max_size', ret.cache_max_size)
+        if not isinstance(cache_max_size, int) or cache_max_size <= 0:
+            raise RuntimeError('Bad "cache_max_size" value - it must be a positive number of bytes.')
+        ret.cache_max_size = cache_max_size
+
+        incremental = config_dict.get('incremental', False)
+        if not isinstance(incremental, bool):
+            raise RuntimeError('Bad "incremental" value - it must be True or False.')
+        ret.incremental = incremental
+
+        workers = config_dict.get('workers', ret.workers)
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers <= 0:
+            raise RuntimeError('Bad "workers" value - it must be a positive number of processes.')
+        ret.workers = workers
+
+        manifest = config_dict.get('manifest', False)
+        if not isinstance(manifest, bool):
+            raise RuntimeError('Bad "manifest" value - it must be True or False.')
+        ret.manifest = manifest
+
+        step_ids = config_dict.get('step_ids', False)
+        if not isinstance(step_ids, bool):
+            raise RuntimeError('Bad "step_ids" value - it must be True or False.')
+        ret.step_ids = step_ids
+
         return ret
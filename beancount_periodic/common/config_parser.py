@@ -0,0 +1,282 @@
+"""
+Tokenizer and parser of the config strings, e.g. `2000 - 3 Months @2021-10-10 / Weekly *line +20%`.
+
+    config   := [total '-'] [duration] ['@' date] ['~' date] ['/' step] ['*' formula] [('+' | '=') value]
+    duration := [integer] [unit]
+    step     := integer [unit ['!']] | named_step ['!']
+    unit     := Day | Week | Month | Quarter | Year, with an optional 's', or D | W | M | Q | Y
+    named_step := Daily | Weekly | Monthly | Quarterly | Yearly
+    value    := number ['%']
+
+The string is tokenized in one pass, then parsed by recursive descent without backtracking: every part is told
+apart by its first token, so the time is linear in the length of the string. Blanks are allowed between the tokens,
+but not inside a date, between '*' and the formula, a number and its '%', or a unit and its '!'.
+"""
+import datetime
+from decimal import Decimal
+from typing import List, NamedTuple, Optional
+
+UNITS = {'Day': 'D', 'Week': 'W', 'Month': 'M', 'Quarter': 'Q', 'Year': 'Y'}
+UNITS_SHORTEN = {'D': 'D', 'W': 'W', 'M': 'M', 'Q': 'Q', 'Y': 'Y'}
+NAMED_STEPS = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M', 'Quarterly': 'Q', 'Yearly': 'Y'}
+FORMULAS = ('linear', 'straight', 'line', 'load', 'work-load', 'accelerated-sum', 'sum', 'accelerated-declining',
+            'declining')
+SYMBOLS = '-@~/*+=%!'
+
+# token kinds
+NUMBER = 'number'
+WORD = 'word'
+SYMBOL = 'symbol'
+END = 'end'
+
+Token = NamedTuple('Token', [
+    ('kind', str),
+    ('text', str),
+    ('start', int),
+    ('end', int),
+])
+
+DurationAst = NamedTuple('DurationAst', [
+    ('num', int),
+    ('unit', Optional[str]),  # D, W, M, Q or Y; None for a number of days
+])
+
+StepAst = NamedTuple('StepAst', [
+    ('num', int),
+    ('unit', Optional[str]),  # D, W, M, Q or Y; None for a number of days
+    ('real_days', bool),  # '!': the step amounts are proportional to the days of the steps
+])
+
+ValueAst = NamedTuple('ValueAst', [
+    ('number', Decimal),
+    ('percent', bool),
+])
+
+ConfigAst = NamedTuple('ConfigAst', [
+    ('total', Optional[Decimal]),
+    ('duration', Optional[DurationAst]),
+    ('start', Optional[datetime.date]),
+    ('end', Optional[datetime.date]),
+    ('step', Optional[StepAst]),
+    ('formula', Optional[str]),
+    ('value', Optional[ValueAst]),
+])
+
+
+class ConfigSyntaxError(ValueError):
+    def __init__(self, message, position):
+        super().__init__('%s at position %d' % (message, position))
+        self.message = message
+        self.position = position
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    :return: the tokens, ending with an END token
+    :raise ConfigSyntaxError: on a character starting no token
+    """
+    tokens = []
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char.isspace():
+            i += 1
+        elif char.isdecimal():
+            start = i
+            i += 1
+            while i < length and text[i].isdecimal():
+                i += 1
+            # a fraction, only when the '.' is followed by a digit
+            if i + 1 < length and text[i] == '.' and text[i + 1].isdecimal():
+                i += 2
+                while i < length and text[i].isdecimal():
+                    i += 1
+            tokens.append(Token(NUMBER, text[start:i], start, i))
+        elif 'a' <= char <= 'z' or 'A' <= char <= 'Z':
+            start = i
+            i += 1
+            while i < length and ('a' <= text[i] <= 'z' or 'A' <= text[i] <= 'Z' or text[i] == '-'):
+                i += 1
+            tokens.append(Token(WORD, text[start:i], start, i))
+        elif char in SYMBOLS:
+            tokens.append(Token(SYMBOL, char, i, i + 1))
+            i += 1
+        else:
+            raise ConfigSyntaxError('unexpected %r' % char, i)
+    tokens.append(Token(END, '', length, length))
+    return tokens
+
+
+class _Parser:
+    __slots__ = ('tokens', 'i')
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.i = 0
+
+    def peek(self, offset=0) -> Token:
+        return self.tokens[min(self.i + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Token:
+        token = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def is_symbol(self, symbols, offset=0) -> bool:
+        token = self.peek(offset)
+        return token.kind == SYMBOL and token.text in symbols
+
+    def adjacent_symbol(self, symbol, previous: Token) -> bool:
+        """
+        Whether the next token is the symbol, right after the previous token
+        """
+        token = self.peek()
+        if token.kind == SYMBOL and token.text == symbol and token.start == previous.end:
+            self.i += 1
+            return True
+        return False
+
+    def error(self, expected, token: Token = None):
+        token = token or self.peek()
+        found = 'end of string' if token.kind == END else '%r' % token.text
+        raise ConfigSyntaxError('expected %s, found %s' % (expected, found), token.start)
+
+    def integer(self, expected) -> int:
+        token = self.next()
+        if token.kind != NUMBER or '.' in token.text:
+            self.error(expected, token)
+        return int(token.text)
+
+    def config(self) -> ConfigAst:
+        total = None
+        duration = None
+        start = None
+        end = None
+        step = None
+        formula = None
+        value = None
+
+        # a number followed by '-' is the total
+        if self.peek().kind == NUMBER and self.is_symbol('-', 1):
+            total = Decimal(self.next().text)
+            self.next()
+
+        token = self.peek()
+        if token.kind == NUMBER or token.kind == WORD:
+            duration = self.duration()
+        if self.is_symbol('@'):
+            self.next()
+            start = self.date()
+        if self.is_symbol('~'):
+            self.next()
+            end = self.date()
+        if self.is_symbol('/'):
+            self.next()
+            step = self.step()
+        if self.is_symbol('*'):
+            star = self.next()
+            token = self.next()
+            if token.kind != WORD or token.text not in FORMULAS or token.start != star.end:
+                self.error('a formula (%s)' % ', '.join(FORMULAS), token)
+            formula = token.text
+        if self.is_symbol('+='):
+            self.next()
+            token = self.next()
+            if token.kind != NUMBER:
+                self.error('a salvage value', token)
+            value = ValueAst(Decimal(token.text), self.adjacent_symbol('%', token))
+
+        if self.peek().kind != END:
+            self.error('end of string')
+        return ConfigAst(total, duration, start, end, step, formula, value)
+
+    def duration(self) -> DurationAst:
+        num = 1
+        unit = None
+        if self.peek().kind == NUMBER:
+            num = self.integer('a number of days or units')
+        token = self.peek()
+        if token.kind == WORD:
+            unit = self.unit(token, 'a duration unit (Day, Week, Month, Quarter, Year or D, W, M, Q, Y)')
+            self.next()
+        return DurationAst(num, unit)
+
+    @staticmethod
+    def unit(token: Token, expected) -> Optional[str]:
+        word = token.text
+        unit = UNITS_SHORTEN.get(word) or UNITS.get(word[:-1] if word.endswith('s') else word)
+        if unit is None:
+            raise ConfigSyntaxError('expected %s, found %r' % (expected, word), token.start)
+        return unit
+
+    def step(self, bare_unit=False) -> StepAst:
+        """
+        :param bare_unit: whether a unit without number is a step of 1 unit
+        """
+        token = self.next()
+        if token.kind == NUMBER:
+            if '.' in token.text:
+                self.error('a number of steps', token)
+            num = int(token.text)
+            unit = None
+            unit_token = self.peek()
+            if unit_token.kind == WORD:
+                unit = self.unit(unit_token, 'a step unit (Day, Week, Month, Quarter, Year or D, W, M, Q, Y)')
+                self.next()
+                return StepAst(num, unit, self.adjacent_symbol('!', unit_token))
+            return StepAst(num, unit, False)
+        if token.kind == WORD and token.text in NAMED_STEPS:
+            return StepAst(1, NAMED_STEPS[token.text], self.adjacent_symbol('!', token))
+        if token.kind == WORD and bare_unit:
+            unit = self.unit(token, 'a step unit (Day, Week, Month, Quarter, Year or D, W, M, Q, Y)')
+            return StepAst(1, unit, self.adjacent_symbol('!', token))
+        self.error('a step (Daily, Weekly, Monthly, Quarterly, Yearly or a number and unit)', token)
+
+    def date(self) -> datetime.date:
+        parts = []
+        previous = None
+        for digits in (4, 2, 2):
+            if previous is not None and not self.adjacent_symbol('-', previous):
+                self.error('a date as YYYY-MM-DD')
+            token = self.peek()
+            if token.kind != NUMBER or len(token.text) != digits or not token.text.isdecimal() \
+                    or (previous is not None and token.start != previous.end + 1):
+                self.error('a date as YYYY-MM-DD')
+            parts.append(int(token.text))
+            previous = self.next()
+        try:
+            return datetime.date(*parts)
+        except ValueError as e:
+            raise ConfigSyntaxError('invalid date: %s' % e, previous.end - 10)
+
+
+def parse_config_ast(text: str) -> ConfigAst:
+    """
+    :raise ConfigSyntaxError:
+    """
+    return _Parser(text).config()
+
+
+def parse_duration_ast(text: str) -> DurationAst:
+    """
+    Parse a duration alone, such as the default duration
+    :raise ConfigSyntaxError:
+    """
+    parser = _Parser(text)
+    duration = parser.duration()
+    if parser.peek().kind != END:
+        parser.error('end of string')
+    return duration
+
+
+def parse_step_ast(text: str) -> StepAst:
+    """
+    Parse a step alone, such as the default step, where a unit alone is a step of 1 unit
+    :raise ConfigSyntaxError:
+    """
+    parser = _Parser(text)
+    step = parser.step(bare_unit=True)
+    if parser.peek().kind != END:
+        parser.error('end of string')
+    return step
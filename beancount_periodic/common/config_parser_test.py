@@ -0,0 +1,194 @@
+import datetime
+import random
+import re
+import time
+import unittest
+from decimal import Decimal
+
+from .config import parse
+from .config_parser import *
+
+# The regex the parser replaced, the reference of the differential fuzzing
+RE_TOTAL = '\\s*(?P<total>\\d+(?:\\.\\d+)?)\\s*-'
+PART_DURATION_NAMED = "(?:Day|Week|Month|Quarter|Year)"
+PART_DURATION_NAMED_SHORTEN = "[DWMQY]"
+DURATION_NUM = f'(?P<num>\\d+)?\\s*(?:(?P<unit_named>{PART_DURATION_NAMED}s?)|(?P<unit_named_shorten>' \
+               f'{PART_DURATION_NAMED_SHORTEN}))?'
+RE_DATE_START = "@\\s*(?P<date_start>\\d{4}-\\d{2}-\\d{2})"
+RE_DATE_END = "~\\s*(?P<date_end>\\d{4}-\\d{2}-\\d{2})"
+RE_DURATION = f'(?:{DURATION_NUM}\\s*(?:{RE_DATE_START}\\s*)?(?:{RE_DATE_END})?)'
+RE_STEP_A = f'(?P<step_num>\\d+)\\s*(?:(?P<step_unit_named>{PART_DURATION_NAMED}s?[!]?)|(?P<step_unit_named_shorten>' \
+            f'{PART_DURATION_NAMED_SHORTEN}[!]?))?'
+RE_STEP_B = f'(?P<step_named>(?:Dai|Week|Month|Quarter|Year)ly[!]?)'
+RE_STEP = f'{RE_STEP_A}|{RE_STEP_B}'
+RE_VALUE = "[\\+\\=]\\s*(?P<value>\\d+(?:\\.\\d+)?%?)"
+RE_FORMULA = "\\s*\\*(?P<formula>linear|straight|line|load|work-load|accelerated-sum|sum|accelerated-declining" \
+             "|declining)"
+RE = fr'^\s*(?:{RE_TOTAL}\s*)?(?:{RE_DURATION}\s*)?(?:/\s*(?:{RE_STEP})\s*)?(?:{RE_FORMULA}\s*)?(?:{RE_VALUE}\s*)?$'
+REFERENCE_PATTERN = re.compile(RE)
+
+# the seeds of the fuzz corpus: the examples of the README and the tests
+SEED_CORPUS = [
+    '90',
+    '1 Year',
+    '1 Year /Monthly',
+    '1 Year @2022-04-01 /Monthly',
+    '2000 - 3 Months @ 2021-10-10 / Weekly +20%',
+    '@2022-01-01 ~2022-12-31 /Quarterly',
+    '5 Year /Yearly =10000',
+    '5 Year /Yearly *sum',
+    '5 Year /Yearly *accelerated-declining +10%',
+    '12000-1Y/1M!',
+    '1 Year /Monthly!',
+    '10 Days / 2 D',
+    '3Q/1Q *work-load',
+    '~2023-06-30 /7 Days! *linear =0.5',
+    'Year / Monthly',
+    '6 Month /Monthly',
+    '1.5-Y/Daily *straight',
+]
+FUZZ_ALPHABET = '0123456789 -@~/*+=%!.DWMQYaelsyinrkt\t ٣'
+FUZZ_FRAGMENTS = ['Year', 'Years', 'Monthly', 'Daily!', 'Quarter', '2022-04-01', '2022-02-30', '*line', '*linear',
+                  '*sum', ' / ', ' - ', '@', '~', '+20%', '=5', '!', '  ', '12', '1.5']
+
+
+def reference_ast(config: str):
+    """
+    The ConfigAst of the reference regex, None if it does not match, ValueError on an invalid date
+    """
+    match = REFERENCE_PATTERN.search(config)
+    if not match:
+        return None
+    groups = match.groupdict()
+
+    def to_date(value):
+        return datetime.date(*(int(part) for part in value.split('-'))) if value else None
+
+    unit = groups['unit_named'] or groups['unit_named_shorten']
+    duration = DurationAst(int(groups['num']) if groups['num'] else 1, unit[:1] if unit else None) \
+        if groups['num'] or unit else None
+    step_unit = groups['step_named'] or groups['step_unit_named'] or groups['step_unit_named_shorten']
+    if groups['step_named']:
+        step = StepAst(1, step_unit[:1], step_unit.endswith('!'))
+    elif groups['step_num']:
+        step = StepAst(int(groups['step_num']), step_unit[:1] if step_unit else None,
+                       bool(step_unit) and step_unit.endswith('!'))
+    else:
+        step = None
+    value = groups['value']
+    return ConfigAst(
+        total=Decimal(groups['total']) if groups['total'] is not None else None,
+        duration=duration,
+        start=to_date(groups['date_start']),
+        end=to_date(groups['date_end']),
+        step=step,
+        formula=groups['formula'],
+        value=ValueAst(Decimal(value.rstrip('%')), value.endswith('%')) if value is not None else None,
+    )
+
+
+def compose_config(rand):
+    """
+    A config made of random grammar parts, separated by random blanks
+    """
+    def blank():
+        return rand.choice(['', '', ' ', '  ', '\t'])
+
+    parts = []
+    if rand.random() < 0.3:
+        parts.append(rand.choice(['12000', '1.5', '90']) + blank() + '-')
+    if rand.random() < 0.7:
+        parts.append(rand.choice(['', '1', '12']) + blank() + rand.choice(['Year', 'Months', 'D', 'Q', 'Weeks', '']))
+    if rand.random() < 0.4:
+        parts.append('@' + blank() + rand.choice(['2022-04-01', '2021-12-31', '2022-02-30']))
+    if rand.random() < 0.3:
+        parts.append('~' + blank() + rand.choice(['2023-06-30', '2024-02-29']))
+    if rand.random() < 0.7:
+        parts.append('/' + blank() + rand.choice(['Monthly', 'Daily', 'Yearly!', '2 Weeks', '7', '1M!', '3 Q']))
+    if rand.random() < 0.3:
+        parts.append('*' + rand.choice(FORMULAS))
+    if rand.random() < 0.3:
+        parts.append(rand.choice('+=') + blank() + rand.choice(['20%', '10000', '0.5']))
+    return blank() + blank().join(parts) + blank()
+
+
+def fuzz_corpus(num, seed=0):
+    rand = random.Random(seed)
+    corpus = list(SEED_CORPUS)
+    while len(corpus) < num:
+        config = list(rand.choice(SEED_CORPUS) if rand.random() < 0.5 else compose_config(rand))
+        for i in range(rand.randint(0, 2)):
+            operation = rand.randrange(4)
+            position = rand.randint(0, len(config))
+            if operation == 0 and config:
+                del config[min(position, len(config) - 1)]
+            elif operation == 1:
+                config.insert(position, rand.choice(FUZZ_ALPHABET))
+            elif operation == 2 and config:
+                config[min(position, len(config) - 1)] = rand.choice(FUZZ_ALPHABET)
+            else:
+                config[position:position] = rand.choice(FUZZ_FRAGMENTS)
+        # long blank runs make the reference regex backtrack for seconds
+        corpus.append(re.sub(r'\s{4,}', '   ', ''.join(config))[:64])
+    return corpus
+
+
+class ConfigParserTest(unittest.TestCase):
+    def test_parse_config_ast(self):
+        self.assertEqual(parse_config_ast('2000 - 3 Months @ 2021-10-10 / Weekly! *sum +20%'), ConfigAst(
+            total=Decimal('2000'),
+            duration=DurationAst(3, 'M'),
+            start=datetime.date(2021, 10, 10),
+            end=None,
+            step=StepAst(1, 'W', True),
+            formula='sum',
+            value=ValueAst(Decimal('20'), True),
+        ))
+        self.assertEqual(parse_config_ast(''), ConfigAst(None, None, None, None, None, None, None))
+        self.assertEqual(parse_duration_ast('M'), DurationAst(1, 'M'))
+        self.assertEqual(parse_step_ast('D'), StepAst(1, 'D', False))
+        self.assertEqual(parse_step_ast('2 Weeks!'), StepAst(2, 'W', True))
+
+    def test_error_position(self):
+        for config, position in [('1 Yaer /Monthly', 2), ('1 Year /Month', 8), ('1 Year @2022-4-01', 13),
+                                 ('1 Year /Monthly *lin', 17), ('1 Year /Monthly +', 17), ('1 Year # x', 7),
+                                 ('1 Year @2022-02-30', 8), ('1 Year /Monthly 2', 16)]:
+            with self.assertRaises(ConfigSyntaxError) as context:
+                parse_config_ast(config)
+            self.assertEqual(context.exception.position, position, config)
+
+        config, config_err = parse('1 Yaer', Decimal('100'), datetime.date(2022, 1, 1), 'M', 'D', Decimal('0'), 'line')
+        self.assertIsNone(config)
+        self.assertEqual(config_err.message, "fail to parse: 1 Yaer (expected a duration unit (Day, Week, Month, "
+                                             "Quarter, Year or D, W, M, Q, Y), found 'Yaer' at position 2)")
+
+    def test_default_step(self):
+        config, config_err = parse('1 Year', Decimal('365'), datetime.date(2022, 1, 1), 'M', 'D', Decimal('0'),
+                                   'line')
+        self.assertEqual(len(config.steps), 365)
+
+    def test_fuzz(self):
+        for config in fuzz_corpus(4000):
+            try:
+                expected = reference_ast(config)
+            except ValueError:  # the regex does not check the dates
+                with self.assertRaises(ConfigSyntaxError, msg=config):
+                    parse_config_ast(config)
+                continue
+            if expected is None:
+                with self.assertRaises(ConfigSyntaxError, msg=config):
+                    parse_config_ast(config)
+            else:
+                self.assertEqual(parse_config_ast(config), expected, config)
+
+    def test_linear_time(self):
+        # the reference regex takes minutes on this one
+        config = '1' + ' ' * 100000 + 'x'
+        start = time.perf_counter()
+        with self.assertRaises(ConfigSyntaxError):
+            parse_config_ast(config)
+        self.assertLess(time.perf_counter() - start, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
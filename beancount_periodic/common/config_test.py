@@ -49,6 +49,27 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(get_steps(datetime.datetime.strptime('2020-11-30', '%Y-%m-%d'), 365, 1, 'Month', None),
                          [(30, 1), (31, 1), (29, 1), (30, 1), (31, 1), (30, 1), (31, 1), (30, 1), (31, 1), (31, 1), (30, 1), (31, 1)])
 
+    def test_parse_cache(self):
+        cache_clear()
+        default_start_date = datetime.date(2022, 4, 1)
+        for total in [1200, 2400, 3600]:
+            config, config_err = parse('1 Year /Monthly', default_total=total, default_start_date=default_start_date,
+                                       default_duration_str='M', default_step_str='D', default_value=Decimal('0'),
+                                       default_formula_str='line')
+            self.assertEqual(config.total, total)
+            self.assertEqual(len(config.steps), 12)
+        info = cache_info()
+        self.assertEqual(info['config']['misses'], 1)
+        self.assertEqual(info['config']['hits'], 2)
+        self.assertEqual(info['steps']['misses'], 1)
+        self.assertEqual(info['steps']['hits'], 2)
+
+        config, config_err = parse('1 Year /Monthly', default_total=1200, default_start_date=datetime.date(2022, 5, 1),
+                                   default_duration_str='M', default_step_str='D', default_value=Decimal('0'),
+                                   default_formula_str='line')
+        self.assertEqual(config.start, datetime.date(2022, 5, 1))
+        self.assertEqual(cache_info()['steps']['misses'], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+"""
+Stable identifiers of the generated entries, turned on by the `step_ids` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'step_ids':True}"
+
+Every generated transaction gets a `periodic_id` meta, a short hash of the source key, the plugin name, the posting
+group of the source and the step number. The source key is the hash of the content of the source entry (see
+source_fingerprint) and the ordinal of the source among the identical sources before it, so identical sources still
+get distinct identifiers. The identifier does not depend on the position of the source in the files, so it is the same
+across loads as long as the source entry is not edited, and two versions of a ledger can be diffed by identifier.
+A collapsed entry (see collapse_before) is identified by the range of its steps.
+"""
+import hashlib
+from typing import List, Optional
+
+from .materialize import source_fingerprint
+
+ID_META_KEY = 'periodic_id'
+# hex digits, 64 bits
+ID_LENGTH = 16
+
+
+def get_source_key(entry, ordinal: int = 0) -> str:
+    """
+    :param entry: the source entry, before the plugin modified it
+    :param ordinal: the number of identical sources before the entry
+    """
+    return '%s:%d' % (source_fingerprint(entry), ordinal)
+
+
+def get_source_keys(entries) -> List[str]:
+    """
+    The source keys of the entries, the identical entries are numbered in the order of the list
+    """
+    ordinals = {}
+    source_keys = []
+    for entry in entries:
+        fingerprint = source_fingerprint(entry)
+        ordinal = ordinals.get(fingerprint, 0)
+        ordinals[fingerprint] = ordinal + 1
+        source_keys.append('%s:%d' % (fingerprint, ordinal))
+    return source_keys
+
+
+def get_id_prefix(source_key: str, plugin_name: str, group_i: int = 0) -> str:
+    """
+    The part of the identifiers shared by the steps of a schedule
+    :param source_key: see get_source_key
+    :param plugin_name:
+    :param group_i: index of the posting group of the schedule in the source entry, 0 for the schedules of whole entries
+    """
+    return '%s:%s:%d:' % (source_key, plugin_name, group_i)
+
+
+def get_step_id(id_prefix: str, first_step: int, last_step: Optional[int] = None) -> str:
+    """
+    :param id_prefix: see get_id_prefix
+    :param first_step: 1-based step number
+    :param last_step: 1-based number of the last step of a collapsed entry
+    """
+    if last_step is None or last_step == first_step:
+        step_key = '%d' % first_step
+    else:
+        step_key = '%d-%d' % (first_step, last_step)
+    return hashlib.sha256((id_prefix + step_key).encode('utf-8')).hexdigest()[:ID_LENGTH]
+
+
+def create_id_meta(entry_meta, id_prefix: Optional[str], first_step: int, last_step: Optional[int] = None):
+    """
+    :return: a copy of the meta of the step entries with the identifier of the step, the meta itself if id_prefix is
+    None
+    """
+    if id_prefix is None:
+        return entry_meta
+    return {**entry_meta, ID_META_KEY: get_step_id(id_prefix, first_step, last_step)}
@@ -0,0 +1,83 @@
+"""
+Index of the candidate entries of the plugins, built by a single scan of the ledger.
+
+Usually less than 1% of the transactions carry a periodic meta key, so the plugins look the candidates up in the
+index instead of reading the meta of every entry and posting. When the plugins are chained by the periodic plugin,
+the index is built once, and every plugin updates it with the entries it removed and generated.
+"""
+from typing import Iterable, List, Set
+
+from beancount.core import data
+
+from .materialize import is_materialized_marker
+from .utils import exclude_entries
+from .utils import merge_entries
+
+PERIODIC_META_KEYS = ('recur', 'split', 'amortize', 'depreciate')
+
+
+def get_meta_keys(entry: data.Transaction, meta_keys: frozenset) -> Set[str]:
+    """
+    The meta keys carried by the entry or its postings, a set check on every meta
+    :param meta_keys: the keys looked up
+    :return: an empty set for the entries carrying none of the keys
+    """
+    found = set()
+    if entry.meta and not meta_keys.isdisjoint(entry.meta):
+        found.update(meta_keys.intersection(entry.meta))
+    for posting in entry.postings:
+        if posting.meta and not meta_keys.isdisjoint(posting.meta):
+            found.update(meta_keys.intersection(posting.meta))
+    return found
+
+
+class CandidateIndex:
+    """
+    The transactions carrying each meta key, in ledger order, and the fingerprints of the materialized sources.
+    A transaction is a candidate as soon as the key is in its meta or in the meta of one of its postings, the plugins
+    still check the value of the key.
+    """
+    __slots__ = ('meta_keys', 'candidates', 'materialized')
+
+    def __init__(self, meta_keys: Iterable[str] = PERIODIC_META_KEYS):
+        self.meta_keys = frozenset(meta_keys)
+        self.candidates = {key: [] for key in self.meta_keys}
+        self.materialized = set()
+
+    @classmethod
+    def scan(cls, entries: data.Entries, meta_keys: Iterable[str] = PERIODIC_META_KEYS) -> 'CandidateIndex':
+        index = cls(meta_keys)
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                index.add(entry)
+            elif is_materialized_marker(entry):
+                index.materialized.add(entry.values[0].value)
+        return index
+
+    def add(self, entry: data.Transaction) -> bool:
+        """
+        Append the entry to the candidates of the keys it carries, the entries are added in ledger order
+        :return: whether the entry is a candidate
+        """
+        keys = get_meta_keys(entry, self.meta_keys)
+        for key in keys:
+            self.candidates[key].append(entry)
+        return bool(keys)
+
+    def get(self, meta_key: str) -> List[data.Transaction]:
+        return self.candidates.get(meta_key, [])
+
+    def update(self, removed_entries, new_entries):
+        """
+        Follow the changes of the ledger made by a plugin, keeping the ledger order of the candidates
+        :param removed_entries: the entries removed from the ledger
+        :param new_entries: the entries merged into the ledger, by merge_entries
+        """
+        new_candidates = {key: [] for key in self.meta_keys}
+        for entry in new_entries:
+            if isinstance(entry, data.Transaction):
+                for key in get_meta_keys(entry, self.meta_keys):
+                    new_candidates[key].append(entry)
+        for key in self.meta_keys:
+            self.candidates[key] = merge_entries(exclude_entries(self.candidates[key], removed_entries),
+                                                 new_candidates[key])
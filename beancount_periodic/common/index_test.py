@@ -0,0 +1,53 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from beancount.core import data
+
+from .index import *
+from .materialize import create_materialized_marker
+
+
+def make_entry(narration, date=datetime.date(2022, 1, 1), lineno=0, meta=None, posting_meta=None):
+    posting = data.Posting('Expenses:Rent', data.Amount(Decimal('10'), 'USD'), None, None, None,
+                           dict(posting_meta or {}, lineno=lineno))
+    return data.Transaction(meta=dict(meta or {}, lineno=lineno), date=date, flag='*', payee=None,
+                            narration=narration, tags=frozenset(), links=frozenset(), postings=[posting])
+
+
+class CandidateIndexTest(unittest.TestCase):
+    def test_scan(self):
+        plain = make_entry('plain')
+        recurring = make_entry('recur', meta={'recur': '1 Year /Monthly'})
+        amortized = make_entry('amortize', posting_meta={'amortize': '1 Year /Monthly'})
+        both = make_entry('both', meta={'split': '3 Months'}, posting_meta={'amortize': '1 Year /Monthly'})
+        marker = create_materialized_marker(recurring, 'abc', 'ledger.bean')
+
+        index = CandidateIndex.scan([plain, recurring, amortized, marker, both])
+        self.assertEqual(index.get('recur'), [recurring])
+        self.assertEqual(index.get('split'), [both])
+        self.assertEqual([entry.narration for entry in index.get('amortize')], ['amortize', 'both'])
+        self.assertEqual(index.get('depreciate'), [])
+        self.assertEqual(index.get('other'), [])
+        self.assertEqual(index.materialized, {'abc'})
+        self.assertFalse(CandidateIndex().add(plain))
+
+    def test_update(self):
+        entries = [make_entry(str(i), datetime.date(2022, 1, 1) + datetime.timedelta(days=i * 2), i,
+                              posting_meta={'amortize': 'Y'})
+                   for i in range(5)]
+        new_entries = [make_entry('new %d' % i, datetime.date(2022, 1, 1) + datetime.timedelta(days=i), 5,
+                                  posting_meta={'amortize': 'Y'} if i % 2 else None)
+                       for i in reversed(range(10))]
+
+        index = CandidateIndex.scan(entries)
+        index.update(entries[:2], new_entries)
+        expected = [entry for entry in entries[2:] + new_entries if 'amortize' in entry.postings[0].meta]
+        expected.sort(key=data.entry_sortkey)
+        self.assertEqual(len(index.get('amortize')), len(expected))
+        for entry, expected_entry in zip(index.get('amortize'), expected):
+            self.assertIs(entry, expected_entry)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Manifest of the generated schedules, turned on by the `manifest` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'manifest':True}"
+
+Every source schedule gets a custom directive, dated as the source entry, so the downstream tools can list the
+schedules without parsing the narrations of the generated entries:
+
+    2022-03-31 custom "periodic-schedule" "amortize" "1 Year @2022-04-01 /Monthly" Equity:Amortization:Home:Rent
+      account: "Expenses:Home:Rent"
+      currency: "USD"
+      total: 12000
+      start: 2022-04-01
+      duration: 365
+      steps: 12
+      generated: 12
+      truncated: FALSE
+      equal_amount: TRUE
+      salvage_value: 0
+      formula: "line"
+
+The values are the plugin name, the config string and, for amortize and depreciate, the account of the generated
+postings. A schedule of amortize or depreciate is the one of a source posting, which also gives the account and
+currency meta; recur and split have one schedule per source entry. `generated` is the number of steps starting on or
+before generate_until, `truncated` whether it is less than `steps`.
+"""
+import datetime
+from decimal import Decimal
+from typing import List, NamedTuple, Optional
+
+from beancount.core import account, data
+
+from . import PeriodicConfig
+from . import ValueType
+
+SCHEDULE_TYPE = 'periodic-schedule'
+
+Schedule = NamedTuple('Schedule', [
+    ('config_str', str),
+    ('config', PeriodicConfig),
+    ('posting', Optional[data.Posting]),  # the source posting, None for the schedules of whole entries
+    ('account', Optional[str]),  # the account of the generated postings
+])
+
+
+def is_schedule_entry(entry) -> bool:
+    return isinstance(entry, data.Custom) and entry.type == SCHEDULE_TYPE
+
+
+def restore_account_values(entries):
+    """
+    Bind the dtype of the account values of the schedule directives to account.TYPE again, in place. The printer
+    tells the account values by identity, which is lost when the directives are pickled (worker processes, cache).
+    """
+    for entry in entries:
+        if is_schedule_entry(entry):
+            for i, value in enumerate(entry.values):
+                if value.dtype == account.TYPE and value.dtype is not account.TYPE:
+                    entry.values[i] = ValueType(value.value, account.TYPE)
+
+
+def count_steps_until(config: PeriodicConfig, generate_until: Optional[datetime.date]) -> int:
+    """
+    :return: the number of steps starting on or before generate_until, all of them if None
+    """
+    if generate_until is None:
+        return len(config.steps)
+    count = 0
+    start_date = config.start
+    for step_days, step_ratio in config.steps:
+        if start_date > generate_until:
+            break
+        count += 1
+        start_date += datetime.timedelta(days=step_days)
+    return count
+
+
+def create_schedule_entry(plugin_name: str, entry: data.Transaction, schedule: Schedule,
+                          generate_until: Optional[datetime.date] = None) -> data.Custom:
+    config = schedule.config
+    source_meta = schedule.posting.meta if schedule.posting is not None else entry.meta
+    meta = data.new_metadata(source_meta['filename'], source_meta['lineno'])
+    values = [ValueType(plugin_name, str), ValueType(schedule.config_str, str)]
+    if schedule.account is not None:
+        values.append(ValueType(schedule.account, account.TYPE))
+    if schedule.posting is not None:
+        meta['account'] = schedule.posting.account
+        meta['currency'] = schedule.posting.units.currency
+    steps = len(config.steps)
+    generated = count_steps_until(config, generate_until)
+    meta.update({
+        'total': config.total,
+        'start': config.start,
+        'duration': Decimal(config.duration),
+        'steps': Decimal(steps),
+        'generated': Decimal(generated),
+        'truncated': generated < steps,
+        'equal_amount': config.equal_amount,
+        'salvage_value': config.salvage_value,
+        'formula': config.formula,
+    })
+    return data.Custom(meta, entry.date, SCHEDULE_TYPE, values)
+
+
+def create_schedule_entries(plugin_name: str, entry: data.Transaction, schedules: List[Schedule],
+                            generate_until: Optional[datetime.date] = None) -> List[data.Custom]:
+    return [create_schedule_entry(plugin_name, entry, schedule, generate_until) for schedule in schedules]
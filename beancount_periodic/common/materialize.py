@@ -0,0 +1,71 @@
+"""
+Markers of the sources whose generated entries are written to an include file by the bean-periodic command.
+
+Every materialized source gets a custom directive carrying the fingerprint of the source entry:
+
+    2022-01-01 custom "periodic-materialized" "5f0c..."
+
+The plugins skip the step generation of the sources with a marker: recur and split only remove the source,
+amortize only moves the amortized postings, depreciate leaves it as is.
+The fingerprint does not depend on the position of the entry in the ledger, nor on the plugin version or options,
+so the markers stay valid as long as the source entry is not edited.
+"""
+import hashlib
+from typing import Set
+
+from beancount.core import data
+
+from . import ValueType
+
+MATERIALIZED_TYPE = 'periodic-materialized'
+
+_IGNORED_META_KEYS = ('filename', 'lineno')
+
+
+def _meta_key(meta):
+    if not meta:
+        return ()
+    return tuple(sorted((key, repr(value)) for key, value in meta.items() if key not in _IGNORED_META_KEYS))
+
+
+def source_fingerprint(entry: data.Transaction) -> str:
+    """
+    Stable hash of the content of the source entry
+    :param entry: the source entry, before any plugin modified it
+    :return: hex digest
+    """
+    content = (
+        entry.date,
+        entry.flag,
+        entry.payee,
+        entry.narration,
+        tuple(sorted(entry.tags or ())),
+        tuple(sorted(entry.links or ())),
+        _meta_key(entry.meta),
+        tuple((posting.account, posting.units, posting.cost, posting.price, posting.flag, _meta_key(posting.meta))
+              for posting in entry.postings),
+    )
+    return hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+
+
+def is_materialized_marker(entry) -> bool:
+    return isinstance(entry, data.Custom) and entry.type == MATERIALIZED_TYPE and bool(entry.values)
+
+
+def get_materialized_fingerprints(entries: data.Entries) -> Set[str]:
+    """
+    :return: the fingerprints of the materialized-source markers of the ledger
+    """
+    return {entry.values[0].value for entry in entries if is_materialized_marker(entry)}
+
+
+def create_materialized_marker(entry: data.Transaction, fingerprint: str, filename: str) -> data.Custom:
+    """
+    The marker of a materialized source, dated as the source
+    """
+    return data.Custom(data.new_metadata(filename, 0), entry.date, MATERIALIZED_TYPE,
+                       [ValueType(fingerprint, str)])
+
+
+def is_materialized(entry: data.Transaction, materialized: Set[str]) -> bool:
+    return bool(materialized) and source_fingerprint(entry) in materialized
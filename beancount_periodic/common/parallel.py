@@ -0,0 +1,60 @@
+"""
+Expansion of the source entries in worker processes.
+
+Turned on by the `workers` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'workers':8}"
+
+The expansion of a source entry depends only on the entry and on inputs shared by the whole run (plugin config,
+account types, depreciate_account index), which are sent once to every worker. The source entries are sent in
+chunks and the results come back in the order of the entries, so the generated entries and the errors are in the
+same order as with the serial loop. Below PARALLEL_MIN_ENTRIES source entries the process start-up costs more than
+it saves and the plugins stay serial.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from .manifest import restore_account_values
+
+PARALLEL_MIN_ENTRIES = 256
+CHUNKS_PER_WORKER = 4
+
+_WORKER_CONTEXT = None
+
+
+def use_parallel(plugin_config, entries_num) -> bool:
+    return plugin_config.workers > 1 and entries_num >= PARALLEL_MIN_ENTRIES
+
+
+def _set_worker_context(context):
+    global _WORKER_CONTEXT
+    _WORKER_CONTEXT = context
+
+
+def get_worker_context():
+    """
+    The context given to expand_parallel, in a worker process
+    """
+    return _WORKER_CONTEXT
+
+
+def split_chunks(entries, workers):
+    chunk_size = max(1, -(-len(entries) // (workers * CHUNKS_PER_WORKER)))
+    return [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+
+
+def expand_parallel(expand_chunk, entries, context, workers):
+    """
+    :param expand_chunk: module level function(entries) -> [(postings, generated entries, errors)] per entry, run in
+    the worker processes, reading the context with get_worker_context()
+    :param entries: source entries
+    :param context: picklable inputs shared by all the entries
+    :param workers: number of processes
+    :return: iterator of (postings, generated entries, errors), in the order of the entries
+    """
+    chunks = split_chunks(entries, workers)
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_set_worker_context,
+                             initargs=(context,)) as executor:
+        for chunk_results in executor.map(expand_chunk, chunks):
+            for postings, new_entries, errors in chunk_results:
+                restore_account_values(new_entries)
+                yield postings, new_entries, errors
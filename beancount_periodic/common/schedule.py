@@ -0,0 +1,177 @@
+"""
+Per-step weights of the depreciation formulas.
+
+The straight-line formulas (`linear`, `straight`, `line`) keep the simple per-step computation of build_steps and
+have no weight vector. `load`/`work-load` need the workload of every step, which the config string cannot express
+yet, so they are straight-line too. `sum`/`accelerated-sum` (sum of the years' digits) and
+`declining`/`accelerated-declining` (double declining balance, switching to straight-line when it gives more) get a
+weight vector computed once per schedule and shared by every posting using it.
+"""
+import datetime
+import itertools
+from decimal import Decimal
+from typing import Iterator, Optional, Tuple
+
+from . import PeriodicConfig
+from .allocation import allocate_scaled
+from .allocation import can_allocate_scaled
+from .number import remove_exponent_zero
+from .number import round_and_remainder
+from .number import smart_place_num
+from .steps import Steps
+
+FORMULAS_SUM = ('sum', 'accelerated-sum')
+FORMULAS_DECLINING = ('declining', 'accelerated-declining')
+SCHEDULE_CACHE_SIZE = 1024
+
+# (steps key, duration, equal_amount, formula, salvage ratio) -> weights
+_STEP_WEIGHTS_CACHE = {}
+
+
+def get_step_weights(config: PeriodicConfig) -> Optional[Tuple[Decimal, ...]]:
+    """
+    The share of the depreciable amount (total - salvage value) of every step
+    :param config:
+    :return: tuple of weights, or None for the straight-line formulas
+    """
+    if config.formula not in FORMULAS_SUM and config.formula not in FORMULAS_DECLINING:
+        return None
+    salvage_ratio = config.salvage_value / config.total if config.total else Decimal('0')
+    if not isinstance(config.steps, Steps):
+        return compute_step_weights(config.steps, config.duration, config.equal_amount, config.formula, salvage_ratio)
+    key = (config.steps.key, config.duration, config.equal_amount, config.formula, salvage_ratio)
+    weights = _STEP_WEIGHTS_CACHE.get(key)
+    if weights is None:
+        if len(_STEP_WEIGHTS_CACHE) >= SCHEDULE_CACHE_SIZE:
+            _STEP_WEIGHTS_CACHE.clear()
+        weights = compute_step_weights(config.steps, config.duration, config.equal_amount, config.formula,
+                                       salvage_ratio)
+        _STEP_WEIGHTS_CACHE[key] = weights
+    return weights
+
+
+def cache_clear():
+    _STEP_WEIGHTS_CACHE.clear()
+
+
+def iter_step_amounts(config: PeriodicConfig) -> Iterator[Tuple[int, datetime.date, int, Decimal]]:
+    """
+    The amount of every step of the schedule, rounded as the generated postings. The rounding remainder is carried
+    to the next steps and the last step takes what is left, so the amounts sum up to total - salvage value.
+    :param config:
+    :return: iterator of (step index, step date, step days, amount)
+    """
+    total = config.total - config.salvage_value
+    if config.equal_amount:
+        place_num = smart_place_num(total, len(config.steps))
+    else:
+        place_num = smart_place_num(total, config.duration)
+
+    if get_step_weights(config) is None and can_allocate_scaled(config, total, place_num):
+        steps_num = 0
+        for step in allocate_scaled(config, total, place_num):
+            if step is None:
+                break
+            yield step
+            steps_num += 1
+        else:
+            return
+        # close to a rounding tie, the Decimal loop decides
+        yield from itertools.islice(_iter_step_amounts_decimal(config, total, place_num), steps_num, None)
+        return
+
+    yield from _iter_step_amounts_decimal(config, total, place_num)
+
+
+def _iter_step_amounts_decimal(config: PeriodicConfig, total, place_num):
+    amount_remainder = remove_exponent_zero(total)
+    start_date = config.start
+
+    round_remainder = Decimal('0')
+    step_num = sum_step_ratio(config)
+    steps_len = len(config.steps)
+    step_weights = get_step_weights(config)
+    for step_i, (step_days, step_ratio) in enumerate(config.steps):
+        if step_i < steps_len - 1:
+            if step_weights is not None:
+                step_amount, remainder = round_and_remainder(step_weights[step_i] * total, place_num)
+            elif config.equal_amount:
+                step_amount, remainder = round_and_remainder(step_ratio * total / step_num, place_num)
+            else:
+                step_amount, remainder = round_and_remainder(Decimal(step_days) / config.duration * total,
+                                                             place_num)
+
+            round_remainder_amount, round_remainder_remainder = round_and_remainder(round_remainder, place_num)
+            if abs(round_remainder_amount) > 0:
+                step_amount += round_remainder_amount
+                round_remainder = round_remainder_remainder
+
+            round_remainder += remainder
+            amount_remainder -= step_amount
+        else:  # the last step
+            step_amount = amount_remainder
+        yield step_i, start_date, step_days, remove_exponent_zero(step_amount)
+        start_date += datetime.timedelta(days=step_days)
+
+
+def sum_step_ratio(config):
+    if isinstance(config.steps, Steps):
+        return config.steps.ratio_sum
+    step_num = Decimal('0')
+    for step_days, step_ratio in config.steps:
+        step_num += step_ratio
+    return step_num
+
+
+def get_time_shares(steps, duration, equal_amount):
+    """
+    The length of every step, in full steps: the step ratio, or the real days of the step when equal_amount is off
+    """
+    ratios = [Decimal(step_ratio) for step_days, step_ratio in steps]
+    if equal_amount or not duration:
+        return ratios
+    life = sum(ratios, Decimal('0'))
+    return [Decimal(step_days) * life / duration for step_days, step_ratio in steps]
+
+
+def compute_step_weights(steps, duration, equal_amount, formula, salvage_ratio=Decimal('0')):
+    """
+    :param steps: (days, ratio) of every step
+    :param duration: days
+    :param equal_amount:
+    :param formula: one of FORMULAS_SUM or FORMULAS_DECLINING
+    :param salvage_ratio: salvage value / total, used by the declining balance
+    :return: tuple of weights
+    """
+    shares = get_time_shares(steps, duration, equal_amount)
+    if formula in FORMULAS_SUM:
+        return _sum_of_digits_weights(shares)
+    return _declining_balance_weights(shares, salvage_ratio)
+
+
+def _sum_of_digits_weights(shares):
+    steps_len = len(shares)
+    digits = [(steps_len - i) * share for i, share in enumerate(shares)]
+    digits_sum = sum(digits, Decimal('0'))
+    if not digits_sum:
+        return tuple(Decimal('0') for _ in shares)
+    return tuple(digit / digits_sum for digit in digits)
+
+
+def _declining_balance_weights(shares, salvage_ratio):
+    depreciable = 1 - salvage_ratio
+    if depreciable <= 0:
+        return tuple(Decimal('0') for _ in shares)
+    life = sum(shares, Decimal('0'))
+    rate = 2 / life
+    book = Decimal('1')
+    remaining_life = life
+    weights = []
+    for share in shares:
+        declining = book * rate * share
+        straight = (book - salvage_ratio) * share / remaining_life if remaining_life > 0 else book - salvage_ratio
+        amount = min(max(declining, straight), book - salvage_ratio)
+        weights.append(amount / depreciable)
+        book -= amount
+        remaining_life -= share
+    return tuple(weights)
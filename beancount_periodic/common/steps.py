@@ -0,0 +1,184 @@
+import abc
+import calendar
+import datetime
+from collections.abc import Sequence
+from decimal import Decimal
+
+
+def add_months(start_date, months):
+    """
+    Same as start_date + relativedelta(months=months), without building a relativedelta
+    :param start_date: date or datetime
+    :param months:
+    :return: the date moved by the months, the day clamped to the end of the month
+    """
+    year, month = divmod(start_date.month - 1 + months, 12)
+    year += start_date.year
+    month += 1
+    day = min(start_date.day, calendar.monthrange(year, month)[1])
+    return start_date.replace(year=year, month=month, day=day)
+
+
+class Steps(Sequence, abc.ABC):
+    """
+    Lazy sequence of (days, ratio) steps: every step but the last is a full one with ratio 1, the last one may be
+    a partial step. The count and the ratio sum are known without generating the steps.
+    """
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def _full_step(self, step_i):
+        """
+        The (days, ratio) of the full step step_i
+        """
+
+    def __len__(self):
+        return self.full_num + (1 if self.remainder > 0 else 0)
+
+    def __getitem__(self, step_i):
+        if isinstance(step_i, slice):
+            return [self[i] for i in range(*step_i.indices(len(self)))]
+        if step_i < 0:
+            step_i += len(self)
+        if 0 <= step_i < self.full_num:
+            return self._full_step(step_i)
+        if step_i == self.full_num and self.remainder > 0:
+            return self.remainder, self.remainder_ratio
+        raise IndexError('step index out of range')
+
+    @property
+    def ratio_sum(self):
+        """
+        Same as summing the ratio of every step
+        """
+        return Decimal(self.full_num) + self.remainder_ratio if self.remainder > 0 else Decimal(self.full_num)
+
+    @property
+    @abc.abstractmethod
+    def days_sum(self):
+        """
+        Same as summing the days of every step
+        """
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, list(self))
+
+
+class FixedSteps(Steps):
+    """
+    Steps of a fixed length in days
+    """
+    __slots__ = ('step', 'full_num', 'remainder', 'remainder_ratio')
+
+    def __init__(self, duration, step):
+        self.step = step
+        if duration > 0:
+            self.full_num, self.remainder = divmod(duration, step)
+        else:
+            self.full_num, self.remainder = 0, 0
+        self.remainder_ratio = Decimal(self.remainder) / step if self.remainder > 0 else Decimal('0')
+
+    def _full_step(self, step_i):
+        return self.step, 1
+
+    @property
+    def key(self):
+        """
+        Hashable identity of the steps, for caches keyed by schedule
+        """
+        return 'fixed', self.step, self.full_num, self.remainder
+
+    def __iter__(self):
+        full_step = (self.step, 1)
+        for _ in range(self.full_num):
+            yield full_step
+        if self.remainder > 0:
+            yield self.remainder, self.remainder_ratio
+
+    @property
+    def days_sum(self):
+        return self.full_num * self.step + self.remainder
+
+
+class CalendarSteps(Steps):
+    """
+    Steps of calendar months (a quarter is 3 months, a year is 12). The boundary of step i is computed directly
+    from the start date, so the days of the month are never accumulated one by one.
+    """
+    __slots__ = ('start_date', 'months', 'full_num', 'remainder', 'remainder_ratio', '_days_sum')
+
+    def __init__(self, start_date, duration, months):
+        self.start_date = start_date
+        self.months = months
+        start_ordinal = start_date.toordinal()
+        end_ordinal = start_ordinal + duration
+        if duration > 0:
+            end_date = datetime.date.fromordinal(end_ordinal)
+            full_num = max(((end_date.year - start_date.year) * 12 + end_date.month - start_date.month) // months, 0)
+            while full_num > 0 and self._boundary(full_num) > end_ordinal:
+                full_num -= 1
+            while self._boundary(full_num + 1) <= end_ordinal:
+                full_num += 1
+            last_ordinal = self._boundary(full_num)
+            self.full_num = full_num
+            self.remainder = end_ordinal - last_ordinal
+            self.remainder_ratio = Decimal(self.remainder) / (self._boundary(full_num + 1) - last_ordinal) \
+                if self.remainder > 0 else Decimal('0')
+            self._days_sum = duration
+        else:
+            self.full_num, self.remainder, self.remainder_ratio = 0, 0, Decimal('0')
+            self._days_sum = 0
+
+    def _boundary(self, step_i):
+        return add_months(self.start_date, step_i * self.months).toordinal()
+
+    def _full_step(self, step_i):
+        return self._boundary(step_i + 1) - self._boundary(step_i), 1
+
+    @property
+    def key(self):
+        """
+        Hashable identity of the steps, for caches keyed by schedule
+        """
+        return 'calendar', self.start_date, self.months, self._days_sum
+
+    def __iter__(self):
+        start_ordinal = self.start_date.toordinal()
+        for step_i in range(1, self.full_num + 1):
+            tail_ordinal = self._boundary(step_i)
+            yield tail_ordinal - start_ordinal, 1
+            start_ordinal = tail_ordinal
+        if self.remainder > 0:
+            yield self.remainder, self.remainder_ratio
+
+    @property
+    def days_sum(self):
+        return self._days_sum
+
+
+def get_steps_fixed(duration, step):
+    """
+    Steps of a fixed length in days
+    :param duration: days
+    :param step: days of every step
+    :return: FixedSteps of (days, ratio)
+    """
+    return FixedSteps(duration, step)
+
+
+def get_steps_calendar(start_date, duration, months):
+    """
+    Steps of calendar months
+    :param start_date:
+    :param duration: days
+    :param months: months of every step
+    :return: CalendarSteps of (days, ratio)
+    """
+    return CalendarSteps(start_date, duration, months)
@@ -0,0 +1,99 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+from .steps import *
+
+
+def reference_get_steps_simple(duration, step):
+    steps = []
+    remainder = duration
+    while True:
+        if step <= remainder:
+            steps.append((step, 1))
+            remainder -= step
+        else:
+            if remainder > 0:
+                steps.append((remainder, Decimal(remainder) / step))
+            break
+    return steps
+
+
+def reference_get_steps(start_date, duration, delta_callback):
+    steps = []
+    start = start_date
+    remainder = duration
+    for i in range(duration):
+        tail_date = start_date + delta_callback(i + 1)
+        delta = tail_date - start
+        if delta.days <= remainder:
+            steps.append((delta.days, 1))
+            start = tail_date
+            remainder -= delta.days
+        else:
+            if remainder > 0:
+                steps.append((remainder, Decimal(remainder) / delta.days))
+            break
+    return steps
+
+
+START_DATES = [
+    datetime.date(2020, 1, 31),
+    datetime.date(2020, 2, 29),
+    datetime.date(2021, 1, 1),
+    datetime.date(2021, 8, 31),
+    datetime.date(2022, 3, 30),
+    datetime.date(2023, 12, 31),
+    datetime.datetime(2021, 1, 31, 12, 30),
+]
+DURATIONS = [-5, 0, 1, 27, 28, 29, 59, 90, 92, 365, 366, 730, 1461, 3652, 10957, 18262]
+
+
+class StepsTest(unittest.TestCase):
+    def test_add_months(self):
+        for start_date in START_DATES:
+            for months in range(0, 600, 7):
+                self.assertEqual(add_months(start_date, months), start_date + relativedelta(months=months))
+
+    def test_get_steps_fixed_equivalence(self):
+        for duration in DURATIONS:
+            for step in [1, 2, 7, 10, 14, 30, 365]:
+                self.assertEqual(get_steps_fixed(duration, step), reference_get_steps_simple(duration, step),
+                                 (duration, step))
+
+    def test_get_steps_calendar_equivalence(self):
+        deltas = {
+            1: lambda i: relativedelta(months=i),
+            2: lambda i: relativedelta(months=i * 2),
+            3: lambda i: relativedelta(months=i * 3),
+            12: lambda i: relativedelta(years=i),
+            24: lambda i: relativedelta(years=i * 2),
+        }
+        for start_date in START_DATES:
+            for duration in DURATIONS:
+                for months, delta_callback in deltas.items():
+                    self.assertEqual(get_steps_calendar(start_date, duration, months),
+                                     reference_get_steps(start_date, duration, delta_callback),
+                                     (start_date, duration, months))
+
+    def test_lazy_steps(self):
+        for start_date in START_DATES:
+            for duration in DURATIONS:
+                for steps in [get_steps_fixed(duration, 7), get_steps_calendar(start_date, duration, 1)]:
+                    materialized = list(steps)
+                    self.assertEqual(len(steps), len(materialized))
+                    self.assertEqual(steps.ratio_sum, sum((ratio for days, ratio in materialized), Decimal('0')))
+                    self.assertEqual(steps.days_sum, sum(days for days, ratio in materialized))
+                    self.assertEqual([steps[i] for i in range(len(steps))], materialized)
+                    if materialized:
+                        self.assertEqual(steps[-1], materialized[-1])
+                    with self.assertRaises(IndexError):
+                        steps[len(steps)]
+        with self.assertRaises(TypeError):
+            Steps()
+
+
+if __name__ == '__main__':
+    unittest.main()
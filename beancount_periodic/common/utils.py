@@ -1,21 +1,40 @@
+import bisect
 import datetime
+import heapq
+import re
+import sys
 from decimal import Decimal
 from typing import Optional
 
 from beancount.core import data
 
-from .config import parse
+from .config import DEFAULT_DURATION, DEFAULT_STEP, parse
+from .identity import create_id_meta
 from .number import remove_exponent_zero
-from .number import round_and_remainder
-from .number import smart_place_num
+from .schedule import iter_step_amounts
+from ..stats import NULL_STATS
+
+STEP_NUMBER_PATTERN = re.compile(r'%[ \d]*d')
+
+
+def has_meta_key(entry: data.Transaction, meta_keys):
+    """
+    Whether the entry or one of its postings carries one of the meta keys
+    """
+    if entry.meta and any(key in entry.meta for key in meta_keys):
+        return True
+    for posting in entry.postings:
+        if posting.meta and any(key in posting.meta for key in meta_keys):
+            return True
+    return False
 
 
 def select_periodic_posting_groups(entry, meta_name, errors):
     config_group_postings = {}
     entry_config_str = entry.meta.get(meta_name) if entry.meta else None
     if entry_config_str:
-        entry_config, entry_config_err = parse(entry_config_str, Decimal('0'), entry.date, 'M', 'D', Decimal('0'),
-                                               'line')
+        entry_config, entry_config_err = parse(entry_config_str, Decimal('0'), entry.date, DEFAULT_DURATION,
+                                               DEFAULT_STEP, Decimal('0'), 'line')
         if entry_config:
             config_group_postings[entry_config_str] = []
         else:
@@ -24,8 +43,8 @@ def select_periodic_posting_groups(entry, meta_name, errors):
     for i, posting in enumerate(entry.postings):
         config_str = posting.meta.get(meta_name) if posting.meta else None
         if config_str:
-            config, config_err = parse(config_str, posting.units.number, entry.date, 'M', 'D', Decimal('0'),
-                                       'line')
+            config, config_err = parse(config_str, posting.units.number, entry.date, DEFAULT_DURATION,
+                                       DEFAULT_STEP, Decimal('0'), 'line')
             if config:
                 if config_str not in config_group_postings:
                     config_group_postings[config_str] = []
@@ -42,8 +61,37 @@ def select_periodic_posting_groups(entry, meta_name, errors):
 
 def build_steps(meta_key, entry, new_postings_config, positive=True,
                 narration_suffix='(% d / % d)',
-                generate_until: Optional[datetime.date] = None):
-    new_entries = []
+                generate_until: Optional[datetime.date] = None,
+                stats=NULL_STATS,
+                collapse_before: Optional[datetime.date] = None,
+                id_prefix: Optional[str] = None):
+    return list(iter_steps(meta_key, entry, new_postings_config, positive, narration_suffix, generate_until, stats,
+                           collapse_before, id_prefix))
+
+
+def iter_steps(meta_key, entry, new_postings_config, positive=True,
+               narration_suffix='(% d / % d)',
+               generate_until: Optional[datetime.date] = None,
+               stats=NULL_STATS,
+               collapse_before: Optional[datetime.date] = None,
+               id_prefix: Optional[str] = None):
+    """
+    Generate the step entries of a group of postings, in date order.
+    The postings of a group share their config string, hence their steps: the schedules of the postings are walked
+    in lockstep and every step entry is yielded as soon as its postings are combined.
+    :param meta_key:
+    :param entry: the source entry
+    :param new_postings_config: [(config, posting, new account)] of the group
+    :param positive: whether the postings to the source accounts get the step amounts, or their negation
+    :param narration_suffix: appended to the narration, formatted with the step number and the number of steps
+    :param generate_until:
+    :param stats:
+    :param collapse_before: the steps starting before are merged into one entry, yielded first
+    :param id_prefix: the step entries get a periodic_id meta if given, see identity.get_id_prefix
+    """
+    if not new_postings_config:
+        return
+    combine = stats.timed('combine_postings', combine_to_entry_posting)
 
     if len(new_postings_config) == 1:
         posting = new_postings_config[0][1];
@@ -58,105 +106,173 @@ def build_steps(meta_key, entry, new_postings_config, positive=True,
 
     new_entry_narration_template = (narration + ' ' if narration else '') + narration_suffix
 
-    for config, posting, new_account in new_postings_config:
-        total = config.total - config.salvage_value
-        amount_remainder = remove_exponent_zero(total)
-        start_date = config.start
+    # (posting, new account, meta of the posting, meta of the posting to the new account) per source posting, the
+    # meta of the generated postings are shared by all the steps of the source posting
+    step_postings_templates = [(posting, new_account, create_meta(posting.meta, deletions=[meta_key, 'narration']),
+                                data.new_metadata(posting.meta['filename'], posting.meta['lineno']))
+                               for config, posting, new_account in new_postings_config]
+    steps_len = len(new_postings_config[-1][0].steps)
+    # the steps starting before collapse_before: [date, first step, last step, summed amount per source posting]
+    collapsed_group = None
+    # counted per step, the iteration may stop early
+    count_steps = stats.enabled
 
-        new_posting_meta = create_meta(posting.meta, deletions=[meta_key, 'narration'])
+    for posting_steps in zip(*[iter_step_amounts(config) for config, posting, new_account in new_postings_config]):
+        step_i, start_date, step_days, step_amount = posting_steps[0]
+        # skip all steps that are past the given date
+        if generate_until and start_date > generate_until:
+            break
+        if count_steps:
+            stats.count('steps_generated', len(posting_steps))
 
-        if config.equal_amount:
-            place_num = smart_place_num(total, len(config.steps))
-        else:
-            place_num = smart_place_num(total, config.duration)
-
-        round_remainder = Decimal('0')
-        step_num = sum_step_ratio(config)
-        for step_i, (step_days, step_ratio) in enumerate(config.steps):
-            # skip all steps that are past the given date
-            if generate_until and start_date > generate_until:
-                break
-
-            if step_i < len(config.steps) - 1:
-                if config.equal_amount:
-                    step_amount, remainder = round_and_remainder(step_ratio * total / step_num, place_num)
-                else:
-                    step_amount, remainder = round_and_remainder(Decimal(step_days) / config.duration * total,
-                                                                 place_num)
-
-                round_remainder_amount, round_remainder_remainder = round_and_remainder(round_remainder,
-                                                                                        place_num)
-                if abs(round_remainder_amount) > 0:
-                    step_amount += round_remainder_amount
-                    round_remainder = round_remainder_remainder
-
-                round_remainder += remainder
-                amount_remainder -= step_amount
-            else:  # the last step
-                step_amount = amount_remainder
-            step_amount = remove_exponent_zero(step_amount)
-            end_date = start_date + datetime.timedelta(days=step_days)
-
-            new_entry_narration = new_entry_narration_template % (step_i + 1, len(config.steps))
-            new_postings = create_step_postings(posting,
-                                                new_account, new_posting_meta,
-                                                step_amount if positive else -step_amount)
-            if len(new_entries) > step_i and new_entries[step_i]:
-                new_entry = new_entries[step_i]
-                combine_to_entry_posting(new_entry, new_postings, new_account)
-            else:
-                new_entry = create_step_entry(entry, start_date, new_entry_meta, new_entry_narration, new_postings)
-                new_entries.append(new_entry)
-            start_date = end_date
-
-    return new_entries
-
-
-def combine_to_entry_posting(entry: data.Transaction, new_postings, new_account):
-    existing_index = next(
-        (i for i, posting in enumerate(entry.postings) if posting.account == new_account), None)
-    if existing_index is not None:
-        new_postings_to_extended = []
-        for new_posting in new_postings:
-            existing_posting: data.Posting = entry.postings[existing_index]
-            if new_posting.account == new_account \
-                    and new_posting.units.currency == existing_posting.units.currency \
-                    and new_posting.cost == existing_posting.cost \
-                    and new_posting.price == existing_posting.price:
-                entry.postings[existing_index] = existing_posting._replace(
-                    units=data.Amount(existing_posting.units.number + new_posting.units.number,
-                                      existing_posting.units.currency))
+        if collapse_before and start_date < collapse_before:
+            if collapsed_group is None:
+                collapsed_group = [start_date, step_i, step_i, [step[3] for step in posting_steps]]
             else:
-                new_postings_to_extended.append(new_posting)
-        entry.postings.extend(new_postings_to_extended)
-    else:
-        entry.postings.extend(new_postings)
+                collapsed_group[0] = max(collapsed_group[0], start_date)
+                collapsed_group[1] = min(collapsed_group[1], step_i)
+                collapsed_group[2] = max(collapsed_group[2], step_i)
+                collapsed_group[3] = [amount + step[3] for amount, step in zip(collapsed_group[3], posting_steps)]
+            continue
+
+        if collapsed_group is not None:
+            yield _create_collapsed_step_entry(entry, new_entry_meta, new_entry_narration_template, steps_len,
+                                               step_postings_templates, collapsed_group, positive, combine,
+                                               id_prefix)
+            collapsed_group = None
+
+        step_postings, postings_index = [], {}
+        for (posting, new_account, new_posting_meta, new_account_posting_meta), step in \
+                zip(step_postings_templates, posting_steps):
+            step_amount = step[3]
+            combine(step_postings, postings_index,
+                    create_step_postings(posting, new_account, new_posting_meta,
+                                         step_amount if positive else -step_amount, new_account_posting_meta),
+                    new_account)
+        yield create_step_entry(entry, start_date, create_id_meta(new_entry_meta, id_prefix, step_i + 1),
+                                new_entry_narration_template % (step_i + 1, steps_len),
+                                materialize_postings(step_postings, postings_index))
+
+    if collapsed_group is not None:
+        yield _create_collapsed_step_entry(entry, new_entry_meta, new_entry_narration_template, steps_len,
+                                           step_postings_templates, collapsed_group, positive, combine, id_prefix)
+
+
+def merge_steps(groups_steps):
+    """
+    Merge the step entries of the posting groups of a source entry by date, the groups in order on the same date
+    :param groups_steps: an iterator of step entries in date order per group
+    """
+    if len(groups_steps) == 1:
+        return groups_steps[0]
+    return heapq.merge(*groups_steps, key=_step_date)
+
+
+def _step_date(step_entry):
+    return step_entry.date
+
+
+def _create_collapsed_step_entry(entry, entry_meta, narration_template, steps_len, step_postings_templates,
+                                 collapsed_group, positive, combine, id_prefix=None):
+    collapsed_date, first_step_i, last_step_i, collapsed_amounts = collapsed_group
+    step_postings, postings_index = [], {}
+    for (posting, new_account, new_posting_meta, new_account_posting_meta), collapsed_amount in \
+            zip(step_postings_templates, collapsed_amounts):
+        collapsed_amount = remove_exponent_zero(collapsed_amount)
+        combine(step_postings, postings_index,
+                create_step_postings(posting, new_account, new_posting_meta,
+                                     collapsed_amount if positive else -collapsed_amount, new_account_posting_meta),
+                new_account)
+    return create_step_entry(entry, collapsed_date,
+                             create_id_meta(entry_meta, id_prefix, first_step_i + 1, last_step_i + 1),
+                             step_range_narration(narration_template, first_step_i + 1, last_step_i + 1, steps_len),
+                             materialize_postings(step_postings, postings_index))
 
 
-def sum_step_ratio(config):
-    step_num = Decimal('0')
-    for step_days, step_ratio in config.steps:
-        step_num += step_ratio
-    return step_num
+def step_range_narration(narration_template, first_step, last_step, steps_len):
+    """
+    Narration of an entry collapsing several steps, the step number of the template becomes the range of the steps
+    :param narration_template: e.g. 'Amortized(%d/%d)'
+    :param first_step: 1-based
+    :param last_step: 1-based
+    :param steps_len:
+    :return: e.g. 'Amortized(1-36/120)'
+    """
+    if first_step == last_step:
+        return narration_template % (first_step, steps_len)
+    return STEP_NUMBER_PATTERN.sub('%s', narration_template, count=1) % ('%d-%d' % (first_step, last_step),
+                                                                         steps_len)
+
+
+def posting_key(posting: data.Posting):
+    return posting.account, posting.units.currency, posting.cost, posting.price
+
+
+def combine_to_entry_posting(postings, postings_index, new_postings, new_account):
+    """
+    Add the postings of a step to the postings of the step entry, the postings to the new account with the same
+    currency, cost and price are summed up
+    :param postings: postings of the step entry
+    :param postings_index: {posting key: [index in postings, summed units number]}
+    :param new_postings:
+    :param new_account:
+    """
+    for new_posting in new_postings:
+        if new_posting.account == new_account:
+            key = posting_key(new_posting)
+            combined = postings_index.get(key)
+            if combined is not None:
+                combined[1] += new_posting.units.number
+                continue
+            postings_index[key] = [len(postings), new_posting.units.number]
+        postings.append(new_posting)
+
+
+def materialize_postings(postings, postings_index):
+    for index, number in postings_index.values():
+        posting = postings[index]
+        if posting.units.number is not number:
+            postings[index] = posting._replace(units=data.Amount(number, posting.units.currency))
+    return postings
 
 
 def create_step_postings(posting_template: data.Posting,
                          new_account,
-                         posting_meta, amount):
+                         posting_meta, amount,
+                         new_account_posting_meta=None):
+    """
+    :param posting_template:
+    :param new_account:
+    :param posting_meta: meta of the posting to the template account, shared, not copied
+    :param amount:
+    :param new_account_posting_meta: meta of the posting to the new account, shared, not copied; new filename and
+    lineno meta of the template if None
+    :return: the postings to the new account and to the template account
+    """
     amount = remove_exponent_zero(amount)
+    if new_account_posting_meta is None:
+        new_account_posting_meta = data.new_metadata(posting_template.meta['filename'], posting_template.meta['lineno'])
     new_postings = [data.Posting(
         account=new_account,
         units=data.Amount(-amount, posting_template.units.currency),
         cost=posting_template.cost,
         price=posting_template.price,
         flag=posting_template.flag,
-        meta=data.new_metadata(posting_template.meta['filename'], posting_template.meta['lineno'])
+        meta=new_account_posting_meta
     ), posting_template._replace(units=data.Amount(amount, posting_template.units.currency),
                                  meta=posting_meta)]
 
     return new_postings
 
 
+def scale_postings(postings, multiplier):
+    """
+    Copies of the postings with the units multiplied
+    """
+    return [posting._replace(units=data.Amount(posting.units.number * multiplier, posting.units.currency))
+            for posting in postings]
+
+
 def create_step_entry(entry_template, entry_date, entry_meta, entry_narration, entry_postings):
     new_entry = data.Transaction(
         date=entry_date,
@@ -171,6 +287,56 @@ def create_step_entry(entry_template, entry_date, entry_meta, entry_narration, e
     return new_entry
 
 
+def exclude_entries(entries, entries_to_remove):
+    """
+    Filter out the given entries in a single pass, matching by identity instead of equality
+    :param entries:
+    :param entries_to_remove:
+    :return: a new list of the remaining entries, in their original order
+    """
+    if not entries_to_remove:
+        return entries
+    ids_to_remove = {id(entry) for entry in entries_to_remove}
+    return [entry for entry in entries if id(entry) not in ids_to_remove]
+
+
+def merge_entries(entries, new_entries):
+    """
+    Merge the generated entries into the already sorted entries, only the generated entries are sorted.
+    The insert position of every generated entry is found by binary search, and the untouched runs of the
+    existing entries are copied by slices.
+    The result is the same as extending the entries and sorting them all with data.entry_sortkey.
+    :param entries: entries sorted by data.entry_sortkey
+    :param new_entries:
+    :return: a new sorted list
+    """
+    if not new_entries:
+        return entries
+    new_entries = sorted(new_entries, key=data.entry_sortkey)
+    merged = []
+    lo = 0
+    for new_entry in new_entries:
+        position = bisect_right_by_key(entries, data.entry_sortkey(new_entry), lo)
+        merged.extend(entries[lo:position])
+        merged.append(new_entry)
+        lo = position
+    merged.extend(entries[lo:])
+    return merged
+
+
+def bisect_right_by_key(entries, key, lo=0):
+    if sys.version_info >= (3, 10):
+        return bisect.bisect_right(entries, key, lo, key=data.entry_sortkey)
+    hi = len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key < data.entry_sortkey(entries[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
 def create_meta(template_meta, deletions, extends={}):
     new_meta = {}
     new_meta.update(template_meta)
@@ -0,0 +1,42 @@
+import datetime
+import unittest
+
+from beancount.core import data
+
+from .utils import *
+
+
+def make_entry(narration, date=datetime.date(2022, 1, 1), lineno=0):
+    return data.Transaction(meta={'lineno': lineno}, date=date, flag='*', payee=None,
+                            narration=narration, tags=frozenset(), links=frozenset(), postings=[])
+
+
+class MyTestCase(unittest.TestCase):
+    def test_exclude_entries(self):
+        entry_a, entry_b, entry_c = make_entry('a'), make_entry('b'), make_entry('c')
+        entry_a_copy = make_entry('a')
+        entries = [entry_a, entry_b, entry_a_copy, entry_c]
+
+        remaining = exclude_entries(entries, [entry_a, entry_c])
+        self.assertEqual(len(remaining), 2)
+        self.assertIs(remaining[0], entry_b)
+        self.assertIs(remaining[1], entry_a_copy)
+        self.assertIs(exclude_entries(entries, []), entries)
+
+    def test_merge_entries(self):
+        entries = [make_entry(str(i), datetime.date(2022, 1, 1) + datetime.timedelta(days=i * 2), i)
+                   for i in range(10)]
+        new_entries = [make_entry('new %d' % i, datetime.date(2022, 1, 1) + datetime.timedelta(days=i), 5)
+                       for i in reversed(range(20))]
+
+        expected = list(entries) + new_entries
+        expected.sort(key=data.entry_sortkey)
+        merged = merge_entries(entries, new_entries)
+        self.assertEqual(len(merged), len(expected))
+        for merged_entry, expected_entry in zip(merged, expected):
+            self.assertIs(merged_entry, expected_entry)
+        self.assertIs(merge_entries(entries, []), entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,67 +1,258 @@
-from typing import Dict, Tuple
+from typing import Dict, Iterator, Optional
 
-import beancount.core.getters
 from beancount.core import data, account, account_types
 from beancount.parser import options
 
+from . import stats
+from .common import PeriodicConfigError
+from .common.cache import open_schedule_cache
 from .common.config import PluginConfig
-from .common.utils import build_steps
+from .common.identity import get_id_prefix
+from .common.identity import get_source_key
+from .common.identity import get_source_keys
+from .common.index import CandidateIndex
+from .common.manifest import Schedule
+from .common.manifest import create_schedule_entries
+from .common.materialize import is_materialized
+from .common.materialize import is_materialized_marker
+from .common.parallel import expand_parallel
+from .common.parallel import get_worker_context
+from .common.parallel import use_parallel
+from .common.utils import iter_steps
+from .common.utils import merge_entries
+from .common.utils import merge_steps
 from .common.utils import select_periodic_posting_groups
+from .stats import NULL_STATS
 
 __plugins__ = ('depreciate',)
 
 
+def get_depreciate_account_index(entries: data.Entries) -> Dict[str, Optional[str]]:
+    """
+    Read the depreciate_account meta of the Open directives
+    :param entries:
+    :return: {account: depreciate_account meta or None}, for every opened account
+    """
+    depreciate_accounts = {}
+    for entry in entries:
+        if isinstance(entry, data.Open):
+            add_to_depreciate_account_index(depreciate_accounts, entry)
+    return depreciate_accounts
+
+
+def add_to_depreciate_account_index(depreciate_accounts: Dict[str, Optional[str]], open_entry: data.Open):
+    # the first (earliest) Open directive wins, as with getters.get_account_open_close
+    if open_entry.account not in depreciate_accounts:
+        depreciate_accounts[open_entry.account] = open_entry.meta.get('depreciate_account', None) \
+            if open_entry.meta else None
+
+
 def get_depreciation_account(
-        accounts_open_close: Dict[str, Tuple[beancount.core.data.Open, beancount.core.data.Close]],
+        depreciate_accounts: Dict[str, Optional[str]],
         expenses_parent: str,
-        asset_account: beancount.core.data.Account,
+        asset_account: data.Account,
 ) -> str:
-    new_account = str.join(
-        account.sep,
-        [expenses_parent, 'Depreciation', account.sans_root(asset_account)]
-    )
-
-    asset_account_open_statement = accounts_open_close.get(asset_account, None)[0]
-    open_meta = asset_account_open_statement.meta
-    depreciate_account = open_meta.get('depreciate_account', None)
+    depreciate_account = depreciate_accounts.get(asset_account, None)
 
     if depreciate_account:
         return depreciate_account
 
-    return new_account
+    return str.join(
+        account.sep,
+        [expenses_parent, 'Depreciation', account.sans_root(asset_account)]
+    )
 
 
 def depreciate(entries: data.Entries, unused_options_map, config_string=""):
     plugin_config = PluginConfig.from_string(config_string)
+    account_types_option = options.get_account_types(unused_options_map)
+    with stats.profile('depreciate', plugin_config) as plugin_stats:
+        # the candidates and the depreciate_account meta of the Open directives, in a single scan
+        index = CandidateIndex(('depreciate',))
+        depreciate_accounts = {}
+        with plugin_stats.phase('scan'):
+            for entry in entries:
+                if isinstance(entry, data.Transaction):
+                    index.add(entry)
+                elif isinstance(entry, data.Open):
+                    add_to_depreciate_account_index(depreciate_accounts, entry)
+                elif is_materialized_marker(entry):
+                    index.materialized.add(entry.values[0].value)
+        if not index.get('depreciate'):
+            return entries, []
+        return depreciate_entries(entries, account_types_option, depreciate_accounts, plugin_config, plugin_stats,
+                                  unused_options_map.get('filename'), index=index)
+
+
+def depreciate_entries(
+        entries: data.Entries,
+        account_types_option,
+        depreciate_accounts: Dict[str, Optional[str]],
+        plugin_config: PluginConfig,
+        plugin_stats=NULL_STATS,
+        scope=None,
+        materialized=None,
+        index=None,
+):
+    """
+    :param materialized: fingerprints of the materialized sources, read from the entries if None
+    :param index: the CandidateIndex of the entries, built by scanning them if None; updated with the changes
+    """
     new_entries = []
     errors = []
-    account_types_option = options.get_account_types(unused_options_map)
-    accounts_open_close = beancount.core.getters.get_account_open_close(entries)
-    for entry in entries:
-        if isinstance(entry, data.Transaction):
-            selected_postings_groups = select_periodic_posting_groups(entry, 'depreciate', errors)
-            for selected_postings in selected_postings_groups:
-                new_postings_config = []
-                for i, config, config_str in selected_postings:
-                    posting: data.Posting = entry.postings[i]
-                    if account_types.is_account_type(account_types_option.assets, posting.account):
-                        new_account = get_depreciation_account(
-                            accounts_open_close,
-                            account_types_option.expenses,
-                            posting.account
-                        )
-                    else:
-                        continue
-                    new_postings_config.append((config, posting, new_account))
-
-                new_entries.extend(
-                    build_steps('depreciate', entry, new_postings_config,
-                                positive=False,
-                                narration_suffix='Depreciated(%d/%d)',
-                                generate_until=plugin_config.generate_until))
-
-    if new_entries:
-        entries.extend(new_entries)
-        entries.sort(key=data.entry_sortkey)
+    plugin_stats.count('entries_scanned', len(entries))
+    if index is None:
+        with plugin_stats.phase('scan'):
+            index = CandidateIndex.scan(entries)
+    if materialized is None:
+        materialized = index.materialized
+    sources = index.get('depreciate')
+    source_keys = get_source_keys(sources) if plugin_config.step_ids else [None] * len(sources)
+    candidates = [(entry, source_key) for entry, source_key in zip(sources, source_keys)
+                  if not is_materialized(entry, materialized)]
+    plugin_stats.count('candidates', len(candidates))
+
+    if not plugin_config.cache and not plugin_config.incremental and use_parallel(plugin_config, len(candidates)):
+        with plugin_stats.phase('parallel'):
+            results = expand_parallel(_depreciate_chunk, candidates,
+                                      (account_types_option, depreciate_accounts, plugin_config),
+                                      plugin_config.workers)
+            for postings, entry_new_entries, entry_errors in results:
+                new_entries.extend(entry_new_entries)
+                errors.extend(entry_errors)
+    else:
+        # asset account -> depreciation account, or None if it is not an asset account
+        depreciation_accounts = {}
+        # the context is part of the cache keys
+        sources = [(entry, (account_types_option,
+                            tuple((posting.account in depreciate_accounts, depreciate_accounts.get(posting.account))
+                                  for posting in entry.postings),
+                            source_key))
+                   for entry, source_key in candidates]
+        with open_schedule_cache(plugin_config, scope) as schedule_cache:
+            for entry_new_entries, entry_errors in schedule_cache.expand_all(
+                    'depreciate', sources, plugin_config,
+                    lambda entry, context, entry_errors: depreciate_entry(
+                        entry, account_types_option, depreciate_accounts, plugin_config, depreciation_accounts,
+                        entry_errors, plugin_stats, context[2])):
+                new_entries.extend(entry_new_entries)
+                errors.extend(entry_errors)
+    index.update((), new_entries)
+
+    plugin_stats.count('entries_emitted', len(new_entries))
+    with plugin_stats.phase('merge'):
+        entries = merge_entries(entries, new_entries)
 
     return entries, errors
+
+
+def _depreciate_chunk(chunk):
+    """
+    depreciate_entry of the (entry, source key) pairs of a chunk, in a worker process
+    :return: (None, step entries, errors) per entry
+    """
+    account_types_option, depreciate_accounts, plugin_config = get_worker_context()
+    depreciation_accounts = {}
+    results = []
+    for entry, source_key in chunk:
+        entry_errors = []
+        entry_new_entries = depreciate_entry(entry, account_types_option, depreciate_accounts, plugin_config,
+                                             depreciation_accounts, entry_errors, source_key=source_key)
+        results.append((None, entry_new_entries, entry_errors))
+    return results
+
+
+def depreciate_entry(
+        entry: data.Transaction,
+        account_types_option,
+        depreciate_accounts: Dict[str, Optional[str]],
+        plugin_config: PluginConfig,
+        depreciation_accounts,
+        errors,
+        plugin_stats=NULL_STATS,
+        source_key=None,
+):
+    """
+    Build the step entries of the depreciated postings of the entry
+    :return: the step entries, see iter_depreciate, followed by the schedule directives if the manifest is on
+    """
+    schedules = [] if plugin_config.manifest else None
+    new_entries = list(iter_depreciate(entry, account_types_option, depreciate_accounts, plugin_config, errors,
+                                       depreciation_accounts, plugin_stats, schedules, source_key))
+    if schedules:
+        new_entries.extend(create_schedule_entries('depreciate', entry, schedules, plugin_config.generate_until))
+    return new_entries
+
+
+def iter_depreciate(
+        entry: data.Transaction,
+        account_types_option,
+        depreciate_accounts: Dict[str, Optional[str]],
+        plugin_config: PluginConfig = None,
+        errors=None,
+        depreciation_accounts=None,
+        plugin_stats=NULL_STATS,
+        schedules=None,
+        source_key=None,
+) -> Iterator[data.Transaction]:
+    """
+    Generate the step entries of the depreciated postings of the entry, in date order
+    :param entry:
+    :param account_types_option: options.get_account_types(options_map)
+    :param depreciate_accounts: depreciate_account meta of the Open directives, see get_depreciate_account_index
+    :param plugin_config: generate_until and collapse_before apply
+    :param errors: the config errors are appended, if given
+    :param depreciation_accounts: per run memo of the depreciation accounts
+    :param plugin_stats:
+    :param schedules: the Schedule of every depreciated posting is appended when the iteration starts, if given
+    :param source_key: the key of the entry among the identical sources, see get_source_keys
+    """
+    plugin_config = plugin_config or PluginConfig()
+    if errors is None:
+        errors = []
+    if depreciation_accounts is None:
+        depreciation_accounts = {}
+    select_groups = plugin_stats.timed('select_posting_groups', select_periodic_posting_groups)
+
+    selected_postings_groups = select_groups(entry, 'depreciate', errors)
+    if plugin_config.step_ids:
+        source_key = source_key or get_source_key(entry)
+    groups_postings_config = []
+    for group_i, selected_postings in enumerate(selected_postings_groups):
+        new_postings_config = []
+        for i, config, config_str in selected_postings:
+            posting: data.Posting = entry.postings[i]
+            if posting.account in depreciation_accounts:
+                new_account = depreciation_accounts[posting.account]
+            elif not account_types.is_account_type(account_types_option.assets, posting.account):
+                new_account = depreciation_accounts[posting.account] = None
+            elif posting.account not in depreciate_accounts:
+                errors.append(PeriodicConfigError(
+                    posting.meta, 'fail to depreciate: no open directive for %s' % posting.account, entry))
+                continue
+            else:
+                new_account = get_depreciation_account(
+                    depreciate_accounts,
+                    account_types_option.expenses,
+                    posting.account
+                )
+                depreciation_accounts[posting.account] = new_account
+            if new_account is None:
+                continue
+            new_postings_config.append((config, posting, new_account))
+            if schedules is not None:
+                schedules.append(Schedule(config_str, config, posting, new_account))
+        if new_postings_config:
+            groups_postings_config.append((new_postings_config, get_id_prefix(source_key, 'depreciate', group_i)
+                                           if plugin_config.step_ids else None))
+
+    yield from merge_steps([
+        plugin_stats.timed_iter('build_steps', iter_steps(
+            'depreciate', entry, new_postings_config,
+            positive=False,
+            narration_suffix='Depreciated(%d/%d)',
+            generate_until=plugin_config.generate_until,
+            stats=plugin_stats,
+            collapse_before=plugin_config.collapse_before,
+            id_prefix=id_prefix))
+        for new_postings_config, id_prefix in groups_postings_config])
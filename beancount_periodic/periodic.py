@@ -0,0 +1,82 @@
+from beancount.core import data
+from beancount.parser import options
+
+from . import stats
+from .amortize import amortize_entries
+from .common.config import PluginConfig
+from .common.index import CandidateIndex
+from .common.index import PERIODIC_META_KEYS
+from .common.materialize import is_materialized_marker
+from .common.utils import exclude_entries
+from .common.utils import merge_entries
+from .depreciate import add_to_depreciate_account_index
+from .depreciate import depreciate_entries
+from .recur import recur_entries
+from .split import split_entries
+from .stats import NULL_STATS
+
+__plugins__ = ('periodic',)
+
+
+def periodic(entries: data.Entries, unused_options_map, config_string=""):
+    """
+    Run recur, split, amortize and depreciate, in this order, with a single scan of the ledger.
+    Only the transactions carrying periodic meta go through the four transforms, the generated entries are merged
+    back once at the end. The result is the same as running the four plugins one after another.
+    """
+    plugin_config = PluginConfig.from_string(config_string)
+    account_types_option = options.get_account_types(unused_options_map)
+    with stats.profile('periodic', plugin_config) as plugin_stats:
+        return periodic_entries(entries, account_types_option, plugin_config, plugin_stats,
+                                unused_options_map.get('filename'))
+
+
+def periodic_entries(entries: data.Entries, account_types_option, plugin_config: PluginConfig,
+                     plugin_stats=NULL_STATS, scope=None):
+    candidates = []
+    depreciate_accounts = {}
+    index = CandidateIndex(PERIODIC_META_KEYS)
+    with plugin_stats.phase('scan'):
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                if index.add(entry):
+                    candidates.append(entry)
+            elif isinstance(entry, data.Open):
+                add_to_depreciate_account_index(depreciate_accounts, entry)
+            elif is_materialized_marker(entry):
+                index.materialized.add(entry.values[0].value)
+    plugin_stats.count('entries_scanned', len(entries))
+    plugin_stats.count('candidates', len(candidates))
+
+    if not candidates:
+        return entries, []
+
+    # the plugins share the index, and keep it up to date with the entries they remove and generate; their stats are
+    # reported under their name
+    errors = []
+    with plugin_stats.phase('recur'):
+        expanded, recur_errors = recur_entries(candidates, plugin_config, plugin_stats.scoped('recur'), index=index)
+    errors.extend(recur_errors)
+    with plugin_stats.phase('split'):
+        expanded, split_errors = split_entries(expanded, plugin_config, plugin_stats.scoped('split'), index=index)
+    errors.extend(split_errors)
+    with plugin_stats.phase('amortize'):
+        expanded, amortize_errors = amortize_entries(expanded, account_types_option, plugin_config,
+                                                     plugin_stats.scoped('amortize'), scope=scope, index=index)
+    errors.extend(amortize_errors)
+    with plugin_stats.phase('depreciate'):
+        expanded, depreciate_errors = depreciate_entries(expanded, account_types_option, depreciate_accounts,
+                                                         plugin_config, plugin_stats.scoped('depreciate'),
+                                                         scope=scope, index=index)
+    errors.extend(depreciate_errors)
+
+    candidate_ids = {id(entry) for entry in candidates}
+    expanded_ids = {id(entry) for entry in expanded}
+    removed_entries = [entry for entry in candidates if id(entry) not in expanded_ids]
+    generated_entries = [entry for entry in expanded if id(entry) not in candidate_ids]
+    plugin_stats.count('entries_emitted', len(generated_entries))
+
+    with plugin_stats.phase('merge'):
+        entries = exclude_entries(entries, removed_entries)
+        entries = merge_entries(entries, generated_entries)
+    return entries, errors
@@ -0,0 +1,146 @@
+"""
+Point-in-time queries on the amortization and depreciation schedules, without running the plugins.
+
+    index = build_schedule_index(entries, options_map)
+    index.remaining('Expenses:Home:Rent', 'USD', datetime.date(2022, 9, 30))
+    index.booked_between('Assets:Car:ModelX', 'USD', datetime.date(2024, 7, 1), datetime.date(2024, 10, 1))
+
+The schedules are indexed by the account of the source posting (the amortized expenses or income account, the
+depreciated assets account) and currency. The amounts are those of the generated postings, positive in the direction
+of the schedule: the amortized amount, or the depreciated amount.
+Every query is a binary search in the step dates of the account.
+"""
+import bisect
+import datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from beancount.core import data, account_types
+from beancount.parser import options
+
+from .amortize import get_amortization_account
+from .common import PeriodicConfig
+from .common.schedule import iter_step_amounts
+from .common.utils import has_meta_key
+from .common.utils import select_periodic_posting_groups
+
+SCHEDULE_META_KEYS = ('amortize', 'depreciate')
+
+
+class AccountSchedule:
+    """
+    The steps of all the schedules of an account and currency, sorted by date, with the cumulative amounts
+    """
+    __slots__ = ('dates', 'cumulative', 'total', '_steps')
+
+    def __init__(self):
+        self.dates: List[datetime.date] = []
+        self.cumulative: List[Decimal] = []
+        self.total = Decimal('0')
+        self._steps: List[Tuple[datetime.date, Decimal]] = []
+
+    def add(self, config: PeriodicConfig):
+        for step_i, step_date, step_days, step_amount in iter_step_amounts(config):
+            self._steps.append((step_date, step_amount))
+        self.dates = None
+
+    def _build(self):
+        self._steps.sort(key=lambda step: step[0])
+        self.dates = [step_date for step_date, step_amount in self._steps]
+        self.cumulative = []
+        total = Decimal('0')
+        for step_date, step_amount in self._steps:
+            total += step_amount
+            self.cumulative.append(total)
+        self.total = total
+
+    def booked_before(self, date: datetime.date) -> Decimal:
+        """
+        The amount of the steps dated before the date, the date excluded
+        """
+        if self.dates is None:
+            self._build()
+        position = bisect.bisect_left(self.dates, date)
+        return self.cumulative[position - 1] if position else Decimal('0')
+
+    def booked_until(self, date: datetime.date) -> Decimal:
+        """
+        The amount of the steps dated until the date, the date included
+        """
+        if self.dates is None:
+            self._build()
+        position = bisect.bisect_right(self.dates, date)
+        return self.cumulative[position - 1] if position else Decimal('0')
+
+    def get_total(self) -> Decimal:
+        if self.dates is None:
+            self._build()
+        return self.total
+
+
+class ScheduleIndex:
+    def __init__(self):
+        # (account, currency) -> AccountSchedule
+        self.schedules: Dict[Tuple[str, str], AccountSchedule] = {}
+
+    def add(self, account_name: str, currency: str, config: PeriodicConfig):
+        schedule = self.schedules.get((account_name, currency))
+        if schedule is None:
+            schedule = self.schedules[(account_name, currency)] = AccountSchedule()
+        schedule.add(config)
+
+    def accounts(self):
+        return sorted(self.schedules)
+
+    def _get(self, account_name, currency):
+        schedule = self.schedules.get((account_name, currency))
+        if schedule is None:
+            raise KeyError('no amortization or depreciation schedule for %s %s' % (account_name, currency))
+        return schedule
+
+    def cumulative(self, account_name: str, currency: str, date: datetime.date) -> Decimal:
+        """
+        The amount booked by the schedules of the account until the date, included
+        """
+        return self._get(account_name, currency).booked_until(date)
+
+    def remaining(self, account_name: str, currency: str, date: datetime.date) -> Decimal:
+        """
+        The amount still to be booked by the schedules of the account after the date
+        """
+        schedule = self._get(account_name, currency)
+        return schedule.get_total() - schedule.booked_until(date)
+
+    def booked_between(self, account_name: str, currency: str, begin: datetime.date, end: datetime.date) -> Decimal:
+        """
+        The amount booked by the schedules of the account from begin, included, to end, excluded
+        """
+        schedule = self._get(account_name, currency)
+        return schedule.booked_before(end) - schedule.booked_before(begin)
+
+
+def build_schedule_index(entries: data.Entries, options_map, meta_keys=SCHEDULE_META_KEYS):
+    """
+    Index the amortize and depreciate schedules of the ledger, the entries are not modified
+    :param entries: booked entries, not yet processed by the amortize and depreciate plugins
+    :param options_map:
+    :param meta_keys: the schedules to index
+    :return: (ScheduleIndex, errors)
+    """
+    account_types_option = options.get_account_types(options_map)
+    index = ScheduleIndex()
+    errors = []
+    for entry in entries:
+        if not isinstance(entry, data.Transaction) or not has_meta_key(entry, meta_keys):
+            continue
+        for meta_key in meta_keys:
+            for selected_postings in select_periodic_posting_groups(entry, meta_key, errors):
+                for i, config, config_str in selected_postings:
+                    posting = entry.postings[i]
+                    if meta_key == 'amortize':
+                        if get_amortization_account(account_types_option, posting.account) is None:
+                            continue
+                    elif not account_types.is_account_type(account_types_option.assets, posting.account):
+                        continue
+                    index.add(posting.account, posting.units.currency, config)
+    return index, errors
@@ -1,58 +1,140 @@
 import datetime
 from decimal import Decimal
+from typing import Iterator
 
 from beancount.core import data, account, account_types
 from beancount.parser import options
 
+from . import stats
 from .common.utils import create_meta
 from .common.utils import create_step_entry
-from .common.config import parse, PluginConfig
+from .common.utils import exclude_entries
+from .common.utils import merge_entries
+from .common.utils import scale_postings
+from .common.utils import step_range_narration
+from .common.config import DEFAULT_DURATION, DEFAULT_STEP, parse, PluginConfig
+from .common.identity import create_id_meta
+from .common.identity import get_id_prefix
+from .common.identity import get_source_key
+from .common.identity import get_source_keys
+from .common.index import CandidateIndex
+from .common.manifest import Schedule
+from .common.manifest import create_schedule_entries
+from .common.materialize import is_materialized
+from .stats import NULL_STATS
 
 __plugins__ = ('recur',)
 
 
 def recur(entries: data.Entries, unused_options_map, config_string=""):
     plugin_config = PluginConfig.from_string(config_string)
+    with stats.profile('recur', plugin_config) as plugin_stats:
+        return recur_entries(entries, plugin_config, plugin_stats)
+
+
+def recur_entries(entries: data.Entries, plugin_config: PluginConfig, plugin_stats=NULL_STATS, materialized=None,
+                  index=None):
+    """
+    :param materialized: fingerprints of the materialized sources, read from the entries if None
+    :param index: the CandidateIndex of the entries, built by scanning them if None; updated with the changes
+    """
     new_entries = []
+    schedule_entries = []
     errors = []
-    account_types_option = options.get_account_types(unused_options_map)
     entries_to_remove = []
-    for entry in entries:
-        if isinstance(entry, data.Transaction):
-            entry_config_str = entry.meta.get('recur') if entry.meta else None
-            if entry_config_str:
-                entry_config, entry_config_err = parse(entry_config_str, Decimal('0'), entry.date, 'M', 'D', Decimal('0'),'line')
-
-                if entry_config:
-                    new_entry_meta = create_meta(entry.meta, deletions=     ['recur', 'narration'])
-                    start_date = entry_config.start
-                    new_entry_narration_template = (entry.narration + ' ' if entry.narration else '') + 'Recurring(%d/%d)'
-                    
-                    for step_i, (step_days, step_ratio) in enumerate(entry_config.steps):
-                        # skip all steps that are past the given date
-                        if plugin_config.generate_until and start_date > plugin_config.generate_until:
-                            break
-
-                        new_entry_narration = new_entry_narration_template % (step_i + 1, len(entry_config.steps))
-                        end_date = start_date + datetime.timedelta(days=step_days)
-
-                        new_entry = create_step_entry(entry, start_date, new_entry_meta, new_entry_narration, entry.postings)
-                        new_entries.append(new_entry)
-                        start_date = end_date
-                        pass
-                    pass
-                    entries_to_remove.append(entry)
-                else:
-                    errors.append(entry_config_err._replace(source=entry.meta))
-                    continue
-                pass
-            pass
-
-    for entry_to_remove in entries_to_remove:
-        entries.remove(entry_to_remove)
-
-    if new_entries:
-        entries.extend(new_entries)
-        entries.sort(key=data.entry_sortkey)
+    plugin_stats.count('entries_scanned', len(entries))
+    if index is None:
+        with plugin_stats.phase('scan'):
+            index = CandidateIndex.scan(entries)
+    if materialized is None:
+        materialized = index.materialized
+    sources = [entry for entry in index.get('recur') if entry.meta and entry.meta.get('recur')]
+    source_keys = get_source_keys(sources) if plugin_config.step_ids else [None] * len(sources)
+    for entry, source_key in zip(sources, source_keys):
+        if is_materialized(entry, materialized):
+            entries_to_remove.append(entry)
+            continue
+        entry_errors = []
+        schedules = [] if plugin_config.manifest else None
+        new_entries.extend(iter_recur(entry, plugin_config, entry_errors, plugin_stats, schedules, source_key))
+        if entry_errors:
+            errors.extend(entry_errors)
+        else:
+            entries_to_remove.append(entry)
+        if schedules:
+            schedule_entries.extend(create_schedule_entries('recur', entry, schedules, plugin_config.generate_until))
+
+    with plugin_stats.phase('remove'):
+        entries = exclude_entries(entries, entries_to_remove)
+    plugin_stats.count('steps_generated', len(new_entries))
+    new_entries.extend(schedule_entries)
+    index.update(entries_to_remove, new_entries)
+
+    plugin_stats.count('entries_emitted', len(new_entries))
+    with plugin_stats.phase('merge'):
+        entries = merge_entries(entries, new_entries)
 
     return entries, errors
+
+
+def iter_recur(entry: data.Transaction, plugin_config: PluginConfig = None, errors=None, plugin_stats=NULL_STATS,
+               schedules=None, source_key=None) -> Iterator[data.Transaction]:
+    """
+    Generate the recurring entries of the entry, in date order
+    :param entry: a transaction with recur meta
+    :param plugin_config: generate_until and collapse_before apply
+    :param errors: the config error is appended, if given
+    :param plugin_stats:
+    :param schedules: the Schedule of the entry is appended when the iteration starts, if given
+    :param source_key: the key of the entry among the identical sources, see get_source_keys
+    """
+    plugin_config = plugin_config or PluginConfig()
+    parse_config = plugin_stats.timed('parse', parse)
+    entry_config, entry_config_err = parse_config(entry.meta['recur'], Decimal('0'), entry.date, DEFAULT_DURATION,
+                                                  DEFAULT_STEP, Decimal('0'), 'line')
+    if not entry_config:
+        if errors is not None:
+            errors.append(entry_config_err._replace(source=entry.meta))
+        return
+    if schedules is not None:
+        schedules.append(Schedule(entry.meta['recur'], entry_config, None, None))
+
+    new_entry_meta = create_meta(entry.meta, deletions=['recur', 'narration'])
+    start_date = entry_config.start
+    new_entry_narration_template = (entry.narration + ' ' if entry.narration else '') + 'Recurring(%d/%d)'
+    steps_len = len(entry_config.steps)
+    # [date, first step, last step] of the steps starting before collapse_before
+    collapsed = None
+    id_prefix = get_id_prefix(source_key or get_source_key(entry), 'recur') if plugin_config.step_ids else None
+
+    for step_i, (step_days, step_ratio) in enumerate(entry_config.steps):
+        # skip all steps that are past the given date
+        if plugin_config.generate_until and start_date > plugin_config.generate_until:
+            break
+
+        if plugin_config.collapse_before and start_date < plugin_config.collapse_before:
+            collapsed = [start_date, collapsed[1] if collapsed else step_i, step_i]
+            start_date += datetime.timedelta(days=step_days)
+            continue
+
+        if collapsed:
+            yield _create_collapsed_recur_entry(entry, new_entry_meta, new_entry_narration_template, steps_len,
+                                                collapsed, id_prefix)
+            collapsed = None
+
+        new_entry_narration = new_entry_narration_template % (step_i + 1, steps_len)
+        yield create_step_entry(entry, start_date, create_id_meta(new_entry_meta, id_prefix, step_i + 1),
+                                new_entry_narration, list(entry.postings))
+        start_date += datetime.timedelta(days=step_days)
+
+    if collapsed:
+        yield _create_collapsed_recur_entry(entry, new_entry_meta, new_entry_narration_template, steps_len, collapsed,
+                                            id_prefix)
+
+
+def _create_collapsed_recur_entry(entry, entry_meta, narration_template, steps_len, collapsed, id_prefix=None):
+    collapsed_date, first_step_i, last_step_i = collapsed
+    return create_step_entry(
+        entry, collapsed_date, create_id_meta(entry_meta, id_prefix, first_step_i + 1, last_step_i + 1),
+        step_range_narration(narration_template, first_step_i + 1, last_step_i + 1, steps_len),
+        scale_postings(entry.postings, Decimal(last_step_i - first_step_i + 1)))
@@ -1,97 +1,173 @@
 import datetime
 from decimal import Decimal
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 
 from beancount.core import data, account, account_types
 from beancount.parser import options
 
+from . import stats
 from .common.utils import create_meta
 from .common.utils import create_step_entry
-from .common.config import parse, PluginConfig, PeriodicConfig
+from .common.utils import exclude_entries
+from .common.utils import merge_entries
+from .common.utils import scale_postings
+from .common.utils import step_range_narration
+from .common.config import DEFAULT_DURATION, DEFAULT_STEP, parse, PluginConfig, PeriodicConfig
+from .common.identity import create_id_meta
+from .common.identity import get_id_prefix
+from .common.identity import get_source_key
+from .common.identity import get_source_keys
+from .common.index import CandidateIndex
+from .common.manifest import Schedule
+from .common.manifest import create_schedule_entries
+from .common.materialize import is_materialized
+from .stats import NULL_STATS
 
 __plugins__ = ("split",)
 
 
-def _create_split_step(entry, step_i, total_steps, date, step_multiplier, entry_meta):
-    new_entry_narration = (entry.narration + " " if entry.narration else "") + f"Split({step_i + 1}/{total_steps})"
-    
+def _create_split_step(entry, step_i, total_steps, date, step_multiplier, entry_meta, last_step_i=None):
+    narration_template = (entry.narration + " " if entry.narration else "") + "Split(%d/%d)"
+    if last_step_i is None:
+        new_entry_narration = narration_template % (step_i + 1, total_steps)
+    else:
+        new_entry_narration = step_range_narration(narration_template, step_i + 1, last_step_i + 1, total_steps)
+
     return create_step_entry(
         entry,
         date,
         entry_meta,
         new_entry_narration,
-        [
-            posting._replace(
-                units=data.Amount(
-                    posting.units.number * step_multiplier,
-                    posting.units.currency,
-                )
-            )
-            for posting in entry.postings
-        ],
+        scale_postings(entry.postings, step_multiplier),
     )
 
 
-def _split_entry(entry: data.Transaction, plugin_config: PluginConfig) -> Tuple[List[data.Transaction], List[str]]:
+def iter_split(entry: data.Transaction, plugin_config: PluginConfig = None, errors=None,
+               schedules=None, source_key=None) -> Iterator[data.Transaction]:
+    """
+    Generate the split entries of the entry, in date order
+    :param entry: a transaction with split meta
+    :param plugin_config: generate_until and collapse_before apply
+    :param errors: the config error is appended, if given
+    :param schedules: the Schedule of the entry is appended when the iteration starts, if given
+    :param source_key: the key of the entry among the identical sources, see get_source_keys
+    """
+    plugin_config = plugin_config or PluginConfig()
     entry_config, entry_config_err = parse(
         entry.meta.get("split"),
         Decimal("0"),
         entry.date,
-        "M",
-        "D",
+        DEFAULT_DURATION,
+        DEFAULT_STEP,
         Decimal("0"),
         "line",
     )
     if not entry_config:
-        return [], [entry_config_err._replace(source=entry.meta)]
+        if errors is not None:
+            errors.append(entry_config_err._replace(source=entry.meta))
+        return
+    if schedules is not None:
+        schedules.append(Schedule(entry.meta["split"], entry_config, None, None))
 
-    new_entries = []
     new_entry_meta = create_meta(entry.meta, deletions=["split", "narration"])
     start_date = entry_config.start
-    total_days = Decimal(sum(step_days for (step_days, _) in entry_config.steps))
+    total_days = Decimal(entry_config.steps.days_sum)
+    steps_len = len(entry_config.steps)
+    # [date, first step, last step, days] of the steps starting before collapse_before
+    collapsed = None
+    id_prefix = get_id_prefix(source_key or get_source_key(entry), "split") if plugin_config.step_ids else None
 
     for step_i, (step_days, step_ratio) in enumerate(entry_config.steps):
         # skip all steps that are past the given date
         if plugin_config.generate_until and start_date > plugin_config.generate_until:
             break
 
-        new_entry = _create_split_step(
+        if plugin_config.collapse_before and start_date < plugin_config.collapse_before:
+            if collapsed:
+                collapsed = [start_date, collapsed[1], step_i, collapsed[3] + step_days]
+            else:
+                collapsed = [start_date, step_i, step_i, step_days]
+            start_date += datetime.timedelta(days=step_days)
+            continue
+
+        if collapsed:
+            yield _create_collapsed_split_step(entry, steps_len, total_days, new_entry_meta, collapsed, id_prefix)
+            collapsed = None
+
+        yield _create_split_step(
             entry,
             step_i,
-            len(entry_config.steps),
+            steps_len,
             start_date,
             step_days / total_days,
-            new_entry_meta,
+            create_id_meta(new_entry_meta, id_prefix, step_i + 1),
         )
-        new_entries.append(new_entry)
         start_date += datetime.timedelta(days=step_days)
 
-    return new_entries, []
+    if collapsed:
+        yield _create_collapsed_split_step(entry, steps_len, total_days, new_entry_meta, collapsed, id_prefix)
+
+
+def _create_collapsed_split_step(entry, steps_len, total_days, entry_meta, collapsed, id_prefix=None):
+    collapsed_date, first_step_i, last_step_i, collapsed_days = collapsed
+    return _create_split_step(
+        entry,
+        first_step_i,
+        steps_len,
+        collapsed_date,
+        collapsed_days / total_days,
+        create_id_meta(entry_meta, id_prefix, first_step_i + 1, last_step_i + 1),
+        last_step_i,
+    )
 
 
 def split(entries: data.Entries, unused_options_map, config_string=""):
     plugin_config = PluginConfig.from_string(config_string)
+    with stats.profile("split", plugin_config) as plugin_stats:
+        return split_entries(entries, plugin_config, plugin_stats)
+
+
+def split_entries(entries: data.Entries, plugin_config: PluginConfig, plugin_stats=NULL_STATS, materialized=None,
+                  index=None):
+    """
+    :param materialized: fingerprints of the materialized sources, read from the entries if None
+    :param index: the CandidateIndex of the entries, built by scanning them if None; updated with the changes
+    """
     new_entries = []
+    schedule_entries = []
     errors = []
     entries_to_remove = []
-    splittable_entries = [
-        entry
-        for entry in entries
-        if isinstance(entry, data.Transaction) and entry.meta and "split" in entry.meta
-    ]
-
-    for entry in splittable_entries:
-        entry_new_entries, entry_errors = _split_entry(entry, plugin_config)
+    plugin_stats.count("entries_scanned", len(entries))
+    if index is None:
+        with plugin_stats.phase("scan"):
+            index = CandidateIndex.scan(entries)
+    if materialized is None:
+        materialized = index.materialized
+    splittable_entries = [entry for entry in index.get("split") if entry.meta and "split" in entry.meta]
+    source_keys = get_source_keys(splittable_entries) if plugin_config.step_ids else [None] * len(splittable_entries)
+
+    for entry, source_key in zip(splittable_entries, source_keys):
+        if is_materialized(entry, materialized):
+            entries_to_remove.append(entry)
+            continue
+        schedules = [] if plugin_config.manifest else None
+        entry_new_entries = list(plugin_stats.timed_iter("split_entry",
+                                                         iter_split(entry, plugin_config, errors, schedules,
+                                                                    source_key)))
         new_entries.extend(entry_new_entries)
-        errors.extend(entry_errors)
         if entry_new_entries:  # Only remove the original entry if we created new ones
             entries_to_remove.append(entry)
-
-    for entry_to_remove in entries_to_remove:
-        entries.remove(entry_to_remove)
-
-    if new_entries:
-        entries.extend(new_entries)
-        entries.sort(key=data.entry_sortkey)
+        if schedules:
+            schedule_entries.extend(create_schedule_entries("split", entry, schedules, plugin_config.generate_until))
+
+    with plugin_stats.phase("remove"):
+        entries = exclude_entries(entries, entries_to_remove)
+    plugin_stats.count("steps_generated", len(new_entries))
+    new_entries.extend(schedule_entries)
+    index.update(entries_to_remove, new_entries)
+
+    plugin_stats.count("entries_emitted", len(new_entries))
+    with plugin_stats.phase("merge"):
+        entries = merge_entries(entries, new_entries)
 
     return entries, errors
@@ -0,0 +1,170 @@
+"""
+Per-phase timings and counters of the periodic plugins.
+
+Turned on by the `profile` plugin option:
+
+    plugin "beancount_periodic.amortize" "{'profile':'stderr'}"
+    plugin "beancount_periodic.amortize" "{'profile':'periodic-stats.json'}"
+    plugin "beancount_periodic.amortize" "{'profile':'periodic.prof'}"
+
+`stderr` prints a summary, a `.json`/`.jsonl` path gets one JSON object appended per plugin run, and any other path
+is used for cProfile stats, with the plugin name inserted before the extension (`periodic.amortize.prof`), along with
+the summary on stderr.
+When the option is not set the plugins get NULL_STATS, whose timed() and timed_iter() return their argument
+unchanged.
+"""
+import cProfile
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from .common import config
+
+JSON_EXTENSIONS = ('.json', '.jsonl')
+
+
+class PluginStats:
+    enabled = True
+
+    def __init__(self, plugin_name, prefix='', timings=None, counters=None):
+        self.plugin_name = plugin_name
+        self.prefix = prefix
+        self.timings = defaultdict(float) if timings is None else timings
+        self.counters = defaultdict(int) if counters is None else counters
+
+    def scoped(self, prefix):
+        """
+        The stats of a plugin run by this one, its timings and counters are added under 'prefix.name'
+        """
+        return PluginStats(self.plugin_name, self.prefix + prefix + '.', self.timings, self.counters)
+
+    @contextmanager
+    def phase(self, name):
+        name = self.prefix + name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def timed(self, name, func):
+        """
+        Wrap the function so that its wall time is added to the phase
+        """
+        timings = self.timings
+        name = self.prefix + name
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+
+        return wrapper
+
+    def timed_iter(self, name, iterable):
+        """
+        Wrap the iterable so that the wall time of every next() is added to the phase
+        """
+        timings = self.timings
+        name = self.prefix + name
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                timings[name] += time.perf_counter() - start
+            yield item
+
+    def count(self, name, num=1):
+        self.counters[self.prefix + name] += num
+
+    def as_dict(self):
+        return {
+            'plugin': self.plugin_name,
+            'timings': {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            'counters': dict(self.counters),
+        }
+
+    def format(self):
+        lines = ['%s:' % self.plugin_name]
+        for name, seconds in self.timings.items():
+            lines.append('  %-24s %10.3f ms' % (name, seconds * 1000))
+        for name, num in self.counters.items():
+            lines.append('  %-24s %10d' % (name, num))
+        return '\n'.join(lines) + '\n'
+
+
+class NullStats:
+    enabled = False
+    _null_context = nullcontext()
+
+    def scoped(self, prefix):
+        return self
+
+    def phase(self, name):
+        return self._null_context
+
+    def timed(self, name, func):
+        return func
+
+    def timed_iter(self, name, iterable):
+        return iterable
+
+    def count(self, name, num=1):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+def get_profile_path(path, plugin_name):
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, plugin_name, ext)
+
+
+@contextmanager
+def profile(plugin_name, plugin_config):
+    """
+    Collect the stats of a plugin run and report them according to plugin_config.profile
+    :param plugin_name:
+    :param plugin_config:
+    :return: context yielding PluginStats, or NULL_STATS if profiling is off
+    """
+    target = plugin_config.profile
+    if not target:
+        yield NULL_STATS
+        return
+
+    stats = PluginStats(plugin_name)
+    cache_before = config.cache_info()
+    profiler = None
+    if target != 'stderr' and not target.endswith(JSON_EXTENSIONS):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with stats.phase('total'):
+            yield stats
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(get_profile_path(target, plugin_name))
+        cache_after = config.cache_info()
+        stats.count('configs_parsed', cache_after['config']['misses'] - cache_before['config']['misses'])
+        stats.count('config_cache_hits', cache_after['config']['hits'] - cache_before['config']['hits'])
+        report(stats, target)
+
+
+def report(stats: PluginStats, target):
+    if target == 'stderr' or not target.endswith(JSON_EXTENSIONS):
+        sys.stderr.write(stats.format())
+    else:
+        with open(target, 'a') as f:
+            f.write(json.dumps(stats.as_dict()) + '\n')
@@ -0,0 +1,91 @@
+"""
+Compare amortize and depreciate without cache, with the in-process cache (on the first load, on reloading the
+unchanged ledger and on reloading it after editing one source transaction) and with the persistent cache (on an
+empty and on a filled cache file).
+
+    python -m benchmarks.cache [entries]
+
+Unlike timeit, the garbage collector is left enabled: unpickling the cached entries triggers it, as in a real load.
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from beancount_periodic.amortize import amortize
+from beancount_periodic.common import config
+from beancount_periodic.common.cache import clear_incremental_state
+from beancount_periodic.depreciate import depreciate
+
+from .ledger import LedgerSpec, generate_ledger
+
+INCREMENTAL = "{'incremental':True}"
+
+
+def edit_first_source(entries, meta_key):
+    """
+    Change the narration of the first transaction with a meta_key posting
+    """
+    for i, entry in enumerate(entries):
+        if any(posting.meta and meta_key in posting.meta for posting in getattr(entry, 'postings', ())):
+            entries[i] = entry._replace(narration=entry.narration + ' edited')
+            return
+
+
+def time_plugin(plugin, spec: LedgerSpec, config_string, prepare=None, edit=False, repeat=3):
+    """
+    :param prepare: called before every timed run, untimed
+    :param edit: whether the timed runs get an edited ledger
+    :return: the best time in seconds
+    """
+    best_seconds = None
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        entries, options_map = generate_ledger(spec)
+        if edit:
+            edit_first_source(entries, plugin.__name__)
+        config.cache_clear()
+        gc.collect()
+        start = time.perf_counter()
+        plugin(entries, options_map, config_string)
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds
+
+
+def main(entries_num=10000, repeat=3):
+    specs = {
+        'Monthly': LedgerSpec(entries=entries_num),
+        'Daily': LedgerSpec(entries=entries_num, granularities=('Daily',), years=5),
+    }
+    for spec_name, spec in specs.items():
+        for plugin in (amortize, depreciate):
+            def load_unchanged():
+                entries, options_map = generate_ledger(spec)
+                plugin(entries, options_map, INCREMENTAL)
+
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'cache.sqlite')
+                persistent = "{'cache':'%s'}" % path
+
+                def remove_cache_file():
+                    if os.path.exists(path):
+                        os.remove(path)
+
+                times = [
+                    ('no cache', time_plugin(plugin, spec, '', repeat=repeat)),
+                    ('first load', time_plugin(plugin, spec, INCREMENTAL, clear_incremental_state, repeat=repeat)),
+                    ('unchanged', time_plugin(plugin, spec, INCREMENTAL, load_unchanged, repeat=repeat)),
+                    ('one edit', time_plugin(plugin, spec, INCREMENTAL, load_unchanged, edit=True, repeat=repeat)),
+                    ('empty file', time_plugin(plugin, spec, persistent, remove_cache_file, repeat=repeat)),
+                    ('filled file', time_plugin(plugin, spec, persistent, repeat=repeat)),
+                ]
+            clear_incremental_state()
+            print('%s %s, %d entries: %s' % (spec_name, plugin.__name__, entries_num,
+                                             ', '.join('%s %.3fs' % (label, seconds) for label, seconds in times)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,38 @@
+"""
+Compare the config parser with the regex it replaced.
+
+    python -m benchmarks.config_parser [repeat]
+"""
+import sys
+import timeit
+
+from beancount_periodic.common.config_parser import parse_config_ast
+from beancount_periodic.common.config_parser_test import REFERENCE_PATTERN, SEED_CORPUS
+
+
+def main(repeat=5, number=2000):
+    regex_time = min(timeit.repeat(lambda: [REFERENCE_PATTERN.search(config) for config in SEED_CORPUS],
+                                   number=number, repeat=repeat))
+    parser_time = min(timeit.repeat(lambda: [parse_config_ast(config) for config in SEED_CORPUS],
+                                    number=number, repeat=repeat))
+    print('configs: %d x %d' % (len(SEED_CORPUS), number))
+    print('regex:  %.3fs' % regex_time)
+    print('parser: %.3fs' % parser_time)
+
+    # a pathological string: the regex backtracks polynomially, the parser stays linear
+    for blanks in (40, 80, 160):
+        config = '1' + ' ' * blanks + 'x'
+        regex_time = min(timeit.repeat(lambda: REFERENCE_PATTERN.search(config), number=1, repeat=repeat))
+        parser_time = min(timeit.repeat(lambda: _parse_or_none(config), number=1, repeat=repeat))
+        print('%d blanks: regex %.4fs, parser %.6fs' % (blanks, regex_time, parser_time))
+
+
+def _parse_or_none(config):
+    try:
+        return parse_config_ast(config)
+    except ValueError:
+        return None
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
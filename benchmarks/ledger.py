@@ -0,0 +1,115 @@
+"""
+Seeded synthetic ledgers for the benchmarks.
+"""
+import copy
+import datetime
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import List, Tuple
+
+from beancount.core import data
+from beancount.parser import options
+
+FILENAME = 'synthetic.bean'
+GRANULARITIES = ('Daily', 'Weekly', 'Monthly', 'Quarterly', 'Yearly')
+DURATIONS = ('1 Month', '3 Months', '6 Months', '1 Year', '2 Years', '3 Years', '5 Years', '10 Years')
+
+
+@dataclass
+class LedgerSpec:
+    entries: int = 10000
+    seed: int = 1
+    # share of the transactions carrying each meta
+    recur: float = 0.01
+    split: float = 0.01
+    amortize: float = 0.02
+    depreciate: float = 0.01
+    # number of distinct config strings per meta key
+    config_diversity: int = 20
+    granularities: Tuple[str, ...] = ('Monthly',)
+    postings: int = 2
+    accounts: int = 50
+    start_date: datetime.date = datetime.date(2015, 1, 1)
+    years: int = 10
+
+
+def _config_pool(rand: random.Random, spec: LedgerSpec, durations=DURATIONS):
+    pool = []
+    for _ in range(spec.config_diversity):
+        duration = rand.choice(durations)
+        granularity = rand.choice(spec.granularities)
+        pool.append('%s /%s' % (duration, granularity))
+    return pool
+
+
+def _meta(lineno):
+    return data.new_metadata(FILENAME, lineno)
+
+
+def _posting(account, number, lineno, meta=None):
+    posting_meta = _meta(lineno)
+    if meta:
+        posting_meta.update(meta)
+    return data.Posting(account, data.Amount(number, 'USD'), None, None, None, posting_meta)
+
+
+def generate_ledger(spec: LedgerSpec) -> Tuple[List, dict]:
+    """
+    Generate a sorted ledger and its options map
+    :param spec:
+    :return: (entries, options_map)
+    """
+    rand = random.Random(spec.seed)
+    options_map = copy.deepcopy(options.OPTIONS_DEFAULTS)
+
+    expenses = ['Expenses:Category%d' % i for i in range(spec.accounts)]
+    assets = ['Assets:Fixed:Item%d' % i for i in range(spec.accounts)]
+    funding = 'Liabilities:CreditCard'
+
+    lineno = 1
+    entries = []
+    for account_name in [funding] + expenses + assets:
+        entries.append(data.Open(_meta(lineno), datetime.date(1900, 1, 1), account_name, ['USD'], None))
+        lineno += 1
+
+    pools = {key: _config_pool(rand, spec) for key in ('recur', 'split', 'amortize')}
+    pools['depreciate'] = _config_pool(rand, spec, durations=DURATIONS[3:])
+    thresholds = []
+    share = 0.0
+    for key in ('recur', 'split', 'amortize', 'depreciate'):
+        share += getattr(spec, key)
+        thresholds.append((share, key))
+
+    days = spec.years * 365
+    transactions = []
+    for _ in range(spec.entries):
+        date = spec.start_date + datetime.timedelta(days=rand.randrange(days))
+        choice = rand.random()
+        meta_key = next((key for threshold, key in thresholds if choice < threshold), None)
+        entry_lineno = lineno
+        lineno += 1
+
+        target_accounts = assets if meta_key == 'depreciate' else expenses
+        postings = []
+        total = Decimal('0')
+        for _ in range(max(spec.postings - 1, 1)):
+            number = Decimal(rand.randrange(100, 1000000)) / 100
+            total += number
+            posting_meta = None
+            if meta_key in ('amortize', 'depreciate'):
+                posting_meta = {meta_key: rand.choice(pools[meta_key])}
+            postings.append(_posting(rand.choice(target_accounts), number, lineno, posting_meta))
+            lineno += 1
+        postings.insert(0, _posting(funding, -total, lineno))
+        lineno += 1
+
+        entry_meta = _meta(entry_lineno)
+        if meta_key in ('recur', 'split'):
+            entry_meta[meta_key] = rand.choice(pools[meta_key])
+        transactions.append(data.Transaction(entry_meta, date, '*', 'Payee', 'Synthetic', frozenset(),
+                                             frozenset(), postings))
+
+    entries.extend(transactions)
+    entries.sort(key=data.entry_sortkey)
+    return entries, options_map
@@ -0,0 +1,52 @@
+"""
+Compare merge_entries with extending and sorting the whole ledger.
+
+    python -m benchmarks.merge_entries [entries] [new entries]
+"""
+import datetime
+import random
+import sys
+import timeit
+
+from beancount.core import data
+
+from beancount_periodic.common.utils import merge_entries
+
+
+def make_entries(num, seed, lineno_start=0):
+    rand = random.Random(seed)
+    start_date = datetime.date(2000, 1, 1)
+    entries = [
+        data.Transaction(meta={'filename': 'synthetic.bean', 'lineno': lineno_start + i},
+                         date=start_date + datetime.timedelta(days=rand.randrange(365 * 25)),
+                         flag='*', payee=None, narration='synthetic', tags=frozenset(), links=frozenset(),
+                         postings=[])
+        for i in range(num)
+    ]
+    return entries
+
+
+def extend_and_sort(entries, new_entries):
+    entries = list(entries)
+    entries.extend(new_entries)
+    entries.sort(key=data.entry_sortkey)
+    return entries
+
+
+def main(entries_num=500000, new_entries_num=50000, repeat=5):
+    entries = sorted(make_entries(entries_num, 1), key=data.entry_sortkey)
+    new_entries = make_entries(new_entries_num, 2, entries_num)
+
+    assert [id(e) for e in merge_entries(entries, new_entries)] == \
+           [id(e) for e in extend_and_sort(entries, new_entries)]
+
+    sort_time = min(timeit.repeat(lambda: extend_and_sort(entries, new_entries), number=1, repeat=repeat))
+    merge_time = min(timeit.repeat(lambda: merge_entries(entries, new_entries), number=1, repeat=repeat))
+    print('entries: %d, new entries: %d' % (entries_num, new_entries_num))
+    print('extend + sort: %.3fs' % sort_time)
+    print('merge_entries: %.3fs' % merge_time)
+    print('speedup: %.2fx' % (sort_time / merge_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
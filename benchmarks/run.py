@@ -0,0 +1,143 @@
+"""
+Time every periodic plugin on a synthetic ledger.
+
+    python -m benchmarks.run [--entries N] [--granularity Monthly ...] [--baseline benchmarks/baseline.json]
+    python -m benchmarks.run --update-baseline
+
+Every plugin gets a freshly generated ledger, since the plugins modify the entries they are given.
+As with timeit, the garbage collector is disabled while timing. The throughput is input entries per second; the peak
+memory is measured by tracemalloc in a separate run, so the tracing overhead does not affect the timing.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from beancount_periodic.amortize import amortize
+from beancount_periodic.common import config
+from beancount_periodic.depreciate import depreciate
+from beancount_periodic.periodic import periodic
+from beancount_periodic.recur import recur
+from beancount_periodic.split import split
+
+from .ledger import GRANULARITIES, LedgerSpec, generate_ledger
+
+PLUGINS = {
+    'recur': recur,
+    'split': split,
+    'amortize': amortize,
+    'depreciate': depreciate,
+    'periodic': periodic,
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# slower or bigger than the baseline by more than this is reported as a regression
+TOLERANCE = 0.25
+
+
+def run_plugin(plugin, spec: LedgerSpec, config_string='', repeat=5):
+    best_seconds = None
+    output_num = 0
+    for _ in range(repeat):
+        entries, options_map = generate_ledger(spec)
+        config.cache_clear()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            output, errors = plugin(entries, options_map, config_string)
+            seconds = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+        output_num = len(output)
+
+    entries, options_map = generate_ledger(spec)
+    config.cache_clear()
+    tracemalloc.start()
+    plugin(entries, options_map, config_string)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': round(best_seconds, 4),
+        'entries_per_sec': round(len(entries) / best_seconds, 1),
+        'output_entries': output_num,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['entries_per_sec'] < base['entries_per_sec'] * (1 - TOLERANCE):
+            regressions.append('%s: %.1f entries/sec, baseline %.1f' % (
+                name, result['entries_per_sec'], base['entries_per_sec']))
+        if result['peak_memory_kb'] > base['peak_memory_kb'] * (1 + TOLERANCE):
+            regressions.append('%s: %.1f KiB peak memory, baseline %.1f' % (
+                name, result['peak_memory_kb'], base['peak_memory_kb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the periodic plugins on a synthetic ledger')
+    parser.add_argument('--entries', type=int, default=LedgerSpec.entries)
+    parser.add_argument('--seed', type=int, default=LedgerSpec.seed)
+    parser.add_argument('--granularity', nargs='+', choices=GRANULARITIES, default=list(LedgerSpec.granularities))
+    parser.add_argument('--config-diversity', type=int, default=LedgerSpec.config_diversity)
+    parser.add_argument('--postings', type=int, default=LedgerSpec.postings)
+    for key in ('recur', 'split', 'amortize', 'depreciate'):
+        parser.add_argument('--%s-share' % key, type=float, default=getattr(LedgerSpec, key))
+    parser.add_argument('--plugins', nargs='+', choices=list(PLUGINS), default=list(PLUGINS))
+    parser.add_argument('--config', default='', help='plugin config string, e.g. "{\'generate_until\':\'today\'}"')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    spec = LedgerSpec(
+        entries=args.entries,
+        seed=args.seed,
+        recur=args.recur_share,
+        split=args.split_share,
+        amortize=args.amortize_share,
+        depreciate=args.depreciate_share,
+        config_diversity=args.config_diversity,
+        granularities=tuple(args.granularity),
+        postings=args.postings,
+    )
+
+    results = {}
+    for name in args.plugins:
+        results[name] = run_plugin(PLUGINS[name], spec, args.config, args.repeat)
+        print('%-10s %8.3fs %12.1f entries/sec %10d entries out %12.1f KiB peak' % (
+            name, results[name]['seconds'], results[name]['entries_per_sec'], results[name]['output_entries'],
+            results[name]['peak_memory_kb']))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'spec': vars(spec), 'results': results}, f, indent=2, sort_keys=True, default=str)
+            f.write('\n')
+        print('baseline written to %s' % args.baseline)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('spec') != json.loads(json.dumps(vars(spec), default=str)):
+            print('baseline was recorded with a different ledger spec, not comparing')
+            return 0
+        regressions = compare(results, baseline['results'])
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,10 @@
+import re
+
 from setuptools import setup
 from setuptools import find_packages
 
-VERSION = '0.2.1'
+with open('beancount_periodic/__init__.py', 'r', encoding='UTF-8') as f:
+    VERSION = re.search(r"__version__ = '([^']+)'", f.read()).group(1)
 
 with open('README.md', 'r', encoding='UTF-8') as f:
     LONG_DESCRIPTION = f.read()
@@ -21,8 +24,13 @@ setup(
     description='Beancount plugin to generate periodic transactions #Amortize #Depreciate #Recur',
     long_description=LONG_DESCRIPTION,
     long_description_content_type='text/markdown',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']),
     install_requires=REQUIREMENTS,
+    entry_points={
+        'console_scripts': [
+            'bean-periodic=beancount_periodic.cli:main',
+        ],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'Operating System :: OS Independent',
@@ -1,11 +1,14 @@
 import datetime
 import unittest
+from decimal import Decimal
 
 from beancount.core.compare import compare_entries
 from beancount.core.data import Transaction
 from beancount.loader import load_string
+from beancount.parser import options
 
 import tests.util
+from beancount_periodic.amortize import iter_amortize
 
 
 def tx_normal(date: datetime.date, narration: str) -> Transaction:
@@ -92,6 +95,83 @@ plugin "beancount_periodic.amortize" "{'generate_until':'2022-10-01'}"
         same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
         self.assertTrue(same)
 
+    def test_combine_postings(self):
+        journal_str = """
+plugin "beancount_periodic.amortize"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  amortize: "1 Year @2022-04-01 /Monthly"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent              6000 USD
+  Expenses:Home:Rent              6000 USD
+"""
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0)
+
+        amortized_entries = [e for e in tests.util.get_transactions_cleaned(entries) if 'Amortized' in e.narration]
+        self.assertEqual(len(amortized_entries), 12)
+        for amortized_entry in amortized_entries:
+            self.assertEqual([(p.account, p.units.number) for p in amortized_entry.postings], [
+                ('Equity:Amortization:Home:Rent', Decimal('-1000')),
+                ('Expenses:Home:Rent', Decimal('500')),
+                ('Expenses:Home:Rent', Decimal('500')),
+            ])
+
+    def test_collapse_before(self):
+        journal_str = """
+plugin "beancount_periodic.amortize" "{'collapse_before':'2022-06-15'}"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+"""
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0)
+
+        amortized = [entry for entry in tests.util.get_transactions_cleaned(entries) if 'Amortized' in entry.narration]
+        self.assertEqual(len(amortized), 10)
+        self.assertEqual(amortized[0].date, datetime.date(2022, 6, 1))
+        self.assertEqual(amortized[0].narration, '2022-04 Rent Amortized(1-3/12)')
+        self.assertEqual(amortized[0].postings[0].units.number, Decimal('-3000'))
+        self.assertEqual(amortized[1].narration, '2022-04 Rent Amortized(4/12)')
+        self.assertEqual(sum(entry.postings[1].units.number for entry in amortized), Decimal('12000'))
+
+    def test_iter_amortize(self):
+        journal_str = """
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Expenses:Home:Insurance USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Insurance USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12400 USD
+  Expenses:Home:Rent 12000 USD
+    amortize: "1 Year @2022-04-01 /Monthly"
+  Expenses:Home:Insurance 400 USD
+    amortize: "1 Year @2022-04-01 /Quarterly"
+"""
+        entries, errors, options_map = load_string(journal_str)
+        source = next(entry for entry in entries if isinstance(entry, Transaction))
+
+        steps = list(iter_amortize(source, options.get_account_types(options_map)))
+        # the monthly and the quarterly schedules merged by date
+        self.assertEqual([entry.date for entry in steps], sorted(entry.date for entry in steps))
+        self.assertEqual(len(steps), 16)
+        self.assertEqual([posting.account for posting in source.postings],
+                         ['Liabilities:CreditCard:0001', 'Equity:Amortization:Home:Rent',
+                          'Equity:Amortization:Home:Insurance'])
+
+        plugin_entries, errors, options_map = load_string('plugin "beancount_periodic.amortize"\n' + journal_str)
+        same, missing1, missing2 = compare_entries(
+            list(tests.util.get_transactions_cleaned(steps)),
+            [entry for entry in tests.util.get_transactions_cleaned(plugin_entries) if entry.date > source.date])
+        self.assertTrue(same)
+
 
 if __name__ == '__main__':
     unittest.main()
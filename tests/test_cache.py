@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from beancount.loader import load_string
+from beancount.parser import printer
+
+from beancount_periodic.common import cache
+from beancount_periodic.common.cache import clear_incremental_state
+from beancount_periodic.common.cache import clear_schedule_cache
+
+JOURNAL_STR = """
+plugin "beancount_periodic.amortize" "{config}"
+plugin "beancount_periodic.depreciate" "{config}"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -200000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly =80000"
+"""
+
+
+def load_formatted(config):
+    entries, errors, options_map = load_string(JOURNAL_STR.format(config=config))
+    return [printer.format_entry(entry) for entry in entries], errors
+
+
+def count_rows(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM schedules').fetchone()[0]
+    finally:
+        connection.close()
+
+
+class CacheTest(unittest.TestCase):
+    def test_cached_output_is_identical(self):
+        expected_entries, expected_errors = load_formatted('')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.sqlite')
+            config = "{'cache':'%s'}" % path
+            first_entries, first_errors = load_formatted(config)
+            self.assertEqual(count_rows(path), 2)
+            second_entries, second_errors = load_formatted(config)
+            self.assertEqual(count_rows(path), 2)
+
+            clear_schedule_cache(path)
+            self.assertEqual(count_rows(path), 0)
+
+        self.assertEqual(len(expected_errors), 0)
+        self.assertEqual(len(first_errors), 0)
+        self.assertEqual(len(second_errors), 0)
+        self.assertEqual(first_entries, expected_entries)
+        self.assertEqual(second_entries, expected_entries)
+
+    def test_batched_read(self):
+        journal_str = JOURNAL_STR + """
+2022-04-30 * "Landlord" "2022-05 Rent"
+  Liabilities:CreditCard:0001    -6000 USD
+  Expenses:Home:Rent
+    amortize: "6 Month @2022-05-01 /Monthly"
+"""
+        expected_entries, expected_errors, _ = load_string(journal_str.format(config=''))
+        with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(cache, 'SQL_BATCH_SIZE', 1):
+            path = os.path.join(tmp_dir, 'cache.sqlite')
+            for i in range(2):
+                entries, errors, _ = load_string(journal_str.format(config="{'cache':'%s'}" % path))
+                self.assertEqual(len(errors), 0)
+                self.assertEqual([printer.format_entry(e) for e in entries],
+                                 [printer.format_entry(e) for e in expected_entries])
+            self.assertEqual(count_rows(path), 3)
+
+    def test_manifest(self):
+        expected_entries, expected_errors = load_formatted("{'manifest':True}")
+        self.assertIn('Equity:Amortization:Home:Rent\n', ''.join(expected_entries))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = "{'cache':'%s','manifest':True}" % os.path.join(tmp_dir, 'cache.sqlite')
+            for i in range(2):
+                entries, errors = load_formatted(config)
+                self.assertEqual(len(errors), 0)
+                self.assertEqual(entries, expected_entries)
+
+    def test_config_error(self):
+        error_str = JOURNAL_STR.replace('"1 Year @2022-04-01 /Monthly"', '"1 Eon /Monthly"')
+        expected_entries, expected_errors, _ = load_string(error_str.format(config=''))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.sqlite')
+            config = "{'cache':'%s'}" % path
+            for i in range(2):
+                entries, errors, _ = load_string(error_str.format(config=config))
+                self.assertEqual([printer.format_entry(e) for e in entries],
+                                 [printer.format_entry(e) for e in expected_entries])
+                self.assertEqual([error.message for error in errors],
+                                 [error.message for error in expected_errors])
+            self.assertEqual(count_rows(path), 2)
+        self.assertEqual(len(expected_errors), 1)
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.sqlite')
+            entries, errors = load_formatted("{'cache':'%s','cache_max_size':1}" % path)
+            self.assertEqual(len(errors), 0)
+            self.assertEqual(count_rows(path), 0)
+
+    def test_incremental(self):
+        clear_incremental_state()
+        config = "{'incremental':True}"
+        first_entries, _, _ = load_string(JOURNAL_STR.format(config=config))
+        second_entries, _, _ = load_string(JOURNAL_STR.format(config=config))
+        first_generated = [e for e in first_entries if 'Amortized' in getattr(e, 'narration', '')]
+        second_generated = [e for e in second_entries if 'Amortized' in getattr(e, 'narration', '')]
+        self.assertEqual(len(second_generated), 12)
+        # the unchanged sources get the entries of the last run
+        for first, second in zip(first_generated, second_generated):
+            self.assertIs(first, second)
+        self.assertEqual([printer.format_entry(e) for e in second_entries],
+                         [printer.format_entry(e) for e in first_entries])
+
+        edited_str = JOURNAL_STR.replace('-12000 USD', '-24000 USD')
+        edited_entries, errors, _ = load_string(edited_str.format(config=config))
+        expected_entries, expected_errors, _ = load_string(edited_str.format(config=''))
+        self.assertEqual(len(errors), 0)
+        self.assertEqual([printer.format_entry(e) for e in edited_entries],
+                         [printer.format_entry(e) for e in expected_entries])
+        clear_incremental_state()
+
+    def test_incremental_moved(self):
+        clear_incremental_state()
+        config = "{'incremental':True}"
+        load_string(JOURNAL_STR.format(config=config))
+        # an entry above the sources moves them down two lines
+        moved_str = JOURNAL_STR.replace('2022-03-31 * "Landlord"', '2022-01-01 * "Other"\n'
+                                        '  Liabilities:CreditCard:0001    -1 USD\n  Expenses:Home:Rent\n'
+                                        '2022-03-31 * "Landlord"')
+        moved_entries, errors, _ = load_string(moved_str.format(config=config))
+        expected_entries, expected_errors, _ = load_string(moved_str.format(config=''))
+        self.assertEqual(len(errors), 0)
+        self.assertEqual([(e.meta['filename'], e.meta['lineno']) for e in moved_entries],
+                         [(e.meta['filename'], e.meta['lineno']) for e in expected_entries])
+        self.assertEqual([[(p.meta or {}).get('lineno') for p in e.postings] for e in moved_entries
+                          if hasattr(e, 'postings')],
+                         [[(p.meta or {}).get('lineno') for p in e.postings] for e in expected_entries
+                          if hasattr(e, 'postings')])
+        self.assertEqual([printer.format_entry(e) for e in moved_entries],
+                         [printer.format_entry(e) for e in expected_entries])
+        clear_incremental_state()
+
+
+if __name__ == '__main__':
+    unittest.main()
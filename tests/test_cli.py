@@ -0,0 +1,100 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from beancount.core.compare import compare_entries
+from beancount.loader import load_file, load_string
+
+import tests.util
+from beancount_periodic import cli
+from beancount_periodic.common.materialize import MATERIALIZED_TYPE
+
+JOURNAL = """
+plugin "beancount_periodic.periodic"
+1900-01-01 open Assets:Bank:Checking USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Expenses:Subscription USD
+1900-01-01 open Expenses:Insurance USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+1900-01-01 open Equity:Amortization:Insurance USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+2022-01-01 * "Netflix" "Subscription"
+  recur: "6 Month /Monthly"
+  Liabilities:CreditCard:0001    -10 USD
+  Expenses:Subscription
+2022-01-05 * "Insurer" "Insurance"
+  recur: "2 Year /Yearly"
+  Liabilities:CreditCard:0001    -1200 USD
+  Expenses:Insurance
+    amortize: "1 Year /Quarterly"
+2022-06-01 * "Tesla" "Model X"
+  Assets:Bank:Checking    -60000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly =10000"
+"""
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ledger = os.path.join(self.directory.name, 'ledger.beancount')
+        self.output = os.path.join(self.directory.name, 'ledger.periodic.beancount')
+        with open(self.ledger, 'w', encoding='utf-8') as f:
+            f.write('include "ledger.periodic.beancount"\n' + JOURNAL)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_materialize(self):
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31']), 0)
+        materialized_entries, errors, options_map = load_file(self.output)
+        markers = [entry for entry in materialized_entries if getattr(entry, 'type', None) == MATERIALIZED_TYPE]
+        # the rent, the subscription and the insurance, not the car still depreciating in 2025
+        self.assertEqual(len(markers), 3)
+
+        expected_entries, errors, options_map = load_string(JOURNAL)
+        self.assertEqual(len(errors), 0)
+        entries, errors, options_map = load_file(self.ledger)
+        self.assertEqual(len(errors), 0)
+        same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)),
+                                                   list(tests.util.get_transactions_cleaned(expected_entries)))
+        self.assertTrue(same)
+
+    def test_until(self):
+        self.assertEqual(cli.main([self.ledger, '--until', '2022-12-31']), 0)
+        materialized_entries, errors, options_map = load_file(self.output)
+        self.assertTrue(all(entry.date <= datetime.date(2022, 12, 31) for entry in materialized_entries))
+
+        entries, errors, options_map = load_file(self.ledger)
+        self.assertEqual(len(errors), 0)
+        expected_entries, errors, options_map = load_string(JOURNAL)
+        self.assertEqual(len(list(tests.util.get_transactions_cleaned(entries))),
+                         len(list(tests.util.get_transactions_cleaned(expected_entries))))
+
+    def test_plugins(self):
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31', '--plugins', 'amortize']), 0)
+        materialized_entries, errors, options_map = load_file(self.output)
+        markers = [entry for entry in materialized_entries if getattr(entry, 'type', None) == MATERIALIZED_TYPE]
+        # the recurring insurance is left to the plugins, it is amortized once recur generated it
+        self.assertEqual(len(markers), 1)
+        with self.assertRaises(SystemExit):
+            cli.main([self.ledger, '--plugins', 'amortise'])
+
+    def test_check(self):
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31', '--check']), 1)
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31']), 0)
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31', '--check']), 0)
+
+        with open(self.ledger, 'a', encoding='utf-8') as f:
+            f.write('2023-01-01 * "Netflix" "Subscription"\n'
+                    '  recur: "3 Month /Monthly"\n'
+                    '  Liabilities:CreditCard:0001    -10 USD\n'
+                    '  Expenses:Subscription\n')
+        self.assertEqual(cli.main([self.ledger, '--until', '2024-12-31', '--check']), 1)
@@ -1,11 +1,15 @@
 import datetime
 import unittest
+from decimal import Decimal
 
 from beancount.core.compare import compare_entries
 from beancount.core.data import Transaction
 from beancount.loader import load_string
+from beancount.parser import options
 
 import tests.util
+from beancount_periodic.depreciate import get_depreciate_account_index
+from beancount_periodic.depreciate import iter_depreciate
 
 
 def tx_normal(date: datetime.date, narration: str) -> Transaction:
@@ -81,6 +85,70 @@ plugin "beancount_periodic.depreciate" "{'generate_until':'2024-03-31'}"
         same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
         self.assertTrue(same)
 
+    def test_missing_open(self):
+        journal_str = """
+plugin "beancount_periodic.depreciate"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -200000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly =80000"
+        """
+        entries, errors, options_map = load_string(journal_str)
+        depreciate_errors = [e for e in errors if 'no open directive' in e.message]
+        self.assertEqual(len(depreciate_errors), 1)
+        self.assertIn('Assets:Car:ModelX', depreciate_errors[0].message)
+
+    def _depreciated_amounts(self, depreciate_config):
+        journal_str = """
+plugin "beancount_periodic.depreciate"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -150000 USD
+  Assets:Car:ModelX
+    depreciate: "%s"
+        """ % depreciate_config
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0)
+        return [posting.units.number
+                for entry in tests.util.get_transactions_cleaned(entries) if 'Depreciated' in entry.narration
+                for posting in entry.postings if posting.account.startswith('Expenses:')]
+
+    def test_formula_sum(self):
+        amounts = self._depreciated_amounts('5 Year /Yearly *sum')
+        self.assertEqual(amounts, [Decimal('50000'), Decimal('40000'), Decimal('30000'), Decimal('20000'),
+                                   Decimal('10000')])
+
+    def test_formula_declining(self):
+        amounts = self._depreciated_amounts('5 Year /Yearly *declining')
+        self.assertEqual(amounts, [Decimal('60000'), Decimal('36000'), Decimal('21600'), Decimal('16200'),
+                                   Decimal('16200')])
+
+    def test_iter_depreciate(self):
+        journal_str = """
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -150000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly *sum"
+        """
+        entries, errors, options_map = load_string(journal_str)
+        source = next(entry for entry in entries if isinstance(entry, Transaction))
+
+        steps = iter_depreciate(source, options.get_account_types(options_map), get_depreciate_account_index(entries))
+        first_step = next(steps)
+        self.assertEqual(first_step.date, datetime.date(2022, 3, 31))
+        self.assertEqual(first_step.narration, 'Model X Depreciated(1/5)')
+        self.assertEqual([(posting.account, posting.units.number) for posting in first_step.postings],
+                         [('Expenses:Depreciation:Car:ModelX', Decimal('50000')),
+                          ('Assets:Car:ModelX', Decimal('-50000'))])
+        self.assertEqual([entry.date.year for entry in steps], [2023, 2024, 2025, 2026])
+
 
 if __name__ == '__main__':
     unittest.main()
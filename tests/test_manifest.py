@@ -0,0 +1,61 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from beancount.loader import load_string
+
+from beancount_periodic.common.manifest import SCHEDULE_TYPE
+from beancount_periodic.common.manifest import is_schedule_entry
+from tests.test_periodic import JOURNAL_STR
+from tests.test_periodic import PERIODIC_STR
+
+
+def load_schedules(config):
+    entries, errors, options_map = load_string(PERIODIC_STR.format(config=config) + JOURNAL_STR)
+    return [entry for entry in entries if is_schedule_entry(entry)], errors
+
+
+class ManifestTest(unittest.TestCase):
+    def test_schedules(self):
+        schedules, errors = load_schedules("{'manifest':True,'generate_until':'2022-12-31'}")
+        self.assertEqual(len(errors), 0)
+        plugin_names = [entry.values[0].value for entry in schedules]
+        self.assertEqual(plugin_names.count('recur'), 1)
+        self.assertEqual(plugin_names.count('split'), 1)
+        self.assertEqual(plugin_names.count('depreciate'), 2)
+
+        net_fee = next(entry for entry in schedules if entry.values[0].value == 'recur')
+        self.assertEqual(net_fee.meta['steps'], 12)
+        self.assertEqual(net_fee.meta['generated'], 10)
+
+        rent = next(entry for entry in schedules if entry.values[1].value == '1 Year @2022-04-01 /Monthly')
+        self.assertEqual(rent.type, SCHEDULE_TYPE)
+        self.assertEqual(rent.date, datetime.date(2022, 3, 31))
+        self.assertEqual([value.value for value in rent.values],
+                         ['amortize', '1 Year @2022-04-01 /Monthly', 'Equity:Amortization:Home:Rent'])
+        self.assertEqual(rent.meta['account'], 'Expenses:Home:Rent')
+        self.assertEqual(rent.meta['currency'], 'USD')
+        self.assertEqual(rent.meta['total'], Decimal('12000'))
+        self.assertEqual(rent.meta['start'], datetime.date(2022, 4, 1))
+        self.assertEqual(rent.meta['steps'], 12)
+        self.assertEqual(rent.meta['generated'], 9)
+        self.assertTrue(rent.meta['truncated'])
+        self.assertEqual(rent.meta['formula'], 'line')
+
+        car = next(entry for entry in schedules if entry.values[1].value == '5 Year /Yearly =80000')
+        self.assertEqual(car.values[2].value, 'Expenses:Depreciation:Car:ModelX')
+        self.assertEqual(car.meta['salvage_value'], Decimal('80000'))
+        self.assertEqual(car.meta['generated'], 1)
+
+        tax = next(entry for entry in schedules if entry.values[0].value == 'split')
+        self.assertEqual(len(tax.values), 2)
+        self.assertNotIn('account', tax.meta)
+
+    def test_no_manifest(self):
+        schedules, errors = load_schedules("{'generate_until':'2022-12-31'}")
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(schedules, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from beancount.loader import load_string
+from beancount.parser import printer
+
+from beancount_periodic.amortize import amortize
+from beancount_periodic.common import parallel
+from beancount_periodic.common.config import PluginConfig
+from beancount_periodic.depreciate import depreciate
+from benchmarks.ledger import LedgerSpec, generate_ledger
+
+RECUR_AMORTIZE_STR = """
+plugin "beancount_periodic.periodic" "{config}"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:CommunicationFee USD
+1900-01-01 open Equity:Amortization:Home:CommunicationFee USD
+2022-01-01 * "Provider" "Net Fee"
+  recur: "1 Year /Daily"
+  Liabilities:CreditCard:0001    -50 USD
+  Expenses:Home:CommunicationFee
+    amortize: "1 Month /Weekly"
+"""
+
+SPEC = LedgerSpec(entries=900, recur=0.02, split=0.02, amortize=0.32, depreciate=0.32, config_diversity=10,
+                  years=2)
+
+
+def run_formatted(plugin, config):
+    entries, options_map = generate_ledger(SPEC)
+    entries, errors = plugin(entries, options_map, config)
+    return [printer.format_entry(entry) for entry in entries], errors
+
+
+class ParallelTest(unittest.TestCase):
+    def test_same_as_serial(self):
+        self.assertTrue(parallel.use_parallel(PluginConfig.from_string("{'workers':2}"),
+                                              int(SPEC.entries * SPEC.depreciate)))
+        for plugin in (amortize, depreciate):
+            serial, serial_errors = run_formatted(plugin, '')
+            parallel_output, parallel_errors = run_formatted(plugin, "{'workers':2}")
+            self.assertEqual(serial, parallel_output)
+            self.assertEqual(len(serial_errors), len(parallel_errors))
+
+    def test_manifest(self):
+        # the account values of the schedule directives come back from the workers
+        for plugin in (amortize, depreciate):
+            serial, serial_errors = run_formatted(plugin, "{'manifest':True}")
+            parallel_output, parallel_errors = run_formatted(plugin, "{'workers':2,'manifest':True}")
+            self.assertTrue(any('custom "periodic-schedule"' in entry for entry in serial))
+            self.assertEqual(serial, parallel_output)
+
+    def test_recur_then_amortize(self):
+        # every recurring copy is amortized, in the plugin process as in the workers
+        outputs = []
+        for config in ('', "{'workers':2}"):
+            entries, errors, options_map = load_string(RECUR_AMORTIZE_STR.format(config=config))
+            self.assertEqual(len(errors), 0)
+            outputs.append([printer.format_entry(entry) for entry in entries])
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(sum(1 for entry in outputs[0] if 'Amortized(1/' in entry), 365)
+
+    def test_split_chunks(self):
+        chunks = parallel.split_chunks(list(range(10)), 2)
+        self.assertEqual(sum(chunks, []), list(range(10)))
+        self.assertEqual(len(chunks), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from beancount.loader import load_string
+from beancount.parser import printer
+
+JOURNAL_STR = """
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Liabilities:Tax USD
+1900-01-01 open Expenses:Home:CommunicationFee USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Expenses:Tax:Income USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:CommunicationFee USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Assets:Computer USD
+  depreciate_account: "Expenses:Computer:Value"
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+1900-01-01 open Expenses:Computer:Value USD
+
+2022-03-31 * "Provider" "Net Fee"
+  recur: "1 Year /Monthly"
+  Liabilities:CreditCard:0001    -50 USD
+  Expenses:Home:CommunicationFee
+    amortize: "1 Month /Weekly"
+
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -200000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly =80000"
+
+2022-04-01 * "Shop" "Laptop"
+  depreciate: "3 Year /Quarterly"
+  Liabilities:CreditCard:0001    -3000 USD
+  Assets:Computer
+
+2022-04-01 * "Tax Estimate"
+  split: "Year / Monthly"
+  Liabilities:Tax
+  Expenses:Tax:Income 4380 USD
+
+2022-04-02 * "Untouched"
+  Liabilities:CreditCard:0001    -10 USD
+  Expenses:Home:Rent
+"""
+
+PLUGINS_STR = """
+plugin "beancount_periodic.recur" "{config}"
+plugin "beancount_periodic.split" "{config}"
+plugin "beancount_periodic.amortize" "{config}"
+plugin "beancount_periodic.depreciate" "{config}"
+"""
+
+PERIODIC_STR = """
+plugin "beancount_periodic.periodic" "{config}"
+"""
+
+
+def load_formatted(plugins_str, config):
+    entries, errors, options_map = load_string(plugins_str.format(config=config) + JOURNAL_STR)
+    return [printer.format_entry(entry) for entry in entries], errors
+
+
+class PeriodicTest(unittest.TestCase):
+    def test_same_as_chained_plugins(self):
+        for config in ["", "{'generate_until':'2023-01-01'}", "{'generate_until':'2023-01-01','manifest':True}",
+                       "{'step_ids':True}"]:
+            chained_entries, chained_errors = load_formatted(PLUGINS_STR, config)
+            periodic_entries, periodic_errors = load_formatted(PERIODIC_STR, config)
+            self.assertEqual(len(chained_errors), 0)
+            self.assertEqual(len(periodic_errors), 0)
+            self.assertGreater(len(periodic_entries), 50)
+            self.assertEqual(periodic_entries, chained_entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import datetime
+import unittest
+from decimal import Decimal
+
+from beancount.loader import load_string
+
+from beancount_periodic.query import build_schedule_index
+
+JOURNAL_STR = """
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+1900-01-01 open Assets:Car:ModelX USD
+1900-01-01 open Expenses:Depreciation:Car:ModelX USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -10000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+2022-03-31 * "Tesla" "Model X"
+  Liabilities:CreditCard:0001    -150000 USD
+  Assets:Car:ModelX
+    depreciate: "5 Year /Yearly *sum"
+"""
+
+
+class QueryTest(unittest.TestCase):
+    def test_same_as_generated_entries(self):
+        entries, errors, options_map = load_string(JOURNAL_STR)
+        index, index_errors = build_schedule_index(entries, options_map)
+        self.assertEqual(len(index_errors), 0)
+        self.assertEqual(index.accounts(), [('Assets:Car:ModelX', 'USD'), ('Expenses:Home:Rent', 'USD')])
+
+        generated, errors, options_map = load_string('plugin "beancount_periodic.amortize"\n'
+                                                     'plugin "beancount_periodic.depreciate"\n' + JOURNAL_STR)
+        self.assertEqual(len(errors), 0)
+        booked = {'Expenses:Home:Rent': [], 'Assets:Car:ModelX': []}
+        for entry in generated:
+            if 'Amortized' in getattr(entry, 'narration', ''):
+                booked['Expenses:Home:Rent'].append((entry.date, entry.postings[1].units.number))
+            elif 'Depreciated' in getattr(entry, 'narration', ''):
+                booked['Assets:Car:ModelX'].append((entry.date, -entry.postings[1].units.number))
+
+        for account_name, steps in booked.items():
+            total = sum(number for date, number in steps)
+            for date in [datetime.date(2022, 1, 1), datetime.date(2022, 4, 1), datetime.date(2022, 8, 15),
+                         datetime.date(2024, 3, 31), datetime.date(2030, 1, 1)]:
+                expected = sum(number for step_date, number in steps if step_date <= date)
+                self.assertEqual(index.cumulative(account_name, 'USD', date), expected)
+                self.assertEqual(index.remaining(account_name, 'USD', date), total - expected)
+
+    def test_booked_between(self):
+        entries, errors, options_map = load_string(JOURNAL_STR)
+        index, index_errors = build_schedule_index(entries, options_map)
+        self.assertEqual(index.booked_between('Expenses:Home:Rent', 'USD', datetime.date(2022, 7, 1),
+                                              datetime.date(2022, 10, 1)), Decimal('2500'))
+        self.assertEqual(index.booked_between('Assets:Car:ModelX', 'USD', datetime.date(2023, 1, 1),
+                                              datetime.date(2024, 1, 1)), Decimal('40000'))
+        with self.assertRaises(KeyError):
+            index.cumulative('Expenses:Home:Rent', 'EUR', datetime.date(2023, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
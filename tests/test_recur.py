@@ -6,6 +6,8 @@ from beancount.core.data import Transaction
 from beancount.loader import load_string
 
 import tests.util
+from beancount_periodic.common.config import PluginConfig
+from beancount_periodic.recur import iter_recur
 
 
 def tx_recurring(date: datetime.date, narration: str) -> Transaction:
@@ -79,6 +81,87 @@ plugin "beancount_periodic.recur" "{'generate_until':'2022-11-30'}"
         same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
         self.assertTrue(same)
 
+    def test_collapse_before(self):
+        journal_str = """
+plugin "beancount_periodic.recur" "{'generate_until':'2022-07-31','collapse_before':'2022-06-01'}"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:CommunicationFee USD
+2022-03-31 * "Provider" "Net Fee"
+  recur: "1 Year /Monthly"
+  Liabilities:CreditCard:0001    -50 USD
+  Expenses:Home:CommunicationFee
+"""
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0)
+
+        expected_entries = [
+            tests.util.make_transaction(
+                date=datetime.date(2022, 5, 31),
+                payee='Provider',
+                narration='Net Fee Recurring(1-3/12)',
+                account_from='Liabilities:CreditCard:0001',
+                account_to='Expenses:Home:CommunicationFee',
+                amount='150',
+            ),
+            tx_recurring(datetime.date(2022, 6, 30), 'Net Fee Recurring(4/12)'),
+            tx_recurring(datetime.date(2022, 7, 31), 'Net Fee Recurring(5/12)'),
+        ]
+
+        same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
+        self.assertTrue(same)
+
+    def test_plugin_writing_meta(self):
+        # currency_accounts marks the entries it processed in their meta
+        journal_str = """
+plugin "beancount_periodic.recur"
+plugin "beancount.plugins.currency_accounts" "Equity:CurrencyAccounts"
+1900-01-01 open Assets:Cash:USD USD
+1900-01-01 open Assets:Cash:EUR EUR
+2022-01-01 * "Bank" "Exchange"
+  recur: "3 Month /Monthly"
+  Assets:Cash:USD    100 USD @ 0.9 EUR
+  Assets:Cash:EUR    -90 EUR
+"""
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0, errors)
+        recurring = [entry for entry in entries
+                     if isinstance(entry, Transaction) and entry.narration.startswith('Exchange Recurring')]
+        self.assertEqual(len(recurring), 3)
+        self.assertTrue(all(len(entry.postings) == 4 for entry in recurring))
+
+    def test_iter_recur(self):
+        journal_str = """
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:CommunicationFee USD
+2022-01-01 * "Provider" "Internet"
+  recur: "10 Year /Monthly"
+  Liabilities:CreditCard:0001    -50 USD
+  Expenses:Home:CommunicationFee
+2022-01-01 * "Provider" "Internet"
+  recur: "10 Eons /Monthly"
+  Liabilities:CreditCard:0001    -50 USD
+  Expenses:Home:CommunicationFee
+"""
+        entries, errors, options_map = load_string(journal_str)
+        source, bad_source = [entry for entry in entries if isinstance(entry, Transaction)]
+
+        steps = iter_recur(source)
+        self.assertEqual([next(steps).date for i in range(3)],
+                         [datetime.date(2022, 1, 1), datetime.date(2022, 2, 1), datetime.date(2022, 3, 1)])
+
+        plugin_config = PluginConfig(generate_until=datetime.date(2022, 6, 30),
+                                     collapse_before=datetime.date(2022, 3, 15))
+        self.assertEqual([(entry.date, entry.narration) for entry in iter_recur(source, plugin_config)], [
+            (datetime.date(2022, 3, 1), 'Internet Recurring(1-3/120)'),
+            (datetime.date(2022, 4, 1), 'Internet Recurring(4/120)'),
+            (datetime.date(2022, 5, 1), 'Internet Recurring(5/120)'),
+            (datetime.date(2022, 6, 1), 'Internet Recurring(6/120)'),
+        ])
+
+        errors = []
+        self.assertEqual(list(iter_recur(bad_source, errors=errors)), [])
+        self.assertEqual(len(errors), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
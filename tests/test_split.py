@@ -1,4 +1,5 @@
 import datetime
+import itertools
 import unittest
 
 from beancount.core.compare import compare_entries
@@ -6,6 +7,8 @@ from beancount.core.data import Transaction
 from beancount.loader import load_string
 
 import tests.util
+from beancount_periodic.common.config import PluginConfig
+from beancount_periodic.split import iter_split
 
 
 def tx_split(date: datetime.date, narration: str, amount: str) -> Transaction:
@@ -74,6 +77,47 @@ plugin "beancount_periodic.split" "{'generate_until':'2025-04-30'}"
         same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
         self.assertTrue(same)
 
+    def test_collapse_before(self):
+        journal_str = """
+plugin "beancount_periodic.split" "{'generate_until':'2025-04-30','collapse_before':'2025-03-15'}"
+1900-01-01 open Liabilities:Tax USD
+1900-01-01 open Expenses:Tax:Income USD
+2025-01-01 * "Tax Estimate"
+  split: "Year / Monthly"
+  Liabilities:Tax
+  Expenses:Tax:Income 4380 USD
+"""
+        entries, errors, options_map = load_string(journal_str)
+        self.assertEqual(len(errors), 0)
+
+        expected_entries = [
+            tx_split(datetime.date(2025, 3, 1), 'Tax Estimate Split(1-3/12)', '1080.000000000000000000000000'),
+            tx_split(datetime.date(2025, 4, 1), 'Tax Estimate Split(4/12)', '360.0000000000000000000000000'),
+        ]
+
+        same, missing1, missing2 = compare_entries(list(tests.util.get_transactions_cleaned(entries)), expected_entries)
+        self.assertTrue(same)
+
+    def test_iter_split(self):
+        journal_str = """
+1900-01-01 open Liabilities:Tax USD
+1900-01-01 open Expenses:Tax:Income USD
+2025-01-01 * "Tax Estimate"
+  split: "Year / Monthly"
+  Liabilities:Tax
+  Expenses:Tax:Income 4380 USD
+"""
+        entries, errors, options_map = load_string(journal_str)
+        source = next(entry for entry in entries if isinstance(entry, Transaction))
+
+        plugin_config = PluginConfig(collapse_before=datetime.date(2025, 3, 15))
+        steps = iter_split(source, plugin_config)
+        self.assertEqual([(entry.date, entry.narration) for entry in itertools.islice(steps, 2)], [
+            (datetime.date(2025, 3, 1), 'Tax Estimate Split(1-3/12)'),
+            (datetime.date(2025, 4, 1), 'Tax Estimate Split(4/12)'),
+        ])
+        self.assertEqual(len(list(steps)), 8)
+
 
 if __name__ == '__main__':
     unittest.main()
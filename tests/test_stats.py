@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from beancount.loader import load_string
+
+JOURNAL_STR = """
+plugin "beancount_periodic.amortize" "{'profile':'%s'}"
+1900-01-01 open Liabilities:CreditCard:0001 USD
+1900-01-01 open Expenses:Home:Rent USD
+1900-01-01 open Equity:Amortization:Home:Rent USD
+2022-03-31 * "Landlord" "2022-04 Rent"
+  Liabilities:CreditCard:0001    -12000 USD
+  Expenses:Home:Rent
+    amortize: "1 Year @2022-04-01 /Monthly"
+"""
+
+
+class StatsTest(unittest.TestCase):
+    def test_json(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'stats.json')
+            entries, errors, options_map = load_string(JOURNAL_STR % path)
+            self.assertEqual(len(errors), 0)
+            with open(path) as f:
+                lines = f.readlines()
+
+        self.assertEqual(len(lines), 1)
+        stats = json.loads(lines[0])
+        self.assertEqual(stats['plugin'], 'amortize')
+        self.assertEqual(stats['counters']['entries_scanned'], 4)
+        self.assertEqual(stats['counters']['steps_generated'], 12)
+        self.assertEqual(stats['counters']['entries_emitted'], 12)
+        for phase in ['total', 'select_posting_groups', 'build_steps', 'combine_postings', 'merge']:
+            self.assertIn(phase, stats['timings'])
+
+    def test_periodic(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'stats.json')
+            entries, errors, options_map = load_string(
+                JOURNAL_STR.replace('beancount_periodic.amortize', 'beancount_periodic.periodic') % path)
+            self.assertEqual(len(errors), 0)
+            with open(path) as f:
+                stats = json.loads(f.readline())
+
+        self.assertEqual(stats['plugin'], 'periodic')
+        self.assertEqual(stats['counters']['entries_scanned'], 4)
+        self.assertEqual(stats['counters']['entries_emitted'], 12)
+        # the stats of the plugins run by periodic
+        self.assertEqual(stats['counters']['amortize.steps_generated'], 12)
+        self.assertEqual(stats['counters']['recur.steps_generated'], 0)
+        for phase in ['total', 'amortize', 'amortize.build_steps', 'amortize.merge']:
+            self.assertIn(phase, stats['timings'])
+
+    def test_cprofile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            entries, errors, options_map = load_string(JOURNAL_STR % os.path.join(tmp_dir, 'periodic.prof'))
+            self.assertEqual(len(errors), 0)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'periodic.amortize.prof')))
+
+
+if __name__ == '__main__':
+    unittest.main()
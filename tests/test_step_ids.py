@@ -0,0 +1,66 @@
+import unittest
+
+from beancount.core import data
+from beancount.loader import load_string
+
+from beancount_periodic.common.identity import ID_META_KEY
+from tests.test_periodic import JOURNAL_STR
+from tests.test_periodic import PERIODIC_STR
+
+
+def load_ids(config, journal=JOURNAL_STR):
+    """
+    :return: {periodic_id: narration} of the generated transactions
+    """
+    entries, errors, options_map = load_string(PERIODIC_STR.format(config=config) + journal)
+    assert not errors, errors
+    ids = {}
+    for entry in entries:
+        if isinstance(entry, data.Transaction) and ID_META_KEY in entry.meta:
+            assert entry.meta[ID_META_KEY] not in ids, entry
+            ids[entry.meta[ID_META_KEY]] = entry.narration
+    return ids
+
+
+class StepIdsTest(unittest.TestCase):
+    def test_unique(self):
+        ids = load_ids("{'step_ids':True}")
+        entries, errors, options_map = load_string(PERIODIC_STR.format(config="{}") + JOURNAL_STR)
+        generated = [entry for entry in entries
+                     if isinstance(entry, data.Transaction) and entry.narration.endswith(')')]
+        self.assertEqual(len(ids), len(generated))
+        self.assertTrue(all(len(step_id) == 16 for step_id in ids))
+        self.assertEqual(load_ids("{}"), {})
+
+    def test_duplicated_sources(self):
+        ids = load_ids("{'step_ids':True}")
+        # the transactions of the journal a second time, identical sources are told apart by their order
+        duplicated_ids = load_ids("{'step_ids':True}", JOURNAL_STR + JOURNAL_STR[JOURNAL_STR.index('2022-03-31'):])
+        self.assertEqual(len(duplicated_ids), 2 * len(ids))
+        # the first occurrences keep their identifiers
+        self.assertLessEqual(set(ids), set(duplicated_ids))
+
+    def test_stable(self):
+        ids = load_ids("{'step_ids':True}")
+        # another entry before the sources moves them to other lines
+        moved_ids = load_ids("{'step_ids':True}", '\n2022-01-01 * "Other"\n  Liabilities:CreditCard:0001  -1 USD\n'
+                                                  '  Expenses:Home:Rent\n' + JOURNAL_STR)
+        self.assertEqual(moved_ids, ids)
+
+        # only the steps of the edited source change
+        edited_ids = load_ids("{'step_ids':True}", JOURNAL_STR.replace('-12000 USD', '-12600 USD'))
+        changed = {narration for step_id, narration in ids.items() if step_id not in edited_ids}
+        self.assertEqual({narration.split(' Amortized')[0] for narration in changed}, {'2022-04 Rent'})
+        self.assertEqual(len(changed), 12)
+
+    def test_collapsed(self):
+        ids = load_ids("{'step_ids':True}")
+        collapsed_ids = load_ids("{'step_ids':True,'collapse_before':'2023-01-01'}")
+        # the steps from 2023 on keep their identifiers
+        self.assertIn('2022-04 Rent Amortized(12/12)', [collapsed_ids[step_id] for step_id in collapsed_ids
+                                                         if step_id in ids])
+        self.assertIn('2022-04 Rent Amortized(1-9/12)', collapsed_ids.values())
+
+
+if __name__ == '__main__':
+    unittest.main()